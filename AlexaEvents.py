@@ -0,0 +1,119 @@
+"""
+Synthetic Alexa request events for exercising the Game Helper skill locally
+
+Builds events in the same JSON format the Alexa service sends to lambda_handler, using the intents
+listed in _IntentSchema.txt, so local tools can replay realistic requests without the live service.
+"""
+import json
+import os
+import re
+import uuid
+
+from GameHelperMain import APPLICATION_ID
+
+# location of the intent schema that is uploaded to the Alexa platform
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_IntentSchema.txt")
+
+# location of the sample utterances that are uploaded to the Alexa platform
+UTTERANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_SampleUtterances.txt")
+
+# a typical value for each slot, used when an event is built without explicit slot values
+# (slots not listed here are sent as "?", which is what Alexa passes if there is no input)
+DEFAULT_SLOT_VALUES = {
+    "numDice": "3",
+    "numSides": "6",
+    "adding": "plus",
+    "modifier": "2",
+    "target": "12",
+    "expression": "4 die 6 drop lowest",
+    "numRolls": "6",
+    "partyOneType": "attackers",
+    "numPartyOne": "10",
+    "partyTwoType": "defenders",
+    "numPartyTwo": "7",
+    "numAttackers": "20",
+    "defendersOne": "3",
+    "defendersTwo": "5",
+    "defendersThree": "2",
+    "ruleSet": "capital",
+    "numRounds": "3",
+    "numArmies": "5",
+    "territoryWorth": "10",
+    "armyType": "attackers",
+    "numSuccesses": "3",
+    "opposingDice": "5",
+    "gameSystem": "world of darkness",
+    "numAttackUnits": "6",
+    "attackUnitType": "tanks",
+    "numAttackUnitsTwo": "2",
+    "attackUnitTypeTwo": "artillery",
+    "numDefendUnits": "8",
+    "defendUnitType": "infantry"
+}
+
+def load_intent_slots(path=SCHEMA_PATH):
+    """
+    Reads the intent schema and returns a list of (intent name, [slot names]) pairs
+    """
+    with open(path) as schema_file:
+        schema = json.load(schema_file)
+    return [(intent["intent"], [slot["name"] for slot in intent.get("slots", [])])
+            for intent in schema["intents"]]
+
+def load_sample_utterances(path=UTTERANCES_PATH):
+    """
+    Reads the sample utterances and returns a list of (intent name, [slot names]) pairs, one per
+    utterance, so intents with more ways of being said show up more often
+    """
+    utterances = []
+    with open(path) as utterances_file:
+        for line in utterances_file:
+            if not line.strip():
+                continue
+            intent_name, _, phrase = line.strip().partition(" ")
+            utterances.append((intent_name, re.findall(r"{(\w+)}", phrase)))
+    return utterances
+
+def build_event(request_type, intent_name=None, slots=None, session_id=None, new_session=True,
+                session_attributes=None):
+    """
+    Returns an Alexa request event of the given type ("LaunchRequest", "IntentRequest" or
+    "SessionEndedRequest"); slots is a dictionary of slot name -> spoken value
+    """
+    request = {
+        "type": request_type,
+        "requestId": "amzn1.echo-api.request." + str(uuid.uuid4()),
+        "locale": "en-US"
+    }
+    if request_type == "IntentRequest":
+        request["intent"] = {
+            "name": intent_name,
+            "slots": dict((name, {"name": name, "value": value})
+                          for name, value in (slots or {}).items())
+        }
+    elif request_type == "SessionEndedRequest":
+        request["reason"] = "USER_INITIATED"
+
+    return {
+        "session": {
+            "new": new_session,
+            "sessionId": session_id or "amzn1.echo-api.session." + str(uuid.uuid4()),
+            "application": {"applicationId": APPLICATION_ID},
+            "attributes": session_attributes or {},
+            "user": {"userId": "amzn1.ask.account.LOCALTEST"}
+        },
+        "request": request,
+        "version": "1.0"
+    }
+
+def build_schema_events(path=SCHEMA_PATH):
+    """
+    Returns a list of (label, event) pairs covering a launch, every intent in the schema (filled
+    with DEFAULT_SLOT_VALUES) and a session end
+    """
+    events = [("LaunchRequest", build_event("LaunchRequest"))]
+    for intent_name, slot_names in load_intent_slots(path):
+        slots = dict((name, DEFAULT_SLOT_VALUES.get(name, "?")) for name in slot_names)
+        events.append((intent_name, build_event("IntentRequest", intent_name, slots)))
+    events.append(("SessionEndedRequest", build_event("SessionEndedRequest")))
+    return events
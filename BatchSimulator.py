@@ -0,0 +1,86 @@
+"""
+Batched Monte Carlo battle simulator for the Risk Simulating Aspect of Game Helper
+
+Runs many independent battles at once with NumPy arrays: every round rolls, sorts and compares the
+dice of all unfinished battles in a handful of vector operations, so large numbers of simulations
+can be used for empirical distributions and for cross-checking the exact engine in BattleOdds.
+Both functions take an optional BattleRules variant, like the exact engine.
+"""
+import numpy
+
+# importing the rule variants a battle can be fought under
+from BattleRules import CLASSIC_RULES
+
+def simulate_battles(num_attackers, num_defenders, num_battles, rng=None, rules=CLASSIC_RULES):
+    """
+    Simulates num_battles independent battles of num_attackers vs num_defenders
+    (either may also be an array giving the starting armies of each battle, so battles of many
+    different sizes can be fought in the same batch)
+    returns three NumPy arrays holding the remaining attackers, remaining defenders and number of
+    rounds of each battle (the same values simulate_battle returns for a single battle)
+    """
+    if rng is None:
+        rng = numpy.random.default_rng()
+
+    attackers = numpy.full(num_battles, num_attackers, dtype=numpy.int64)
+    defenders = numpy.full(num_battles, num_defenders, dtype=numpy.int64)
+    rounds = numpy.zeros(num_battles, dtype=numpy.int64)
+
+    # indices of the battles that are still being fought
+    active = numpy.flatnonzero((attackers > 1) & (defenders > 0))
+    fight_columns = numpy.arange(min(rules.attack_dice, rules.defend_dice))
+    while active.size > 0:
+        cur_attackers, cur_defenders = attackers[active], defenders[active]
+        attack_dice = numpy.minimum(cur_attackers - 1, rules.attack_dice)
+        defend_dice = numpy.minimum(cur_defenders, rules.defend_dice)
+
+        # rolling every die for every battle, then zeroing the dice a side doesn't get to roll
+        # so that they sort to the bottom and never take part in a fight
+        attacker_rolls = rng.integers(1, rules.attack_sides + 1, size=(active.size, rules.attack_dice),
+                                      dtype=numpy.int16)
+        defender_rolls = rng.integers(1, rules.defend_sides + 1, size=(active.size, rules.defend_dice),
+                                      dtype=numpy.int16)
+        attacker_rolls *= numpy.arange(rules.attack_dice) < attack_dice[:, None]
+        defender_rolls *= numpy.arange(rules.defend_dice) < defend_dice[:, None]
+
+        # sorting highest first so the top dice are compared against each other
+        attacker_rolls = -numpy.sort(-attacker_rolls, axis=1)
+        defender_rolls = -numpy.sort(-defender_rolls, axis=1)
+
+        # wins are measured from the attackers perspective (see BattleRules.attacker_loses)
+        num_fights = numpy.minimum(attack_dice, defend_dice)
+        fights = fight_columns < num_fights[:, None]
+        attacker_top = attacker_rolls[:, :fight_columns.size]
+        defender_top = defender_rolls[:, :fight_columns.size] + rules.defender_bonus
+        if rules.ties_to_defender:
+            attacker_wins = attacker_top > defender_top
+        else:
+            attacker_wins = attacker_top >= defender_top
+        wins = (attacker_wins & fights).sum(axis=1)
+
+        attackers[active] = cur_attackers - (num_fights - wins)
+        defenders[active] = cur_defenders - wins
+        rounds[active] += 1
+
+        # dropping the battles that just finished
+        still_fighting = (attackers[active] > 1) & (defenders[active] > 0)
+        active = active[still_fighting]
+
+    return attackers, defenders, rounds
+
+def summarize_battles(num_attackers, num_defenders, num_battles, rng=None, rules=CLASSIC_RULES):
+    """
+    Runs simulate_battles and returns a dictionary in the same format as
+    BattleOdds.calculate_outcome_distribution, built from the empirical frequencies
+    """
+    attackers, defenders, rounds = simulate_battles(num_attackers, num_defenders, num_battles, rng, rules)
+    attacker_survivors = numpy.bincount(attackers, minlength=num_attackers + 1) / float(num_battles)
+    defender_survivors = numpy.bincount(defenders, minlength=num_defenders + 1) / float(num_battles)
+    return {
+        "win_probability": float(defender_survivors[0]),
+        "attacker_survivors": attacker_survivors.tolist(),
+        "defender_survivors": defender_survivors.tolist(),
+        "expected_attackers": float(attackers.mean()),
+        "expected_defenders": float(defenders.mean()),
+        "expected_rounds": float(rounds.mean())
+    }
@@ -0,0 +1,131 @@
+"""
+Narration for the Risk Simulating Aspect of Game Helper
+
+Turns the rounds of a simulated battle (as RiskLogic.battle_events yields them) into a few spoken
+highlights rather than a play by play: the longest run of rounds each side won outright, the
+moment the lead changed hands, and any stretch that was skipped through in bulk. The narrator
+only keeps the best highlight of each kind as the rounds stream past, so its memory doesn't grow
+with the length of the battle.
+"""
+# a side has to win this many rounds in a row for it to be worth mentioning
+MIN_STREAK_ROUNDS = 3
+
+# most highlights read out for one battle
+MAX_NARRATION_BEATS = 3
+
+ATTACKER_SIDE = "attackers"
+DEFENDER_SIDE = "defenders"
+
+class BattleNarrator(object):
+    """
+    Follows a battle one step at a time (add) and describes its highlights (describe)
+    """
+    def __init__(self, num_attackers, num_defenders):
+        self.num_attackers = num_attackers
+        self.num_defenders = num_defenders
+        self.num_rounds = 0
+        self.leader = self.find_leader(num_attackers, num_defenders)
+        # the run of rounds in progress, as (side, length)
+        self.streak_side, self.streak_length = None, 0
+        # the best highlight of each kind so far, as (round, spoken text) plus anything needed to rank it
+        self.best_streaks = {}
+        self.lead_changes = 0
+        self.last_lead_change = None
+        self.bulk_rounds = None
+
+    def find_leader(self, num_attackers, num_defenders):
+        """
+        Returns the side with more armies able to fight (the attackers' left behind army can't),
+        or None if they are level
+        """
+        if num_attackers - 1 > num_defenders:
+            return ATTACKER_SIDE
+        if num_defenders > num_attackers - 1:
+            return DEFENDER_SIDE
+        return None
+
+    def add(self, num_rounds, num_attackers, num_defenders):
+        """
+        Takes the next step of the battle, in the (rounds, attackers, defenders) form battle_events yields
+        """
+        attacker_losses = self.num_attackers - num_attackers
+        defender_losses = self.num_defenders - num_defenders
+        rounds_taken = num_rounds - self.num_rounds
+        self.num_rounds, self.num_attackers, self.num_defenders = num_rounds, num_attackers, num_defenders
+
+        if rounds_taken > 1:
+            # many full strength rounds skipped through at once can't be told apart, so they are
+            # summed up as one stretch of the battle
+            self.bulk_rounds = (num_rounds, "After " + count_rounds(num_rounds) + " of trading blows, it was " +
+                                str(num_attackers) + " attackers against " + str(num_defenders) + " defenders.")
+            self.streak_side, self.streak_length = None, 0
+        else:
+            self.add_round(attacker_losses, defender_losses)
+
+        leader = self.find_leader(num_attackers, num_defenders)
+        if leader is not None and leader != self.leader:
+            # a skipped stretch doesn't say which round the lead changed in (and its own highlight
+            # already gives the armies at the end of it), so only single rounds are dated
+            if self.leader is not None and rounds_taken <= 1:
+                self.lead_changes += 1
+                self.last_lead_change = (num_rounds, "The " + leader + " took the lead in round " + str(num_rounds) + ".")
+            self.leader = leader
+
+    def add_round(self, attacker_losses, defender_losses):
+        """
+        Tracks runs of rounds won outright by one side
+        """
+        if attacker_losses > 0 and defender_losses > 0:
+            self.streak_side, self.streak_length = None, 0
+            return
+        side = ATTACKER_SIDE if defender_losses > 0 else DEFENDER_SIDE
+        if side == self.streak_side:
+            self.streak_length += 1
+        else:
+            self.streak_side, self.streak_length = side, 1
+
+        best = self.best_streaks.get(side)
+        if self.streak_length >= MIN_STREAK_ROUNDS and (best is None or self.streak_length > best[2]):
+            self.best_streaks[side] = (self.num_rounds, self.describe_streak(side), self.streak_length)
+
+    def describe_streak(self, side):
+        """
+        Returns a spoken description of the streak that just grew (the summary already says who
+        won, so a streak that ends the battle isn't described by the armies it left)
+        """
+        if side == ATTACKER_SIDE:
+            text = "The attackers won " + str(self.streak_length) + " rounds in a row"
+            if self.num_defenders == 0:
+                return text + " to finish off the defenders."
+            return text + ", bringing the defenders down to " + str(self.num_defenders) + "."
+        text = "The defenders held for " + str(self.streak_length) + " rounds in a row"
+        if self.num_attackers <= 1:
+            return text + " to stop the attack."
+        return text + ", cutting the attackers down to " + str(self.num_attackers) + "."
+
+    def describe(self):
+        """
+        Returns the highlights of the battle so far as one spoken string, in the order they happened
+        (empty if nothing stood out)
+        """
+        beats = []
+        if self.bulk_rounds is not None:
+            beats.append(self.bulk_rounds)
+        if self.last_lead_change is not None:
+            num_rounds, text = self.last_lead_change
+            if self.lead_changes > 1:
+                text = "The lead changed hands " + str(self.lead_changes) + " times. " + text
+            beats.append((num_rounds, text))
+        # the longer streaks are kept first if there are too many highlights
+        streaks = sorted(self.best_streaks.values(), key=lambda streak: -streak[2])
+        beats.extend((num_rounds, text) for num_rounds, text, _ in streaks)
+        beats = sorted(beats[:MAX_NARRATION_BEATS])
+        return " ".join(text for _, text in beats)
+
+def count_rounds(num_rounds, qualifier=""):
+    """
+    Returns a number of rounds as it is read out ("1 round", "5 rounds", or with a qualifier
+    such as "more", "5 more rounds")
+    """
+    words = [str(num_rounds), qualifier, "round" if num_rounds == 1 else "rounds"]
+    return " ".join(word for word in words if word)
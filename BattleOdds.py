@@ -0,0 +1,288 @@
+"""
+Exact battle probability engine for the Risk Simulating Aspect of Game Helper
+
+A battle is treated as an absorbing Markov chain over (attackers, defenders) states. Each round
+moves the chain to a state with fewer total armies, so every probability can be filled in with a
+single dynamic programming pass over the smaller states.
+Every function takes an optional BattleRules variant (the classic rules by default), and each
+variant gets its own cached round outcomes and tables.
+"""
+# importing product to enumerate every possible set of dice faces in a round
+from itertools import product
+
+# importing helpers to draw a round outcome straight from its cumulative distribution
+from bisect import bisect_right
+from RandomStreams import get_stream
+
+# importing the rule variants a battle can be fought under
+from BattleRules import CLASSIC_RULES
+
+# number of sides on every die used in a classic battle
+DIE_SIDES = CLASSIC_RULES.attack_sides
+
+# the most dice each side is allowed to roll in a single classic round
+MAX_ATTACK_DICE = CLASSIC_RULES.attack_dice
+MAX_DEFEND_DICE = CLASSIC_RULES.defend_dice
+
+# largest army (on either side) that the exact engine will answer for
+# (keeps a single request from building a table that doesn't fit in a Lambda container, and is
+# the size BattleTable saves by default; the help text in GameHelperMain quotes it)
+MAX_EXACT_ARMIES = 1000
+
+# --------------- Per-round transition probabilities ---------------
+
+# cache of round outcomes keyed by (rules key, attack dice, defend dice), filled on first use
+ROUND_OUTCOMES = {}
+
+def get_dice_counts(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Returns the number of dice the attackers and defenders roll in a round
+    note: one attacker must always be left behind, so it never rolls
+    """
+    return rules.get_dice_counts(num_attackers, num_defenders)
+
+def get_round_outcomes(num_attack_dice, num_defend_dice, rules=CLASSIC_RULES):
+    """
+    Returns a list of (attacker_losses, defender_losses, probability) tuples describing every
+    possible result of a single round where each side rolls the given number of dice
+    """
+    key = (rules.key, num_attack_dice, num_defend_dice)
+    if key not in ROUND_OUTCOMES:
+        num_fights = min(num_attack_dice, num_defend_dice)
+        # counting how many of the equally likely rolls lead to each number of attacker losses
+        loss_counts = [0] * (num_fights + 1)
+        for attack_faces in product(range(1, rules.attack_sides + 1), repeat=num_attack_dice):
+            attacker_rolls = sorted(attack_faces, reverse=True)
+            for defend_faces in product(range(1, rules.defend_sides + 1), repeat=num_defend_dice):
+                defender_rolls = sorted(defend_faces, reverse=True)
+                attacker_losses = 0
+                for i in range(num_fights):
+                    if rules.attacker_loses(attacker_rolls[i], defender_rolls[i]):
+                        attacker_losses += 1
+                loss_counts[attacker_losses] += 1
+
+        total_rolls = float(rules.attack_sides ** num_attack_dice * rules.defend_sides ** num_defend_dice)
+        ROUND_OUTCOMES[key] = [(losses, num_fights - losses, count / total_rolls)
+                               for losses, count in enumerate(loss_counts) if count > 0]
+    return ROUND_OUTCOMES[key]
+
+def get_state_outcomes(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Returns the round outcomes for a battle currently at (num_attackers, num_defenders)
+    """
+    num_attack_dice, num_defend_dice = rules.get_dice_counts(num_attackers, num_defenders)
+    return get_round_outcomes(num_attack_dice, num_defend_dice, rules)
+
+# cache of cumulative round probabilities keyed by (rules key, attack dice, defend dice)
+ROUND_CUMULATIVE = {}
+
+def sample_round_losses(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Draws the result of a single round at (num_attackers, num_defenders) with one random number
+    instead of rolling and comparing individual dice
+    returns the number of attackers and defenders lost
+    """
+    num_attack_dice, num_defend_dice = rules.get_dice_counts(num_attackers, num_defenders)
+    key = (rules.key, num_attack_dice, num_defend_dice)
+    if key not in ROUND_CUMULATIVE:
+        outcomes = get_round_outcomes(num_attack_dice, num_defend_dice, rules)
+        cumulative, total = [], 0.0
+        for _, _, prob in outcomes:
+            total += prob
+            cumulative.append(total)
+        ROUND_CUMULATIVE[key] = (cumulative, [(att, dfn) for att, dfn, _ in outcomes])
+    cumulative, losses = ROUND_CUMULATIVE[key]
+    # clamping in case floating point error leaves the last cumulative value just under 1
+    return losses[min(bisect_right(cumulative, get_stream().random()), len(losses) - 1)]
+
+# --------------- Win probability and expected survivor tables ---------------
+
+# each table is indexed [a][d] by the number of attackers (including the one left behind) and
+# defenders, and is grown in place as larger battles are requested
+# WIN_TABLE holds the probability the attackers take the territory
+WIN_TABLE = [[1.0]]
+# ATTACKER_TABLE / DEFENDER_TABLE hold the expected number of armies left on each side
+ATTACKER_TABLE = [[0.0]]
+DEFENDER_TABLE = [[0.0]]
+
+# the (win, attacker, defender) tables of every rule variant used so far, keyed by rules key
+RULE_TABLES = {CLASSIC_RULES.key: (WIN_TABLE, ATTACKER_TABLE, DEFENDER_TABLE)}
+
+def get_rule_tables(rules):
+    """
+    Returns the (win, attacker, defender) tables for a rule variant, starting them if needed
+    """
+    if rules.key not in RULE_TABLES:
+        RULE_TABLES[rules.key] = ([[1.0]], [[0.0]], [[0.0]])
+    return RULE_TABLES[rules.key]
+
+# tables of the expected number of rounds a battle lasts, keyed by rules key
+# (only bulk sweeps need these, so they are kept apart from the tables every request uses)
+ROUND_TABLES = {}
+
+def calculate_win_probability(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Returns the exact probability that the attackers eliminate every defender before being
+    reduced to the one army that must be left behind
+    """
+    if num_defenders <= 0:
+        return 1.0
+    if num_attackers <= 1:
+        return 0.0
+    win_table = get_rule_tables(rules)[0]
+    extend_table(win_table, num_attackers, num_defenders, win_end_value, rules)
+    return win_table[num_attackers][num_defenders]
+
+def calculate_expected_survivors(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Returns the expected number of attackers and defenders left when the battle is over
+    """
+    if num_defenders <= 0 or num_attackers <= 1:
+        return float(num_attackers), float(num_defenders)
+    _, attacker_table, defender_table = get_rule_tables(rules)
+    extend_table(attacker_table, num_attackers, num_defenders, attacker_end_value, rules)
+    extend_table(defender_table, num_attackers, num_defenders, defender_end_value, rules)
+    return attacker_table[num_attackers][num_defenders], defender_table[num_attackers][num_defenders]
+
+def calculate_expected_rounds(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Returns the expected number of rounds (dice rolls) the battle lasts
+    """
+    if num_defenders <= 0 or num_attackers <= 1:
+        return 0.0
+    if rules.key not in ROUND_TABLES:
+        ROUND_TABLES[rules.key] = [[0.0]]
+    rounds_table = ROUND_TABLES[rules.key]
+    # every round fought adds one to the rounds left in the state it leads to
+    extend_table(rounds_table, num_attackers, num_defenders, rounds_end_value, rules, 1.0)
+    return rounds_table[num_attackers][num_defenders]
+
+# values of each table once a battle is over (no defenders, or only the left behind attacker)
+def win_end_value(num_attackers, num_defenders):
+    return 1.0 if num_defenders == 0 else 0.0
+
+def attacker_end_value(num_attackers, num_defenders):
+    return float(num_attackers)
+
+def defender_end_value(num_attackers, num_defenders):
+    return float(num_defenders)
+
+def rounds_end_value(num_attackers, num_defenders):
+    return 0.0
+
+def extend_table(table, max_attackers, max_defenders, end_value, rules=CLASSIC_RULES, round_value=0.0):
+    """
+    Grows table so that it covers every state up to (max_attackers, max_defenders)
+    Finished battles take end_value(a, d), and every other state is round_value plus the average
+    of the states a single round can lead to. Rows are filled in increasing order of attackers, and each row in
+    increasing order of defenders, so every state a round can lead to has already been computed
+    """
+    old_attackers = len(table) - 1
+    old_defenders = len(table[0]) - 1
+    max_attackers = max(max_attackers, old_attackers)
+    max_defenders = max(max_defenders, old_defenders)
+    if max_attackers == old_attackers and max_defenders == old_defenders:
+        return
+
+    for num_attackers in range(max_attackers + 1):
+        if num_attackers > old_attackers:
+            table.append([end_value(num_attackers, 0)])
+        row = table[num_attackers]
+        for num_defenders in range(len(row), max_defenders + 1):
+            if num_attackers <= 1:
+                row.append(end_value(num_attackers, num_defenders))
+                continue
+            value = round_value
+            for attacker_losses, defender_losses, round_prob in \
+                    get_state_outcomes(num_attackers, num_defenders, rules):
+                value += round_prob * \
+                    table[num_attackers - attacker_losses][num_defenders - defender_losses]
+            row.append(value)
+
+# --------------- Full outcome distribution ---------------
+
+def calculate_outcome_distribution(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Pushes the probability of the starting state through every reachable state in one pass and
+    returns a dictionary describing how the battle ends:
+        win_probability - chance the attackers take the territory
+        attacker_survivors - list where index n holds the chance n attackers remain at the end
+        defender_survivors - list where index n holds the chance n defenders remain at the end
+        expected_attackers / expected_defenders - average number of armies left on each side
+        expected_rounds - average number of rounds (dice rolls) the battle lasts
+    """
+    # NumPy is imported here so that requests which never need a full distribution don't pay for it
+    import numpy
+
+    # mass[a, d] is the probability that the battle ever reaches the state (a, d)
+    mass = numpy.zeros((num_attackers + 1, num_defenders + 1))
+    mass[num_attackers, num_defenders] = 1.0
+    expected_rounds = 0.0
+
+    # every round removes at least one army, so every state with a + d armies in total has all of
+    # its mass once the states with more armies have been pushed on, and each of those
+    # anti-diagonals is pushed on in one vectorized step (the unfinished states have at least two
+    # attackers and one defender)
+    for total in range(num_attackers + num_defenders, 2, -1):
+        attackers = numpy.arange(max(2, total - num_defenders), min(num_attackers, total - 1) + 1)
+        if len(attackers) == 0:
+            continue
+        defenders = total - attackers
+        state_probs = mass[attackers, defenders]
+        # each visit to an unfinished state is exactly one round of the battle
+        expected_rounds += float(state_probs.sum())
+
+        # the states of a diagonal only differ in how many dice each side rolls
+        attack_dice = numpy.minimum(attackers - 1, rules.attack_dice)
+        defend_dice = numpy.minimum(defenders, rules.defend_dice)
+        for num_attack_dice in range(1, rules.attack_dice + 1):
+            for num_defend_dice in range(1, rules.defend_dice + 1):
+                rolling = (attack_dice == num_attack_dice) & (defend_dice == num_defend_dice)
+                if not rolling.any():
+                    continue
+                from_attackers, from_defenders = attackers[rolling], defenders[rolling]
+                from_probs = state_probs[rolling]
+                for attacker_losses, defender_losses, round_prob in \
+                        get_round_outcomes(num_attack_dice, num_defend_dice, rules):
+                    # the states a single outcome leads to are all different, so plain indexing adds safely
+                    mass[from_attackers - attacker_losses, from_defenders - defender_losses] += \
+                        from_probs * round_prob
+
+    # the battle ends either with no defenders left, or with only the left behind attacker
+    attacker_survivors = [0.0] * (num_attackers + 1)
+    defender_survivors = [0.0] * (num_defenders + 1)
+    if num_defenders == 0 or num_attackers <= 1:
+        attacker_survivors[num_attackers] = 1.0
+        defender_survivors[num_defenders] = 1.0
+    else:
+        attacker_survivors[2:] = mass[2:, 0].tolist()
+        defender_survivors[0] = sum(attacker_survivors)
+        defender_survivors[1:] = mass[1, 1:].tolist()
+        attacker_survivors[1] = sum(defender_survivors[1:])
+
+    return {
+        "win_probability": defender_survivors[0],
+        "attacker_survivors": attacker_survivors,
+        "defender_survivors": defender_survivors,
+        "expected_attackers": sum(n * p for n, p in enumerate(attacker_survivors)),
+        "expected_defenders": sum(n * p for n, p in enumerate(defender_survivors)),
+        "expected_rounds": expected_rounds
+    }
+
+def find_survivor_percentile(survivors, percentile, minimum=0):
+    """
+    Given a survivor list from calculate_outcome_distribution, returns the smallest number of
+    armies n (no smaller than minimum) such that at least percentile (0-1) of the outcomes with
+    minimum or more survivors leave n or fewer armies
+    returns -1 if no outcome has at least minimum survivors
+    """
+    total = sum(survivors[minimum:])
+    if total <= 0.0:
+        return -1
+    cumulative = 0.0
+    for num_armies in range(minimum, len(survivors)):
+        cumulative += survivors[num_armies]
+        # allowing for a little floating point error when summing the tail
+        if cumulative >= percentile * total - 1e-12:
+            return num_armies
+    return len(survivors) - 1
@@ -0,0 +1,95 @@
+"""
+Rule variants for the Risk Simulating Aspect of Game Helper
+
+A BattleRules object describes how a single round of a battle is fought (how many dice each side
+may roll, how many sides those dice have, who wins ties and any bonus the defender gets). Both
+the exact engine in BattleOdds and simulate_battle in RiskLogic take one, and every table built
+from a rule set is cached under its key, so house rules only cost a computation the first time.
+note: one attacker is always left behind in the attacking territory, under every variant
+"""
+# importing the per-request random stream every die is drawn from
+from RandomStreams import get_stream
+
+class BattleRules(object):
+    """
+    The rules of a single battle round
+        attack_dice / defend_dice - most dice each side may roll in a round
+        attack_sides / defend_sides - number of sides on each side's dice
+        ties_to_defender - whether the defender wins a comparison of equal dice
+        defender_bonus - added to every die the defender rolls (capitals, fortresses, ...)
+    """
+    def __init__(self, name, attack_dice=3, defend_dice=2, attack_sides=6, defend_sides=6,
+                 ties_to_defender=True, defender_bonus=0):
+        self.name = name
+        self.attack_dice = attack_dice
+        self.defend_dice = defend_dice
+        self.attack_sides = attack_sides
+        self.defend_sides = defend_sides
+        self.ties_to_defender = ties_to_defender
+        self.defender_bonus = defender_bonus
+        # everything that changes the odds (the name doesn't), used to key cached tables
+        self.key = (attack_dice, defend_dice, attack_sides, defend_sides, ties_to_defender, defender_bonus)
+
+    def __eq__(self, other):
+        return isinstance(other, BattleRules) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "BattleRules(" + repr(self.name) + ")"
+
+    def get_dice_counts(self, num_attackers, num_defenders):
+        """
+        Returns the number of dice the attackers and defenders roll in a round
+        """
+        return min(num_attackers - 1, self.attack_dice), min(num_defenders, self.defend_dice)
+
+    def attacker_loses(self, attacker_roll, defender_roll):
+        """
+        Returns whether the attacker loses the comparison of a pair of (sorted) dice
+        """
+        defender_roll += self.defender_bonus
+        if self.ties_to_defender:
+            return attacker_roll <= defender_roll
+        return attacker_roll < defender_roll
+
+    def roll_attack(self, num_rolls):
+        """
+        Returns the attacker's dice for a round, highest first
+        """
+        return sorted(get_stream().roll_many(num_rolls, self.attack_sides), reverse=True)
+
+    def roll_defense(self, num_rolls):
+        """
+        Returns the defender's dice for a round (before any bonus), highest first
+        """
+        return sorted(get_stream().roll_many(num_rolls, self.defend_sides), reverse=True)
+
+# the rules printed in the box
+CLASSIC_RULES = BattleRules("classic")
+
+# common house rules and variants, by the name the user asks for them with
+RULE_VARIANTS = {
+    "classic": CLASSIC_RULES,
+    # defending a capital or fortress adds one to each defending die
+    "capital": BattleRules("capital", defender_bonus=1),
+    # ties go to the attacker instead of the defender
+    "attacker ties": BattleRules("attacker ties", ties_to_defender=False),
+    # the defender may roll a third die
+    "three defenders": BattleRules("three defenders", defend_dice=3),
+    # the defender rolls eight sided dice (as with a fortified territory in some editions)
+    "eight sided defense": BattleRules("eight sided defense", defend_sides=8)
+}
+
+def find_rules(name):
+    """
+    Returns the rule variant called name (ignoring case and surrounding whitespace)
+    returns None if there is no variant by that name
+    """
+    if name is None:
+        return None
+    return RULE_VARIANTS.get(" ".join(name.lower().split()))
@@ -0,0 +1,381 @@
+"""
+Bulk probability sweeps for the Risk Simulating Aspect of Game Helper
+
+Computes the win probability, expected survivors and expected number of rounds of every battle in
+a range of attackers and defenders, under one or more rule variants, for building strategy charts
+and lookup tables offline:
+    python BattleSweep.py --attackers 2:300 --defenders 1:300 --rules classic capital --output grid.csv
+The grid is split into square tiles that are handed out to a process pool. Battles up to
+max_exact armies on each side are answered by the exact engine, whose tables live in each worker
+and only grow (tiles are queued smallest first, one rule variant at a time, so a worker extends
+its tables rather than rebuilding them), and larger battles are estimated with BatchSimulator.
+Finished tiles are written to a .csv or .npy file as they come in, and listed in a progress file
+next to it so that an interrupted sweep can pick up where it left off with --resume.
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# importing the exact engine and its per-variant tables (workers drop the tables they are done with)
+from BattleOdds import calculate_win_probability, calculate_expected_survivors, \
+    calculate_expected_rounds, RULE_TABLES, ROUND_TABLES, MAX_EXACT_ARMIES
+
+# importing the rule variants a sweep can cover
+from BattleRules import CLASSIC_RULES, RULE_VARIANTS, find_rules
+
+# importing the seed source, so a sweep without a seed still records the one it used
+from RandomStreams import new_seed
+
+# default number of attackers and defenders along each side of a tile
+DEFAULT_TILE_SIZE = 50
+
+# default number of battles simulated for each battle too large for the exact engine
+DEFAULT_SAMPLES = 10000
+
+# most simulated battles held in memory at once (each tile's simulated battles are fought together)
+MAX_BATCH_BATTLES = 1000000
+
+# how each row was computed
+EXACT_METHOD = "exact"
+MONTE_CARLO_METHOD = "monte carlo"
+
+# the columns of a .csv sweep
+SWEEP_COLUMNS = ("rules", "attackers", "defenders", "win_probability", "expected_attackers",
+                 "expected_defenders", "expected_rounds", "method")
+
+# positions of each statistic along the second axis of a .npy sweep, which is shaped
+# (rule variants, statistics, attackers, defenders) and holds NaN for battles not yet computed
+WIN_INDEX = 0
+ATTACKER_INDEX = 1
+DEFENDER_INDEX = 2
+ROUNDS_INDEX = 3
+NUM_STATS = 4
+
+# --------------- Planning and computing tiles ---------------
+
+def plan_tiles(attacker_range, defender_range, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Splits the (first, last) attacker and defender ranges into tiles of at most tile_size on each
+    side, returned as (first attackers, last attackers, first defenders, last defenders) tuples
+    Tiles are ordered by their far corner, so the exact tables only ever grow
+    """
+    tiles = []
+    for first_attackers in range(attacker_range[0], attacker_range[1] + 1, tile_size):
+        last_attackers = min(first_attackers + tile_size - 1, attacker_range[1])
+        for first_defenders in range(defender_range[0], defender_range[1] + 1, tile_size):
+            last_defenders = min(first_defenders + tile_size - 1, defender_range[1])
+            tiles.append((first_attackers, last_attackers, first_defenders, last_defenders))
+    tiles.sort(key=lambda tile: (max(tile[1], tile[3]), tile[1], tile[3]))
+    return tiles
+
+def compute_tile(rules_name, tile, samples=DEFAULT_SAMPLES, seed=0, max_exact=MAX_EXACT_ARMIES):
+    """
+    Computes every battle in tile under the named rule variant (run inside a pool worker)
+    returns (rules_name, tile, rows), where each row is (attackers, defenders, win probability,
+    expected attackers, expected defenders, expected rounds, method)
+    """
+    rules = find_rules(rules_name)
+    release_other_tables(rules)
+    first_attackers, last_attackers, first_defenders, last_defenders = tile
+
+    # filling the tables up to the largest exact battle in the tile covers the rest of it too
+    exact_attackers = min(last_attackers, max_exact)
+    exact_defenders = min(last_defenders, max_exact)
+    if first_attackers <= exact_attackers and first_defenders <= exact_defenders:
+        calculate_win_probability(exact_attackers, exact_defenders, rules)
+        calculate_expected_survivors(exact_attackers, exact_defenders, rules)
+        calculate_expected_rounds(exact_attackers, exact_defenders, rules)
+
+    rows, simulated = [], []
+    for attackers in range(first_attackers, last_attackers + 1):
+        for defenders in range(first_defenders, last_defenders + 1):
+            if attackers <= max_exact and defenders <= max_exact:
+                expected_attackers, expected_defenders = \
+                    calculate_expected_survivors(attackers, defenders, rules)
+                rows.append((attackers, defenders, calculate_win_probability(attackers, defenders, rules),
+                             expected_attackers, expected_defenders,
+                             calculate_expected_rounds(attackers, defenders, rules), EXACT_METHOD))
+            else:
+                simulated.append((attackers, defenders))
+    if simulated:
+        rows.extend(simulate_battle_rows(simulated, rules, samples, [seed, first_attackers, first_defenders]))
+    return rules_name, tile, rows
+
+def simulate_battle_rows(battles, rules, samples, seed):
+    """
+    Estimates each (attackers, defenders) battle in battles, which are too large for the exact
+    engine, from samples simulated battles, returning rows in the same format as compute_tile
+    Every battle is fought in the same NumPy batches (at most MAX_BATCH_BATTLES at a time), and the
+    random stream is derived from the sweep's seed and the tile, so a resumed (or re-run) sweep
+    gives the same estimates no matter which worker picks up the tile
+    """
+    # NumPy is imported here so that sweeps that stay exact don't need it
+    import numpy
+    from BatchSimulator import simulate_battles
+
+    rng = numpy.random.default_rng(seed + [int(value) for value in rules.key])
+    rows = []
+    chunk_size = max(1, MAX_BATCH_BATTLES // samples)
+    for start in range(0, len(battles), chunk_size):
+        chunk = numpy.array(battles[start:start + chunk_size])
+        attackers, defenders, rounds = simulate_battles(numpy.repeat(chunk[:, 0], samples),
+                                                        numpy.repeat(chunk[:, 1], samples),
+                                                        len(chunk) * samples, rng, rules)
+        # one row of samples per battle
+        shape = (len(chunk), samples)
+        wins = (defenders == 0).reshape(shape).mean(axis=1)
+        attackers, defenders = attackers.reshape(shape).mean(axis=1), defenders.reshape(shape).mean(axis=1)
+        rounds = rounds.reshape(shape).mean(axis=1)
+        for i, (num_attackers, num_defenders) in enumerate(chunk.tolist()):
+            rows.append((num_attackers, num_defenders, float(wins[i]), float(attackers[i]),
+                         float(defenders[i]), float(rounds[i]), MONTE_CARLO_METHOD))
+    return rows
+
+def release_other_tables(rules):
+    """
+    Drops the exact tables a worker built for other rule variants, so that a long sweep over
+    several variants only holds one variant's tables at a time in each worker
+    (the classic tables are module level globals in BattleOdds, so they are always kept)
+    """
+    for key in list(RULE_TABLES):
+        if key != rules.key and key != CLASSIC_RULES.key:
+            del RULE_TABLES[key]
+    for key in list(ROUND_TABLES):
+        if key != rules.key:
+            del ROUND_TABLES[key]
+
+def sweep_battles(attacker_range, defender_range, rule_names, tile_size=DEFAULT_TILE_SIZE,
+                  samples=DEFAULT_SAMPLES, seed=0, max_exact=MAX_EXACT_ARMIES, workers=None,
+                  completed=()):
+    """
+    Computes the grid for every rule variant in rule_names, skipping the (rules name, first
+    attackers, first defenders) tiles in completed
+    Yields (rules_name, tile, rows) tuples (see compute_tile) in the order the tiles finish
+    With workers=1 the tiles are computed in this process, in order
+    """
+    completed = set(completed)
+    jobs = [(rules_name, tile) for rules_name in rule_names
+            for tile in plan_tiles(attacker_range, defender_range, tile_size)
+            if (rules_name, tile[0], tile[2]) not in completed]
+
+    if workers == 1:
+        for rules_name, tile in jobs:
+            yield compute_tile(rules_name, tile, samples, seed, max_exact)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # the pool hands out jobs in the order they are submitted
+        futures = [pool.submit(compute_tile, rules_name, tile, samples, seed, max_exact)
+                   for rules_name, tile in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+# --------------- Writing and resuming sweeps ---------------
+
+def get_progress_path(output_path):
+    """
+    Returns the location of the progress file kept alongside a sweep's output
+    """
+    return output_path + ".progress"
+
+def load_progress(output_path, config):
+    """
+    Reads the progress file of an interrupted sweep and returns the set of (rules name, first
+    attackers, first defenders) tiles it already wrote
+    raises ValueError if the sweep was started with different settings
+    """
+    with open(get_progress_path(output_path)) as progress_file:
+        saved_config = json.loads(progress_file.readline())
+        if saved_config != config:
+            raise ValueError("the sweep in " + output_path + " was started with different settings: " +
+                             json.dumps(saved_config, sort_keys=True))
+        # a line cut off part way (by the interruption) is ignored, so that tile is done again
+        completed = set()
+        for line in progress_file:
+            try:
+                completed.add(tuple(json.loads(line)))
+            except ValueError:
+                break
+    return completed
+
+class CsvSweepWriter(object):
+    """
+    Appends each finished tile to a .csv file, one row per battle
+    """
+    def __init__(self, path, config, completed=None):
+        self.path = path
+        self.rule_names = config["rules"]
+        if completed is None:
+            self.output_file = open(path, "w", newline="")
+            self.writer = csv.writer(self.output_file)
+            self.writer.writerow(SWEEP_COLUMNS)
+        else:
+            self.output_file = self.keep_completed_rows(config, completed)
+            self.writer = csv.writer(self.output_file)
+
+    def keep_completed_rows(self, config, completed):
+        """
+        Reopens the output of an interrupted sweep, dropping any rows of a tile that was not
+        finished (its rows may only be partly written), and returns it ready to be appended to
+        """
+        tile_size = config["tile_size"]
+        first_attackers, first_defenders = config["attackers"][0], config["defenders"][0]
+        with open(self.path, newline="") as input_file:
+            rows = list(csv.reader(input_file))
+        with open(self.path, "w", newline="") as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(SWEEP_COLUMNS)
+            for row in rows[1:]:
+                if len(row) != len(SWEEP_COLUMNS):
+                    continue
+                attackers, defenders = int(row[1]), int(row[2])
+                tile_key = (row[0], attackers - (attackers - first_attackers) % tile_size,
+                            defenders - (defenders - first_defenders) % tile_size)
+                if tile_key in completed:
+                    writer.writerow(row)
+        return open(self.path, "a", newline="")
+
+    def write_tile(self, rules_name, tile, rows):
+        for row in rows:
+            self.writer.writerow((rules_name,) + row)
+        self.output_file.flush()
+
+    def close(self):
+        self.output_file.close()
+
+class NpySweepWriter(object):
+    """
+    Fills each finished tile into a memory mapped .npy array (see WIN_INDEX etc. for its layout)
+    """
+    def __init__(self, path, config, completed=None):
+        # NumPy is only needed for .npy output
+        from numpy.lib.format import open_memmap
+        import numpy
+
+        self.rule_names = config["rules"]
+        self.first_attackers, self.first_defenders = config["attackers"][0], config["defenders"][0]
+        shape = (len(self.rule_names), NUM_STATS,
+                 config["attackers"][1] - self.first_attackers + 1,
+                 config["defenders"][1] - self.first_defenders + 1)
+        if completed is None:
+            self.grid = open_memmap(path, mode="w+", dtype=numpy.float64, shape=shape)
+            self.grid[...] = numpy.nan
+        else:
+            self.grid = open_memmap(path, mode="r+")
+            if self.grid.shape != shape:
+                raise ValueError("the array in " + path + " has shape " + str(self.grid.shape) +
+                                 ", not " + str(shape))
+
+    def write_tile(self, rules_name, tile, rows):
+        rules_index = self.rule_names.index(rules_name)
+        for attackers, defenders, win, expected_attackers, expected_defenders, expected_rounds, _ in rows:
+            self.grid[rules_index, :, attackers - self.first_attackers, defenders - self.first_defenders] = \
+                (win, expected_attackers, expected_defenders, expected_rounds)
+        self.grid.flush()
+
+    def close(self):
+        self.grid.flush()
+        del self.grid
+
+def run_sweep(output_path, config, workers=None, resume=False):
+    """
+    Runs the sweep described by config (see main) and writes it to output_path, which must end in
+    .csv or .npy; with resume, only the tiles missing from an interrupted sweep are computed
+    returns the number of tiles computed
+    """
+    writer_class = NpySweepWriter if output_path.endswith(".npy") else CsvSweepWriter
+    completed = load_progress(output_path, config) if resume else None
+    writer = writer_class(output_path, config, completed)
+
+    progress_mode = "a" if resume else "w"
+    num_tiles = 0
+    try:
+        with open(get_progress_path(output_path), progress_mode) as progress_file:
+            if not resume:
+                progress_file.write(json.dumps(config, sort_keys=True) + "\n")
+            for rules_name, tile, rows in sweep_battles(
+                    config["attackers"], config["defenders"], config["rules"], config["tile_size"],
+                    config["samples"], config["seed"], config["max_exact"], workers, completed or ()):
+                # the tile is only listed as done once its rows are safely written
+                writer.write_tile(rules_name, tile, rows)
+                progress_file.write(json.dumps([rules_name, tile[0], tile[2]]) + "\n")
+                progress_file.flush()
+                num_tiles += 1
+    finally:
+        writer.close()
+    return num_tiles
+
+def parse_range(text):
+    """
+    Reads an inclusive "first:last" range (or a single number) of armies for argparse
+    """
+    first, _, last = text.partition(":")
+    try:
+        first, last = int(first), int(last or first)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a range like 2:100, not " + repr(text))
+    if first < 0 or last < first:
+        raise argparse.ArgumentTypeError("expected a range like 2:100, not " + repr(text))
+    return first, last
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute battle odds over a grid of army sizes")
+    parser.add_argument("--attackers", type=parse_range, required=True,
+                        help="attacker counts, as first:last (including the army left behind)")
+    parser.add_argument("--defenders", type=parse_range, required=True, help="defender counts, as first:last")
+    parser.add_argument("--rules", nargs="+", default=[CLASSIC_RULES.name],
+                        help="rule variants to sweep (" + ", ".join(sorted(RULE_VARIANTS)) + ")")
+    parser.add_argument("--output", required=True, help=".csv or .npy file to write the grid to")
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE, help="armies along each side of a tile")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help="battles simulated for each battle too large to compute exactly")
+    parser.add_argument("--max-exact", type=int, default=MAX_EXACT_ARMIES,
+                        help="largest army computed exactly, anything larger is simulated")
+    parser.add_argument("--seed", type=int, help="seed for the simulated battles (random if not given)")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to one per CPU)")
+    parser.add_argument("--resume", action="store_true", help="finish an interrupted sweep into --output")
+    args = parser.parse_args(argv)
+
+    rule_names = []
+    for name in args.rules:
+        rules = find_rules(name)
+        if rules is None:
+            parser.error("unknown rule variant " + repr(name))
+        rule_names.append(rules.name)
+    if not args.output.endswith((".csv", ".npy")):
+        parser.error("--output must be a .csv or .npy file")
+    if args.tile_size < 1 or args.samples < 1:
+        parser.error("--tile-size and --samples must be positive")
+    if args.resume and not os.path.exists(get_progress_path(args.output)):
+        parser.error("there is no interrupted sweep to resume in " + args.output)
+    if not args.resume and os.path.exists(args.output):
+        parser.error(args.output + " already exists (pass --resume to finish it, or remove it)")
+
+    config = {
+        "attackers": list(args.attackers),
+        "defenders": list(args.defenders),
+        "rules": rule_names,
+        "tile_size": args.tile_size,
+        "samples": args.samples,
+        "max_exact": args.max_exact,
+        "seed": args.seed
+    }
+    if args.resume:
+        # the seed (and everything else) comes from the sweep being resumed
+        with open(get_progress_path(args.output)) as progress_file:
+            config["seed"] = json.loads(progress_file.readline())["seed"]
+    elif config["seed"] is None:
+        config["seed"] = new_seed()
+
+    try:
+        num_tiles = run_sweep(args.output, config, args.workers, args.resume)
+    except ValueError as error:
+        parser.error(str(error))
+    print("wrote " + str(num_tiles) + " tiles to " + args.output + " (seed " + str(config["seed"]) + ")")
+
+if __name__ == "__main__":
+    main()
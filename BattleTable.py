@@ -0,0 +1,90 @@
+"""
+Precomputed battle statistics table for the Risk Simulating Aspect of Game Helper
+
+Building the exact tables from scratch takes a noticeable amount of time on a cold Lambda
+container, so this file can be run as a build step to write them to disk ahead of time:
+    python BattleTable.py [max_armies]
+The saved table is memory mapped the first time a probability is requested (never at import). By
+default it covers every battle the skill answers (MAX_EXACT_ARMIES on each side), and callers work
+out anything it doesn't cover (or everything, if it hasn't been built) from the exact engine.
+"""
+from __future__ import print_function
+
+import os
+import sys
+
+# importing the structured logger, so a missing table is reported without an unconditional print
+from Instrumentation import log_event, WARNING
+
+# importing the exact engine the table is built with
+from BattleOdds import calculate_win_probability, calculate_expected_survivors, \
+    WIN_TABLE, ATTACKER_TABLE, DEFENDER_TABLE, MAX_EXACT_ARMIES
+
+# location of the saved table (shipped alongside the code in the Lambda package)
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "battle_table.npy")
+
+# default number of armies on each side covered by the saved table (every battle the skill answers)
+DEFAULT_TABLE_ARMIES = MAX_EXACT_ARMIES
+
+# positions of each statistic along the first axis of the saved table
+WIN_INDEX = 0
+ATTACKER_INDEX = 1
+DEFENDER_INDEX = 2
+
+# the memory mapped table, loaded on first lookup (False means we already tried and failed)
+BATTLE_TABLE = None
+
+def find_battle_stats(num_attackers, num_defenders):
+    """
+    Returns the win probability, expected remaining attackers and expected remaining defenders
+    of a (classic rules) battle from the saved table
+    returns None if the table isn't available or doesn't reach that far
+    """
+    table = load_battle_table()
+    if table is not None and num_attackers < table.shape[1] and num_defenders < table.shape[2]:
+        stats = table[:, num_attackers, num_defenders]
+        return float(stats[WIN_INDEX]), float(stats[ATTACKER_INDEX]), float(stats[DEFENDER_INDEX])
+    return None
+
+def load_battle_table():
+    """
+    Memory maps the saved table the first time it is needed
+    returns None if NumPy or the saved table is unavailable, in which case the exact engine is used
+    """
+    global BATTLE_TABLE
+    if BATTLE_TABLE is None:
+        BATTLE_TABLE = False
+        if os.path.exists(TABLE_PATH):
+            # NumPy is imported here so that cold starts which never ask for odds don't pay for it
+            try:
+                import numpy
+                BATTLE_TABLE = numpy.load(TABLE_PATH, mmap_mode="r")
+            except (ImportError, IOError, ValueError):
+                log_event("battle_table_unavailable", level=WARNING, path=TABLE_PATH)
+    if BATTLE_TABLE is False:
+        return None
+    return BATTLE_TABLE
+
+def build_battle_table(max_armies=DEFAULT_TABLE_ARMIES, path=TABLE_PATH):
+    """
+    Computes the win probability and expected survivors of every battle up to max_armies on
+    each side with the exact engine, and saves them as a single float32 .npy file
+    """
+    import numpy
+
+    # filling the largest battle fills the engine's tables for every smaller battle too
+    calculate_win_probability(max_armies, max_armies)
+    calculate_expected_survivors(max_armies, max_armies)
+
+    size = max_armies + 1
+    table = numpy.empty((3, size, size), dtype=numpy.float32)
+    for index, source in ((WIN_INDEX, WIN_TABLE), (ATTACKER_INDEX, ATTACKER_TABLE),
+                          (DEFENDER_INDEX, DEFENDER_TABLE)):
+        table[index] = [row[:size] for row in source[:size]]
+    numpy.save(path, table)
+    return table
+
+if __name__ == "__main__":
+    armies = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_TABLE_ARMIES
+    build_battle_table(armies)
+    print("saved battle table for up to " + str(armies) + " armies to " + TABLE_PATH)
@@ -0,0 +1,148 @@
+"""
+Cold start and per-request latency benchmark for the Game Helper skill
+
+Replays a synthetic event for every request type and intent in _IntentSchema.txt through
+GameHelperMain.lambda_handler and reports, for each one:
+    cold - time to import GameHelperMain and answer the event in a fresh interpreter
+    p50 / p99 - warm latency over repeated calls in this process
+    peak memory - largest allocation (tracemalloc) while answering the event once warm
+Results can be saved as a baseline and later runs are compared against it:
+    python Benchmark.py --save-baseline
+    python Benchmark.py
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from AlexaEvents import build_schema_events
+import GameHelperMain
+
+# directory holding the skill's code, which is where the fresh interpreters are started
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_BASELINE_PATH = os.path.join(CODE_DIR, "benchmark_baseline.json")
+
+# script run in a fresh interpreter to time the import plus the first (cold) request
+COLD_START_SCRIPT = """
+import json, os, sys, time
+event = json.loads(sys.stdin.read())
+start = time.perf_counter()
+with open(os.devnull, "w") as devnull:
+    stdout, sys.stdout = sys.stdout, devnull
+    import GameHelperMain
+    imported = time.perf_counter()
+    GameHelperMain.lambda_handler(event, None)
+    sys.stdout = stdout
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "cold": done - start}))
+"""
+
+def measure_cold_start(event, runs):
+    """
+    Returns the median import time and import + first request time (in seconds) of the event,
+    each run in a brand new interpreter
+    """
+    imports, colds = [], []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", COLD_START_SCRIPT], cwd=CODE_DIR,
+                                         input=json.dumps(event).encode("utf-8"))
+        result = json.loads(output.decode("utf-8"))
+        imports.append(result["import"])
+        colds.append(result["cold"])
+    return percentile(imports, 50), percentile(colds, 50)
+
+def measure_warm(event, iterations):
+    """
+    Returns the p50 and p99 latency (in seconds) and peak traced memory (in bytes) of answering the
+    event repeatedly in this (already warm) process
+    """
+    timings = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        # the first call warms up any lazily loaded modules and tables
+        GameHelperMain.lambda_handler(event, None)
+        for _ in range(iterations):
+            start = time.perf_counter()
+            GameHelperMain.lambda_handler(event, None)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        GameHelperMain.lambda_handler(event, None)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return percentile(timings, 50), percentile(timings, 99), peak_memory
+
+def percentile(values, pct):
+    """
+    Returns the pct-th percentile of values (nearest rank)
+    """
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def run_benchmark(iterations, cold_runs):
+    """
+    Benchmarks every synthetic event and returns a dictionary of label -> measurements
+    """
+    results = {}
+    for label, event in build_schema_events():
+        import_time, cold_time = measure_cold_start(event, cold_runs)
+        p50, p99, peak_memory = measure_warm(event, iterations)
+        results[label] = {
+            "import_ms": import_time * 1000,
+            "cold_ms": cold_time * 1000,
+            "p50_ms": p50 * 1000,
+            "p99_ms": p99 * 1000,
+            "peak_kb": peak_memory / 1024.0
+        }
+    return results
+
+def format_change(value, baseline_value):
+    """
+    Returns a short string describing how much value moved compared to the baseline
+    """
+    if baseline_value is None or baseline_value == 0:
+        return ""
+    return " (" + "{:+.0f}".format((value - baseline_value) / baseline_value * 100) + "%)"
+
+def print_report(results, baseline):
+    """
+    Prints one line per event, with the change from the baseline next to each number if given
+    """
+    columns = ["import_ms", "cold_ms", "p50_ms", "p99_ms", "peak_kb"]
+    print("{:<28}".format("event") + "".join("{:>20}".format(column) for column in columns))
+    for label, measurements in results.items():
+        previous = baseline.get(label, {})
+        cells = ["{:.3f}".format(measurements[column]) + format_change(measurements[column], previous.get(column))
+                 for column in columns]
+        print("{:<28}".format(label) + "".join("{:>20}".format(cell) for cell in cells))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold start and request latency of lambda_handler")
+    parser.add_argument("--iterations", type=int, default=200, help="warm calls per event")
+    parser.add_argument("--cold-runs", type=int, default=3, help="fresh interpreters per event")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="save these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = run_benchmark(args.iterations, args.cold_runs)
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print("saved baseline to " + args.baseline)
+
+if __name__ == "__main__":
+    main()
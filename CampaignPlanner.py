@@ -0,0 +1,136 @@
+"""
+Multi-territory attack planner for the Risk Simulating Aspect of Game Helper
+
+A campaign is a series of battles where the armies that survive each conquest (minus the one left
+behind in the conquered territory) go on to attack the next one. For each number of defenders, a
+"conquest matrix" holds the chance that any starting army wins and moves a given number of armies
+on, so chaining battles is a vector-matrix product. The matrices of every territory in a plan come
+out of one pass up the defender counts, which only holds on to the few levels a round can reach. A memoized search over the order the
+territories are attacked in then finds the plan with the best odds.
+"""
+from collections import deque
+from functools import lru_cache
+from itertools import permutations
+
+import numpy
+
+from BattleOdds import get_state_outcomes
+from BattleRules import CLASSIC_RULES
+
+# limits that keep a plan inside the Lambda's time budget
+MAX_CAMPAIGN_ARMIES = 500
+MAX_CAMPAIGN_TERRITORIES = 6
+
+@lru_cache(maxsize=2)
+def get_conquest_matrices(max_attackers, defender_counts, rules=CLASSIC_RULES):
+    """
+    Returns a dictionary of defenders -> (max_attackers + 1) x (max_attackers + 1) array for every
+    number of defenders in defender_counts, where entry [a, m] is the chance that a attackers
+    conquer a territory held by that many defenders and move m armies into it
+    Built with one backward pass over the battle states: wins[a] holds the chance of winning with
+    each number of survivors starting from a attackers against the current number of defenders,
+    and only the levels a single round can lose down to are kept while the pass moves up
+    """
+    size = max_attackers + 1
+    # a round can cost the defenders at most one army per pair of dice compared
+    max_losses = min(rules.attack_dice, rules.defend_dice)
+    # with no defenders left, the battle is already won with every attacker surviving
+    previous_rows = deque([numpy.identity(size)], maxlen=max_losses)
+    matrices = {}
+    for defenders in range(1, max(defender_counts) + 1):
+        wins = numpy.zeros((size, size))
+        # rounds the defenders lose armies in lead to levels that are already finished, so every
+        # run of attacker counts rolling the same dice is filled in at once (past attack_dice + 1
+        # attackers, the attackers always roll every die they may)
+        start, stay_outcomes = 2, []
+        while start < size:
+            outcomes = get_state_outcomes(start, defenders, rules)
+            end = start + 1 if start <= rules.attack_dice else size
+            for attacker_losses, defender_losses, round_prob in outcomes:
+                if defender_losses > 0:
+                    # previous_rows[-1] holds defenders - 1, previous_rows[-2] defenders - 2, ...
+                    source = previous_rows[-defender_losses]
+                    wins[start:end] += round_prob * source[start - attacker_losses:end - attacker_losses]
+                else:
+                    stay_outcomes.append((start, end, attacker_losses, round_prob))
+            start = end
+        # rounds only the attackers lose armies in stay on this level, so they are added in order
+        for start, end, attacker_losses, round_prob in stay_outcomes:
+            for attackers in range(start, end):
+                wins[attackers] += round_prob * wins[attackers - attacker_losses]
+        previous_rows.append(wins)
+
+        if defenders in defender_counts:
+            # surviving armies s means s - 1 move on (one stays behind in the attacking territory)
+            conquest = numpy.zeros((size, size))
+            conquest[:, :-1] = wins[:, 1:]
+            matrices[defenders] = conquest
+    return matrices
+
+def advance_campaign(army_distribution, conquest_matrix):
+    """
+    Takes an array of attacking armies -> probability and returns the same for the armies that
+    move on after a conquest described by conquest_matrix (one army stays behind in it)
+    """
+    return army_distribution.dot(conquest_matrix)
+
+def find_campaign_matrices(num_attackers, defenders, rules=CLASSIC_RULES):
+    """
+    Returns the conquest matrices for every territory in defenders (all from a single pass)
+    """
+    return get_conquest_matrices(num_attackers, tuple(sorted(set(defenders))), rules)
+
+def calculate_campaign(num_attackers, defender_path, rules=CLASSIC_RULES):
+    """
+    Returns a dictionary describing attacking each territory in defender_path in order:
+        success_probability - chance of conquering every territory
+        expected_armies - average armies in the last territory, given the campaign succeeds
+        army_distribution - list where index n holds the chance of ending with n armies
+    """
+    matrices = find_campaign_matrices(num_attackers, defender_path, rules)
+    distribution = numpy.zeros(num_attackers + 1)
+    distribution[num_attackers] = 1.0
+    for num_defenders in defender_path:
+        distribution = advance_campaign(distribution, matrices[num_defenders])
+    return summarize_campaign(distribution)
+
+def summarize_campaign(distribution):
+    """
+    Builds the calculate_campaign dictionary from the final army distribution
+    """
+    success_probability = float(distribution.sum())
+    expected_armies = 0.0
+    if success_probability > 0:
+        expected_armies = float(numpy.arange(len(distribution)).dot(distribution)) / success_probability
+    return {
+        "success_probability": success_probability,
+        "expected_armies": expected_armies,
+        "army_distribution": distribution.tolist()
+    }
+
+def find_best_campaign_order(num_attackers, defenders, rules=CLASSIC_RULES):
+    """
+    Tries every order of attacking the territories in defenders (each conquered territory can
+    be attacked from the last) and returns the order with the best chance of taking all of them,
+    along with its calculate_campaign result
+    The army distribution after each partial order is memoized, so orders that start the same way
+    share the work of their common battles
+    """
+    matrices = find_campaign_matrices(num_attackers, defenders, rules)
+    start = numpy.zeros(num_attackers + 1)
+    start[num_attackers] = 1.0
+    prefix_distributions = {(): start}
+
+    def distribution_after(order):
+        if order not in prefix_distributions:
+            prefix_distributions[order] = advance_campaign(distribution_after(order[:-1]), matrices[order[-1]])
+        return prefix_distributions[order]
+
+    best_order, best_prob = tuple(defenders), -1.0
+    # territories with the same number of defenders are interchangeable, so each distinct order
+    # of defender counts only needs to be tried once
+    for order in sorted(set(permutations(defenders))):
+        prob = distribution_after(order).sum()
+        if prob > best_prob:
+            best_order, best_prob = order, prob
+    return list(best_order), summarize_campaign(distribution_after(best_order))
@@ -0,0 +1,383 @@
+"""
+Dice expression mini-language for the dice rolling functions of the Game Helper Alexa Skill
+
+Supports expressions made up of several terms added or subtracted together, for example
+    4d6dl1 + 2        roll 4 six sided dice, drop the lowest, add 2
+    2d20kh1 - 1d4     roll 2 twenty sided dice keeping the highest, subtract a four sided die
+    3d6r1!            roll 3 six sided dice, rerolling ones once, and exploding on sixes
+along with their spoken forms ("4 die 6 drop lowest plus 2"). Expressions are compiled once into
+a DiceExpression object, and compiled expressions are cached by their normalized text so repeated
+requests skip parsing and reuse any statistics already computed for the expression.
+"""
+from __future__ import division
+
+import re
+from functools import lru_cache
+from itertools import combinations_with_replacement
+from math import factorial
+
+from RandomStreams import get_stream
+
+# importing the distribution convolution shared with the other dice engines
+# (along with the largest die, counting its explosions, whose distribution is worked out, so a
+# "d1000000000" is never laid out face by face)
+from DiceOdds import convolve, convolve_power, MAX_DIE_FACES
+
+# limits that keep a single expression from running away with the Lambda's time budget
+MAX_EXPRESSION_DICE = 1000
+MAX_EXPLOSIONS = 20
+# largest flat number added to a roll (keeps every total inside the 64 bit integers batches use)
+MAX_CONSTANT = 1000000
+# largest number of sorted dice combinations enumerated to find a keep / drop distribution
+MAX_ENUMERATED_ROLLS = 200000
+# largest number of distinct totals tracked when building an expression's distribution
+MAX_DISTRIBUTION_SIZE = 100000
+# most multiplications spent adding up the dice of a single term's distribution
+MAX_CONVOLUTION_WORK = 2000000
+
+# spoken phrases and their equivalent in the written syntax, replaced in order
+SPOKEN_REPLACEMENTS = [
+    (r"\bdrop (?:the )?lowest\b", "dl"),
+    (r"\bdrop (?:the )?highest\b", "dh"),
+    (r"\bkeep (?:the )?highest\b", "kh"),
+    (r"\bkeep (?:the )?lowest\b", "kl"),
+    (r"\breroll(?:ing)? ones\b", "r1"),
+    (r"\breroll(?:ing)?\b", "r"),
+    (r"\bexplod(?:e|es|ing)\b", "!"),
+    (r"\b(?:plus|add|adding|and)\b", "+"),
+    (r"\b(?:minus|subtract|subtracting|less)\b", "-"),
+    (r"\b(?:dice|die)\b", "d"),
+    (r"\s+", "")
+]
+
+# a single dice term ("4d6dl1"), or a flat number
+TERM_PATTERN = re.compile(r"([+-])(?:(\d*)d(\d+)((?:kh\d*|kl\d*|dh\d*|dl\d*|r\d*|!)*)|(\d+))")
+MODIFIER_PATTERN = re.compile(r"(kh|kl|dh|dl|r)(\d*)|!")
+
+def normalize_dice_expression(text):
+    """
+    Converts a written or spoken dice expression into its compact written form
+    (lower case, no spaces, starting with a sign), which is also used as the cache key
+    """
+    text = text.lower().strip()
+    for pattern, replacement in SPOKEN_REPLACEMENTS:
+        text = re.sub(pattern, replacement, text)
+    if not text.startswith(("+", "-")):
+        text = "+" + text
+    return text
+
+def compile_dice_expression(text):
+    """
+    Returns the compiled DiceExpression for the given text, reusing a cached copy if the same
+    expression has been seen before
+    raises ValueError if the text isn't a valid dice expression
+    """
+    return compile_normalized_expression(normalize_dice_expression(text))
+
+@lru_cache(maxsize=256)
+def compile_normalized_expression(normalized):
+    """
+    Parses an already normalized expression into a DiceExpression (cached by normalized text)
+    """
+    terms, position = [], 0
+    while position < len(normalized):
+        match = TERM_PATTERN.match(normalized, position)
+        if match is None:
+            raise ValueError("Invalid dice expression: " + normalized)
+        sign = -1 if match.group(1) == "-" else 1
+        if match.group(5) is not None:
+            if int(match.group(5)) > MAX_CONSTANT:
+                raise ValueError("Numbers in an expression can be at most " + str(MAX_CONSTANT))
+            terms.append(ConstantTerm(sign * int(match.group(5))))
+        else:
+            terms.append(parse_dice_term(sign, match.group(2), match.group(3), match.group(4)))
+        position = match.end()
+
+    if sum(term.count for term in terms) > MAX_EXPRESSION_DICE:
+        raise ValueError("Too many dice in expression: " + normalized)
+    return DiceExpression(normalized, terms)
+
+def parse_dice_term(sign, count, sides, modifiers):
+    """
+    Builds a DiceTerm from the pieces of a matched "NdS..." term
+    """
+    count = int(count) if count else 1
+    sides = int(sides)
+    if sides < 1:
+        raise ValueError("Dice must have at least one side")
+    if sides > MAX_DIE_FACES:
+        # past this the batched rolls can't even be drawn as 64 bit integers
+        raise ValueError("Dice can have at most " + str(MAX_DIE_FACES) + " sides")
+
+    keep, reroll, explode = None, 0, False
+    for match in MODIFIER_PATTERN.finditer(modifiers):
+        if match.group(0) == "!":
+            # a one sided die would explode forever
+            explode = sides > 1
+            continue
+        kind, amount = match.group(1), int(match.group(2)) if match.group(2) else 1
+        if kind == "r":
+            # rerolling every face would never finish
+            reroll = min(amount, sides - 1)
+        elif kind in ("kh", "kl"):
+            keep = (kind[1], min(amount, count))
+        else:
+            # dropping the lowest n is the same as keeping the highest count - n
+            keep = ("h" if kind == "dl" else "l", max(count - amount, 0))
+    return DiceTerm(sign, count, sides, keep, reroll, explode)
+
+# --------------- Compiled expression objects ---------------
+
+class ConstantTerm(object):
+    """
+    A flat number added to (or subtracted from) a roll
+    """
+    count = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def roll(self):
+        return self.value
+
+    def roll_batch(self, rng, num_rolls):
+        return self.value
+
+    def distribution(self):
+        return {self.value: 1.0}
+
+class DiceTerm(object):
+    """
+    count dice with the given number of sides, optionally keeping only the highest / lowest few,
+    rerolling low faces once, or exploding (rolling again and adding) on the highest face
+    """
+    def __init__(self, sign, count, sides, keep=None, reroll=0, explode=False):
+        self.sign = sign
+        self.count = count
+        self.sides = sides
+        # keep is None, or ("h" / "l", number of dice kept)
+        self.keep = keep
+        self.reroll = reroll
+        self.explode = explode
+
+    def roll_die(self):
+        """
+        Rolls a single die, applying the reroll and explode rules
+        """
+        stream = get_stream()
+        value = stream.roll(self.sides)
+        if value <= self.reroll:
+            value = stream.roll(self.sides)
+        total = value
+        explosions = 0
+        while self.explode and value == self.sides and explosions < MAX_EXPLOSIONS:
+            value = stream.roll(self.sides)
+            total += value
+            explosions += 1
+        return total
+
+    def roll(self):
+        rolls = [self.roll_die() for _ in range(self.count)]
+        if self.keep is not None:
+            rolls.sort(reverse=self.keep[0] == "h")
+            rolls = rolls[:self.keep[1]]
+        return self.sign * sum(rolls)
+
+    def roll_batch(self, rng, num_rolls):
+        """
+        Rolls the term num_rolls times at once with a NumPy generator, returning an array of totals
+        """
+        faces = rng.integers(1, self.sides + 1, size=(num_rolls, self.count))
+        if self.reroll:
+            rerolled = faces <= self.reroll
+            faces[rerolled] = rng.integers(1, self.sides + 1, size=int(rerolled.sum()))
+        if self.explode:
+            # only the dice that just showed the highest face keep rolling
+            exploding = faces == self.sides
+            for _ in range(MAX_EXPLOSIONS):
+                num_exploding = int(exploding.sum())
+                if num_exploding == 0:
+                    break
+                extra = rng.integers(1, self.sides + 1, size=num_exploding)
+                faces[exploding] += extra
+                exploding[exploding] = extra == self.sides
+        if self.keep is not None:
+            faces.sort(axis=1)
+            faces = faces[:, self.count - self.keep[1]:] if self.keep[0] == "h" else faces[:, :self.keep[1]]
+        return self.sign * faces.sum(axis=1)
+
+    def die_distribution(self):
+        """
+        Returns a dictionary of value -> probability for a single die
+        """
+        face_prob = 1.0 / self.sides
+        # probability of each face once the (single) reroll of low faces is accounted for
+        faces = {}
+        for face in range(1, self.sides + 1):
+            faces[face] = (face_prob if face > self.reroll else 0.0) + self.reroll * face_prob * face_prob
+        if not self.explode:
+            return faces
+
+        # each explosion adds another die on top of the highest face
+        values, carry, base = {}, faces[self.sides], 0
+        for face in range(1, self.sides):
+            values[face] = faces[face]
+        for explosions in range(1, MAX_EXPLOSIONS + 1):
+            base += self.sides
+            last = explosions == MAX_EXPLOSIONS
+            for face in range(1, self.sides + (1 if last else 0)):
+                values[base + face] = values.get(base + face, 0.0) + carry * face_prob
+            carry *= face_prob
+        return values
+
+    def num_faces(self):
+        """
+        Returns the number of distinct values a single die can show
+        """
+        return self.sides * (MAX_EXPLOSIONS + 1) if self.explode else self.sides
+
+    def distribution(self):
+        """
+        Returns a dictionary of total -> probability for the whole term
+        returns None if the distribution would be too expensive to compute exactly
+        """
+        num_faces = self.num_faces()
+        if num_faces > MAX_DIE_FACES:
+            return None
+        # adding up the dice multiplies every possible total so far by every possible total of the rest
+        if self.keep is None and self.count * (self.count - 1) // 2 * num_faces * num_faces > MAX_CONVOLUTION_WORK:
+            return None
+        die = self.die_distribution()
+        if self.keep is None:
+            low, dense = to_dense_distribution(die)
+            total = to_sparse_distribution(self.count * low, convolve_power(dense, self.count))
+        else:
+            total = self.keep_distribution(die)
+            if total is None:
+                return None
+        return dict((self.sign * value, prob) for value, prob in total.items())
+
+    def keep_distribution(self, die):
+        """
+        Enumerates every sorted set of dice (weighted by how many orderings produce it) to find
+        the distribution of the kept dice
+        """
+        support = sorted(die)
+        num_rolls = factorial(len(support) + self.count - 1) // \
+            (factorial(self.count) * factorial(len(support) - 1))
+        if num_rolls > MAX_ENUMERATED_ROLLS:
+            return None
+
+        total = {}
+        count_factorial = factorial(self.count)
+        for rolls in combinations_with_replacement(support, self.count):
+            # the number of orderings of this multiset, times the chance of any one of them
+            weight, prob, run = count_factorial, 1.0, 1
+            for i, value in enumerate(rolls):
+                prob *= die[value]
+                if i > 0 and value == rolls[i - 1]:
+                    run += 1
+                    weight //= run
+                else:
+                    run = 1
+            kept = rolls[-self.keep[1]:] if self.keep[0] == "h" else rolls[:self.keep[1]]
+            value = sum(kept) if self.keep[1] > 0 else 0
+            total[value] = total.get(value, 0.0) + weight * prob
+        return total
+
+def convolve_distributions(first, second):
+    """
+    Returns the distribution of the sum of two independent values, or None if it would be too large
+    """
+    first_low, first_dense = to_dense_distribution(first)
+    second_low, second_dense = to_dense_distribution(second)
+    if len(first_dense) * len(second_dense) > MAX_DISTRIBUTION_SIZE * 10 or \
+        len(first_dense) + len(second_dense) - 1 > MAX_DISTRIBUTION_SIZE:
+        return None
+    return to_sparse_distribution(first_low + second_low, convolve(first_dense, second_dense))
+
+def to_dense_distribution(distribution):
+    """
+    Takes a dictionary of value -> probability and returns its lowest value, and a tuple holding
+    the chance of every value from there up (the form DiceOdds.convolve works with)
+    """
+    low = min(distribution)
+    dense = [0.0] * (max(distribution) - low + 1)
+    for value, prob in distribution.items():
+        dense[value - low] = prob
+    return low, tuple(dense)
+
+def to_sparse_distribution(low, dense):
+    """
+    Turns a lowest value and a tuple of probabilities back into a dictionary of value -> probability
+    (leaving out the values that can't come up)
+    """
+    return dict((low + offset, prob) for offset, prob in enumerate(dense) if prob > 0.0)
+
+class DiceExpression(object):
+    """
+    A compiled dice expression that can be rolled repeatedly, with its statistics computed once
+    on first use and kept for every later request
+    """
+    def __init__(self, normalized, terms):
+        self.normalized = normalized
+        self.terms = terms
+        self.num_dice = sum(term.count for term in terms)
+        self.cached_distribution = None
+        self.distribution_computed = False
+
+    def roll(self):
+        """
+        Returns the total of a single roll of the expression
+        """
+        return sum(term.roll() for term in self.terms)
+
+    def roll_batch(self, num_rolls, rng=None):
+        """
+        Returns a list with the totals of num_rolls independent rolls of the expression, drawing
+        every die for every roll in a single vectorized pass per term (requires NumPy)
+        """
+        import numpy
+        if rng is None:
+            rng = get_stream().numpy_generator()
+        totals = numpy.zeros(num_rolls, dtype=numpy.int64)
+        for term in self.terms:
+            totals += term.roll_batch(rng, num_rolls)
+        return totals.tolist()
+
+    def distribution(self):
+        """
+        Returns a dictionary of total -> probability for the expression
+        returns None if the distribution is too expensive to compute exactly
+        """
+        if not self.distribution_computed:
+            total = {0: 1.0}
+            for term in self.terms:
+                term_distribution = term.distribution()
+                if term_distribution is None:
+                    total = None
+                    break
+                total = convolve_distributions(total, term_distribution)
+                if total is None:
+                    break
+            self.cached_distribution = total
+            self.distribution_computed = True
+        return self.cached_distribution
+
+    def mean(self):
+        """
+        Returns the average total of the expression, or None if it can't be computed exactly
+        """
+        distribution = self.distribution()
+        if distribution is None:
+            return None
+        return sum(value * prob for value, prob in distribution.items())
+
+    def probability_at_least(self, target):
+        """
+        Returns the chance of rolling target or more, or None if it can't be computed exactly
+        """
+        distribution = self.distribution()
+        if distribution is None:
+            return None
+        return sum(prob for value, prob in distribution.items() if value >= target)
@@ -3,20 +3,47 @@ Logic for the "Word Game" helper functions of the Game Helper Alexa Skill
 
 Developed by Zac Patel on 2/15/17
 """
-# importing random to allow for random number generation
-from random import randint
+# importing the per-request random stream that every roll is drawn from
+from RandomStreams import get_stream
 
 # useful imports for building speech responses
-from SpeechHelpers import build_response, build_speechlet_response
+from SpeechHelpers import ResponseTemplate, build_static_response, to_ssml
+
+# caching the error responses, which never change
+from functools import lru_cache
+
+# importing the exact dice distribution engine for odds questions and very large rolls
+from DiceOdds import probability_at_least, sample_dice_sum, ROLL_LOOP_DICE, MAX_DIE_FACES
+
+# importing the compiler for full dice expressions ("4d6 drop lowest plus 2")
+from DiceExpression import compile_dice_expression
+
+# importing the per-stage request timers
+from Instrumentation import stage
+
+# importing helpers that keep the last request and recent answers in the session
+from SessionCache import remember_request, find_session_result, make_result_key, FOLLOW_UP_REPROMPT
+
+# importing the shared slot normalization index (and the missing-slot marker it reports)
+from SlotValues import resolve_slot, SUBTRACT, NO_INPUT
+
+# hard ceilings on a batched roll, so one request can't run away with the Lambda's time budget
+# (past a few dozen results, Alexa reading them out becomes the bottleneck anyway)
+MAX_BATCH_ROLLS = 50
+MAX_BATCH_DICE = 10000
+
+# the responses this file gives, with everything but the output text built once
+DICE_ROLLED = ResponseTemplate("Dice Rolled", FOLLOW_UP_REPROMPT, False)
+# batches of rolls are read out with a short pause before the summary
+BATCH_ROLLED = ResponseTemplate("Dice Rolled", FOLLOW_UP_REPROMPT, False, ssml=True)
+ODDS_CALCULATED = ResponseTemplate("Dice Odds Calculated", FOLLOW_UP_REPROMPT, False)
 
 # defining a set of variables that we can use to internally specify our error types
 BAD_ROLL_INPUT = "BAD_ROLL_INPUT"
-INPUT_NOT_NUMBER = "INPUT_NOT_NUMBER"
-NO_INPUT = "NO_INPUT"
 
 # Single function that generates a random number according to specified parameters
 # and returns a built speechlet response
-def roll_dice_handler(intent):
+def roll_dice_handler(intent, session=None):
     """
     Given an intent for a dice roll, returns an Alexa readable response that describes the result
     of rolling dice with the given user specifications
@@ -25,37 +52,153 @@ def roll_dice_handler(intent):
     intent = intent["slots"]
 
     # grabbing the dice from the intent, processing them, then saving them to the respective vars
-    num_dice, num_sides, modifier = get_dice_from_intent(intent)
-    
+    with stage("slots"):
+        num_dice, num_sides, modifier = get_dice_from_intent(intent)
+    if modifier == NO_INPUT:
+        modifier = 0
+    return run_roll_dice({"numDice": num_dice, "numSides": num_sides, "modifier": modifier}, session)
+
+def run_roll_dice(params, session=None):
+    """
+    Rolls the dice described by params (parsed from the slots, or saved from the last request so
+    the user can say "again") and returns the completed response
+    """
     # Calculating the value of the dice roll via roll_dice
     # NOTE: we don't do any special error trapping here, because if any of the values is not an int
     # I.E. an error message, roll_dice will exit before it errors
-    if modifier == NO_INPUT:
-        modifier = 0
-    roll_value = roll_dice(num_dice, num_sides, modifier)
+    with stage("compute"):
+        roll_value = roll_dice(params["numDice"], params["numSides"], params["modifier"])
 
     if roll_value == BAD_ROLL_INPUT:
-        card_title = "Couldn't Roll Dice"
-        res_str = "I'm sorry, I could not understand your request."
-    else:
-        # the title of the card that appears in the alexa phone app
-        card_title = "Dice Rolled"
+        return build_error_response("Couldn't Roll Dice")
+
+    # Constructing a response string that describes the dice roll result
+    res_str = create_result_string(roll_value)
+
+    # the session is left open (with the parsed dice saved) so the user can roll the same dice again
+    session_attributes = remember_request(session, "ROLLDICEINTENT", params)
+    with stage("response"):
+        return DICE_ROLLED.render(session_attributes, res_str)
+
+def roll_expression_handler(intent, session=None):
+    """
+    Given an intent holding a full dice expression, returns an Alexa readable response that
+    describes the result of rolling it
+    """
+    intent = intent["slots"]
+
+    expression = NO_INPUT
+    with stage("slots"):
+        if "expression" in intent and "value" in intent["expression"]:
+            try:
+                # compiled expressions are cached, so asking for the same roll again skips parsing
+                expression = compile_dice_expression(intent["expression"]["value"]).normalized
+            except ValueError:
+                expression = BAD_ROLL_INPUT
+    return run_roll_expression({"expression": expression}, session)
+
+def run_roll_expression(params, session=None):
+    """
+    Rolls the (normalized) dice expression saved in params and returns the completed response
+    """
+    if params["expression"] in (NO_INPUT, BAD_ROLL_INPUT):
+        return build_error_response("Couldn't Roll Dice")
+
+    with stage("compute"):
+        res_str = create_result_string(compile_dice_expression(params["expression"]).roll())
+
+    session_attributes = remember_request(session, "ROLLEXPRESSIONINTENT", params)
+    with stage("response"):
+        return DICE_ROLLED.render(session_attributes, res_str)
+
+def batch_roll_handler(intent, session=None):
+    """
+    Given an intent asking for several rolls at once ("roll 6 sets of 4 die 6"), returns an Alexa
+    readable response listing and summarizing every result
+    """
+    intent = intent["slots"]
+
+    with stage("slots"):
+        num_rolls = resolve_slot(intent, "numRolls")
+
+        # the rolls can either be a full expression or the usual "N die S plus M" slots
+        expression = BAD_ROLL_INPUT
+        try:
+            if "expression" in intent and "value" in intent["expression"]:
+                expression = compile_dice_expression(intent["expression"]["value"]).normalized
+            else:
+                num_dice, num_sides, modifier = get_dice_from_intent(intent)
+                if modifier == NO_INPUT:
+                    modifier = 0
+                if isinstance(num_dice, int) and isinstance(num_sides, int) and isinstance(modifier, int):
+                    sign = "-" if modifier < 0 else "+"
+                    expression = compile_dice_expression(str(num_dice) + "d" + str(num_sides) + sign + str(abs(modifier))).normalized
+        except ValueError:
+            expression = BAD_ROLL_INPUT
+    return run_batch_roll({"numRolls": num_rolls, "expression": expression}, session)
+
+def expression_odds_handler(intent, session=None):
+    """
+    Given an intent asking for the odds of rolling at least some target on a full dice expression,
+    returns an Alexa readable response describing the exact probability of that roll
+    """
+    intent = intent["slots"]
+
+    expression = NO_INPUT
+    with stage("slots"):
+        if "expression" in intent and "value" in intent["expression"]:
+            try:
+                expression = compile_dice_expression(intent["expression"]["value"]).normalized
+            except ValueError:
+                expression = BAD_ROLL_INPUT
+        target = resolve_slot(intent, "target")
+    return run_expression_odds({"expression": expression, "target": target}, session)
+
+def run_expression_odds(params, session=None):
+    """
+    Calculates the odds of the (normalized) expression in params reaching its target and returns
+    the completed response (the expression's distribution is worked out once and kept with it)
+    """
+    target = params["target"]
+    if params["expression"] in (NO_INPUT, BAD_ROLL_INPUT) or not isinstance(target, int):
+        return build_error_response("Couldn't Calculate Odds")
+    expression = compile_dice_expression(params["expression"])
+
+    result_key = make_result_key("EXPRESSIONODDSINTENT", params)
+    res_str = find_session_result(session, result_key)
+    if res_str is None:
+        with stage("compute"):
+            prob = expression.probability_at_least(target)
+            if prob is None:
+                return build_error_response("Couldn't Calculate Odds",
+                                            "That roll has too many possible totals for me to work out exactly.")
+            res_str = create_odds_string(target, prob) + " The average roll is " + \
+                str(round(expression.mean(), 1)) + "."
 
-        # Constructing a response string that describes the dice roll result
-        res_str = create_result_string(roll_value)
+    session_attributes = remember_request(session, "EXPRESSIONODDSINTENT", params, result_key, res_str)
+    with stage("response"):
+        return ODDS_CALCULATED.render(session_attributes, res_str)
+
+def run_batch_roll(params, session=None):
+    """
+    Rolls the (normalized) expression in params numRolls times and returns the completed response
+    """
+    num_rolls = params["numRolls"]
+    if params["expression"] == BAD_ROLL_INPUT or not isinstance(num_rolls, int) or num_rolls < 1:
+        return build_error_response("Couldn't Roll Dice")
+    expression = compile_dice_expression(params["expression"])
 
-    # no session attributes necessary (maybe this will be changed later)
-    session_attributes = {}
+    if num_rolls > MAX_BATCH_ROLLS or num_rolls * expression.num_dice > MAX_BATCH_DICE:
+        return build_error_response("Couldn't Roll Dice", "I can roll at most " + str(MAX_BATCH_ROLLS) +
+                                    " sets, and " + str(MAX_BATCH_DICE) + " dice in total, at once.")
 
-    # does not prompt the user for a response after making their call
-    # (this might be changed later to allow the user to easily repeat a single roll_dice)
-    should_end_session = True
+    with stage("compute"):
+        res_str = create_batch_result_string(expression.roll_batch(num_rolls))
 
-    reprompt_text = ""
-    # Note: we do not set a reprompt_text because in most use cases, the user
-    # will only want to roll one dice at a time (hence, should_end_session is True)
-    sp_res = build_speechlet_response(card_title, res_str, reprompt_text, should_end_session)
-    return build_response(session_attributes, sp_res)
+    session_attributes = remember_request(session, "BATCHROLLINTENT", params)
+    with stage("response"):
+        ssml_str = to_ssml(res_str).replace(" From highest", ' <break time="500ms"/> From highest')
+        return BATCH_ROLLED.render(session_attributes, ssml_str, res_str)
 
 def roll_dice(num_dice, num_sides, modifier=0):
     """
@@ -66,35 +209,84 @@ def roll_dice(num_dice, num_sides, modifier=0):
     # the functions that grab these numbers from the intent should adequately trap though
     if (not isinstance(num_dice, int)) or (not isinstance(num_sides, int)) or (not isinstance(modifier, int) and modifier != NO_INPUT):
         return BAD_ROLL_INPUT
-    # Note: we don't add modifier to the randint range because it is only added once
+    if num_dice < 0 or num_sides < 1:
+        return BAD_ROLL_INPUT
+    # Note: we don't add modifier to each die because it is only added once
     my_sum = modifier
 
-    for _ in range(0, num_dice):
-        my_sum += randint(1, num_sides)
+    # huge rolls are drawn straight from the distribution of the sum so they take constant time
+    if num_dice > ROLL_LOOP_DICE:
+        return my_sum + sample_dice_sum(num_dice, num_sides)
+
+    my_sum += sum(get_stream().roll_many(num_dice, num_sides))
 
     return my_sum
 
+def dice_odds_handler(intent, session=None):
+    """
+    Given an intent asking for the odds of rolling at least some target, returns an Alexa readable
+    response describing the exact probability of that roll
+    """
+    intent = intent["slots"]
 
-def modifier_to_number(modifier_type, modifier_value):
+    with stage("slots"):
+        num_dice, num_sides, modifier = get_dice_from_intent(intent)
+        if modifier == NO_INPUT:
+            modifier = 0
+        target = resolve_slot(intent, "target")
+    params = {"numDice": num_dice, "numSides": num_sides, "modifier": modifier, "target": target}
+    return run_dice_odds(params, session)
+
+def run_dice_odds(params, session=None):
+    """
+    Calculates the odds described by params and returns the completed response
+    (answers already given in this session are reused rather than recomputed)
     """
-    Takes in the user input for modifier type / value, and returns a integer modifier_to_number
+    num_dice, num_sides, modifier, target = \
+        params["numDice"], params["numSides"], params["modifier"], params["target"]
+    if not all(isinstance(value, int) for value in (num_dice, num_sides, modifier, target)) or \
+        num_dice < 0 or num_sides < 1:
+        return build_error_response("Couldn't Calculate Odds")
+    if num_sides > MAX_DIE_FACES:
+        return build_error_response("Couldn't Calculate Odds", "I can only work out the odds for dice with up to " +
+                                    str(MAX_DIE_FACES) + " sides.")
 
-    This method handles error trapping for no input and bad input
-    If no modifier type is given, the program will assume the user wants to add.
+    result_key = make_result_key("DICEODDSINTENT", params)
+    res_str = find_session_result(session, result_key)
+    if res_str is None:
+        with stage("compute"):
+            prob = probability_at_least(num_dice, num_sides, target, modifier)
+            res_str = create_odds_string(target, prob)
+
+    session_attributes = remember_request(session, "DICEODDSINTENT", params, result_key, res_str)
+    with stage("response"):
+        return ODDS_CALCULATED.render(session_attributes, res_str)
+
+def build_error_response(card_title, res_str="I'm sorry, I could not understand your request."):
+    """
+    Returns a response telling the user their request couldn't be handled (this ends the session,
+    since there is nothing worth repeating)
+    """
+    with stage("response"):
+        return get_error_response(card_title, res_str)
+
+@lru_cache(maxsize=32)
+def get_error_response(card_title, res_str):
+    """
+    Builds each distinct error response once (they are never modified, so they can be shared)
     """
-    # here we define a set of possible words the user could input to specify addding / subtracting
-    # NOTE: we don't actually use pos_mod_values because the default behavior is to return a
-    # positive modifier value (I might change this later, its mildly goony)
+    return build_static_response(card_title, res_str, "", True)
 
-    #pos_mod_vals = ["adding", "add", "plus"]
-    neg_mod_vals = ["subtract", "sub", "minus"]
 
-    if modifier_type == NO_INPUT:
-        return modifier_value
-    elif modifier_type in neg_mod_vals:
+def modifier_to_number(modifier_type, modifier_value):
+    """
+    Takes in the normalized modifier type (ADD / SUBTRACT) and value, and returns an integer modifier
+
+    If no modifier type is given, the program will assume the user wants to add.
+    """
+    if modifier_type == SUBTRACT and isinstance(modifier_value, int):
         return 0 - modifier_value
-    else:
-        return modifier_value
+    return modifier_value
 
 # Generates a user-readable string from a dice roll result
 def create_result_string(roll_value):
@@ -103,51 +295,33 @@ def create_result_string(roll_value):
     """
     return "Your roll is " + str(roll_value) + "."
 
-
-def get_dice_from_intent(intent):
+def create_batch_result_string(roll_values):
     """
-    First checks to see if each slot appears in the intent. If so, calls process_num to get an int
-    Returns the three values in order
+    Returns a string listing a set of rolls, then summarizing them from highest to lowest with their total
     """
-    num_dice, num_sides, modifier = NO_INPUT, NO_INPUT, NO_INPUT
-
-    try:
-        num_dice = process_num(intent["numDice"]["value"])
-    except:
-        num_dice = NO_INPUT
-
-    try:
-        num_sides = process_num(intent["numSides"]["value"])
-    except:
-        num_sides = NO_INPUT
+    if len(roll_values) == 1:
+        return create_result_string(roll_values[0])
+    in_order = ", ".join(str(value) for value in roll_values[:-1]) + " and " + str(roll_values[-1])
+    by_size = ", ".join(str(value) for value in sorted(roll_values, reverse=True))
+    return "Your " + str(len(roll_values)) + " rolls are " + in_order + ". From highest to lowest, that's " + \
+        by_size + ", for a total of " + str(sum(roll_values)) + "."
 
-    # this is really the only case that needs checking on a "proper"" call
-    if "modifier" in intent:
-        try:
-            modifier = process_num(intent["modifier"]["value"])
-
-            mod_type = NO_INPUT
-            # pulling the modifier out of the intent
-            if "adding" in intent:
-                mod_type = intent["adding"]["value"]
-            modifier = modifier_to_number(mod_type, modifier)
-        except:
-            mod_type = NO_INPUT
+def create_odds_string(target, prob):
+    """
+    Returns a basic string about the chance of rolling at least target that Alexa will read to the user.
+    """
+    # very unlikely (but possible) rolls would otherwise be read out as 0 percent
+    if 0 < prob < .001:
+        return "The chance of rolling at least " + str(target) + " is less than one in a thousand."
+    return "The chance of rolling at least " + str(target) + " is " + str(round(prob * 100, 1)) + " percent."
 
-    return num_dice, num_sides, modifier
 
-# method to convert an intent value into an integer, and trap errors
-def process_num(num):
+def get_dice_from_intent(intent):
     """
-    Attempts to convert the provided num (as a string) into an integer
-    if the input is "?" (what Alexa passes if there is no input), return NO_INPUT
-    if the input errors when attempting to convert to an intger, return INPUT_NOT_NUMBER
-    otherwise, return the number converted to an int
+    Reads each slot through the normalization index (missing slots come back as NO_INPUT)
+    Returns the three values in order
     """
-    if num != "?" and num != None:
-        try:
-            num = int(num)
-        except ValueError:
-            return INPUT_NOT_NUMBER
-        return num
-    return NO_INPUT
+    num_dice = resolve_slot(intent, "numDice")
+    num_sides = resolve_slot(intent, "numSides")
+    modifier = modifier_to_number(resolve_slot(intent, "adding"), resolve_slot(intent, "modifier"))
+    return num_dice, num_sides, modifier
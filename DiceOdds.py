@@ -0,0 +1,139 @@
+"""
+Exact dice sum distribution engine for the dice rolling functions of the Game Helper Alexa Skill
+
+The number of ways N dice with S sides can add up to at most t has a closed form (found by
+inclusion-exclusion over the dice that "overflow" past S):
+    ways(sum <= t) = sum over j of (-1)^j * C(N, j) * C(t - j*S, N)
+which uses exact integer arithmetic, so there is no need to roll or convolve anything. Past
+EXACT_ODDS_DICE dice the sum is indistinguishable from a normal distribution, which is used instead.
+Dice that aren't simply added up (kept, exploding or counted as successes) are handled by
+convolving their distributions, with the shared convolve / convolve_power at the end of this file.
+"""
+from __future__ import division
+
+import math
+from functools import lru_cache
+
+from RandomStreams import get_stream
+
+# most dice that are handled exactly, anything larger uses the normal approximation
+EXACT_ODDS_DICE = 1000
+
+# rolls with more dice than this are sampled from the distribution rather than rolled one by one
+ROLL_LOOP_DICE = 100
+
+# largest number of distinct values a single die can show for its odds to be worked out (the
+# exact counts grow with the number of digits in the sides, so a "d100000000000000000000" would
+# spend seconds on big integer arithmetic)
+MAX_DIE_FACES = 10000
+
+def combinations(n, k):
+    """
+    Returns the number of ways to choose k items out of n (0 if that isn't possible)
+    """
+    if k < 0 or n < k:
+        return 0
+    return math.comb(n, k)
+
+def count_ways_at_most(num_dice, num_sides, total):
+    """
+    Returns the exact number of the num_sides ** num_dice equally likely rolls that add up to
+    total or less
+    """
+    if total < num_dice:
+        return 0
+    if total >= num_dice * num_sides:
+        return num_sides ** num_dice
+
+    ways = 0
+    # each term fixes j dice to have "overflowed" past num_sides
+    for j in range(0, min(num_dice, (total - num_dice) // num_sides) + 1):
+        term = combinations(num_dice, j) * combinations(total - j * num_sides, num_dice)
+        ways += -term if j % 2 else term
+    return ways
+
+def dice_mean(num_dice, num_sides, modifier=0):
+    """
+    Returns the average value of a roll
+    """
+    return num_dice * (num_sides + 1) / 2 + modifier
+
+def dice_variance(num_dice, num_sides):
+    """
+    Returns the variance of a roll (the modifier does not change it)
+    """
+    return num_dice * (num_sides ** 2 - 1) / 12
+
+def dice_cdf(num_dice, num_sides, total, modifier=0):
+    """
+    Returns the probability that a roll of num_dice dice with num_sides sides, plus modifier,
+    comes out to total or less
+    """
+    total -= modifier
+    if total < num_dice:
+        return 0.0
+    if total >= num_dice * num_sides:
+        return 1.0
+    if num_dice > EXACT_ODDS_DICE:
+        # normal approximation with a continuity correction (the sum only takes whole values)
+        z = (total + .5 - dice_mean(num_dice, num_sides)) / math.sqrt(dice_variance(num_dice, num_sides))
+        return .5 * math.erfc(-z / math.sqrt(2))
+    return count_ways_at_most(num_dice, num_sides, total) / num_sides ** num_dice
+
+def dice_pmf(num_dice, num_sides, total, modifier=0):
+    """
+    Returns the probability that a roll comes out to exactly total
+    """
+    return dice_cdf(num_dice, num_sides, total, modifier) - \
+        dice_cdf(num_dice, num_sides, total - 1, modifier)
+
+@lru_cache(maxsize=256)
+def probability_at_least(num_dice, num_sides, target, modifier=0):
+    """
+    Returns the probability that a roll comes out to target or more
+    (cached, since the same odds tend to be asked for again and again on a warm container)
+    """
+    # the sum is symmetric around its mean, so the upper tail is computed as the matching lower
+    # tail (subtracting from 1 would lose all precision for unlikely rolls)
+    return dice_cdf(num_dice, num_sides, num_dice * (num_sides + 1) - (target - modifier))
+
+def sample_dice_sum(num_dice, num_sides):
+    """
+    Returns the sum of num_dice dice with num_sides sides in constant time by drawing it from the
+    normal approximation of the sum (only meant for rolls with more than ROLL_LOOP_DICE dice)
+    """
+    value = int(round(get_stream().gauss(dice_mean(num_dice, num_sides), math.sqrt(dice_variance(num_dice, num_sides)))))
+    # the approximation has tails past what the dice can actually show
+    return min(max(value, num_dice), num_dice * num_sides)
+
+# --------------- Convolving distributions ---------------
+# a distribution here is a tuple where index n holds the chance of a value n above its lowest
+# (DiceExpression keeps track of the offset, PoolOdds counts hits from 0)
+
+def convolve(first, second):
+    """
+    Returns the distribution of the sum of two independent distributions
+    """
+    total = [0.0] * (len(first) + len(second) - 1)
+    for i, first_prob in enumerate(first):
+        if first_prob == 0.0:
+            continue
+        for j, second_prob in enumerate(second):
+            total[i + j] += first_prob * second_prob
+    return tuple(total)
+
+@lru_cache(maxsize=512)
+def convolve_power(distribution, count):
+    """
+    Returns the distribution of the sum of count independent copies of distribution
+    (built by repeated squaring, and cached, so growing pools reuse the smaller ones)
+    """
+    if count == 0:
+        return (1.0,)
+    if count == 1:
+        return distribution
+    half = convolve_power(distribution, count // 2)
+    total = convolve(half, half)
+    if count % 2:
+        total = convolve(total, distribution)
+    return total
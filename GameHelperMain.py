@@ -11,76 +11,195 @@ Created using template: Alexa Skills Blueprint for Python 2.7
 # import for default (amazon) behavior
 from __future__ import print_function
 
-# here we import only the function handler methods to make the code more modular and easy to read
-# each "handler" type method should take in only an intent, and return a completed response
-from SpeechHelpers import build_speechlet_response, build_response
-from RiskLogic import battle_handler, battle_probability_handler
-from DiceLogic import roll_dice_handler
+# importing the module that lets us load each handler's file only when it is first needed
+from importlib import import_module
+
+from SpeechHelpers import build_static_response
+
+# importing the structured, sampled instrumentation used instead of printing every request
+from Instrumentation import start_request, finish_request, annotate, stage, log_event
+
+# importing the helper that reads the last request answered in this session
+from SessionCache import get_last_request
+
+# importing the per-request random streams, so every roll can be replayed from its seed
+from RandomStreams import start_stream
 
 #from WordHelper import word_value_handler, word_checker_handler, word_spell_handle
 
 # Code version number: (so it can be accessed from other files easily)
 VERSION = "A"
 
+# Alexa skill that is allowed to call this function
+APPLICATION_ID = "amzn1.ask.skill.9776484c-e52b-472a-928d-e4c982ea7d78"
+
+# If the user either does not reply to a prompt or says something that is not understood, they
+# will be prompted again with this text.
+HELP_REPROMPT = "Can I help you with your game?"
+
 # Event Handler Methods
-def get_welcome_response():
-    """
-    Called if the user starts a session without specifying an intent
-    """
-    session_attributes = {}
-    card_title = "Welcome"
-    speech_output = """
+# the welcome, help and goodbye responses never change, so each is built once at import
+WELCOME_RESPONSE = build_static_response("Welcome", """
     Welcome to Game Helper.
     I can help you generate dice rolls.
     I can also simulate battles of a number of attackers versus defenders.
     Finally, I can calculate the probability of winning a battle between attackers and defenders.
     Go ahead and ask me to roll dice, simulate battles, or calculate probabilities of winning.
-    """
-
-    # If the user either does not reply to the welcome message or says something
-    # that is not understood, they will be prompted again with this text.
-    reprompt_text = "Can I help you with your game?"
-    should_end_session = False
-    return build_response(session_attributes, build_speechlet_response(
-        card_title, speech_output, reprompt_text, should_end_session))
+    """, HELP_REPROMPT, False)
 
-def get_help_response():
-    """
-    Called if the user requests help
-    """
-    session_attributes = {}
-    card_title = "Help"
-    speech_output = """
+HELP_RESPONSE = build_static_response("Help", """
     I can help you generate dice rolls of any number of dice, of any number of sides, while optionally adding a modifier to the roll.
     For example, you can say, roll me 5 die 6 plus 4.
+    I can roll more complicated dice too, for example, roll the expression 4 die 6 drop lowest plus 2.
+    I can also roll several sets at once, for example, roll 6 sets of 4 die 6.
+    I can also tell you the odds of a roll, for example, what are the odds of rolling at least 15 on 3 die 6.
+    That works for expressions too, for example, what are the odds of rolling at least 15 on the expression 4 die 6 drop lowest.
     I can also help simulate board game battle results similar to the board game Risk.
     I have two capabilities in this area.
     First, I can simulate battles of any number of attackers versus any number of defenders.
     For example, you can say, simulate 5 attackers versus 4 defenders.
-    Second, I can also calculate the probability of winning a battle of 2 to 12 attackers versus 1 to 11 defenders.
+    Second, I can also calculate the probability of winning a battle of up to 1000 attackers versus 1000 defenders.
     For example, you can say, find the probability of 10 attackers beating 7 defenders. 
+    I can also plan an attack across several territories.
+    For example, you can say, what are my odds of conquering 3, 5 and 2 defenders with 20 armies.
+    Or ask, when should I stop attacking with 10 attackers against 7 defenders if the territory is worth 5 armies.
+    To play with house rules, say, use capital rules.
+    After a battle, you can say add 5 attackers, keep attacking, or what are my odds now.
+    I can also count successes for dice pool games like World of Darkness and Shadowrun.
+    For example, you can say, what are my odds of 3 successes on 7 dice in world of darkness.
+    Or for unit battles like Axis and Allies, say, what are my odds with 6 tanks attacking 8 infantry.
+    After any answer, you can say again to repeat it.
     Go ahead and ask me to roll dice, simulate battles, or calculate probabilities of winning.
-    """
+    """, HELP_REPROMPT, False)
+
+# Setting should_end_session to true ends the session and exits the skill.
+SESSION_END_RESPONSE = build_static_response("Session Ended", "Thank you for using Game Helper.", None, True)
 
-    # If the user either does not reply to the welcome message or says something
-    # that is not understood, they will be prompted again with this text.
-    reprompt_text = "Can I help you with your game?"
-    should_end_session = False
-    return build_response(session_attributes, build_speechlet_response(
-        card_title, speech_output, reprompt_text, should_end_session))
+NOTHING_TO_REPEAT_RESPONSE = build_static_response(
+    "Nothing to Repeat", "I don't have anything to repeat yet. " + HELP_REPROMPT, HELP_REPROMPT, False)
 
+def get_welcome_response():
+    """
+    Called if the user starts a session without specifying an intent
+    """
+    return WELCOME_RESPONSE
+
+def get_help_response():
+    """
+    Called if the user requests help
+    """
+    return HELP_RESPONSE
 
 def handle_session_end_request():
     """
     Called when the user tries to cancel or stop the current session
     """
-    card_title = "Session Ended"
-    speech_output = "Thank you for using Game Helper."
+    return SESSION_END_RESPONSE
+
+# --------------- Intent dispatch ------------------
+# Maps each custom intent to the (module, function) that handles it. Each "handler" type method
+# should take in an intent and the session, and return a completed response. Modules are only
+# imported the first time one of their intents is used, so a cold start never pays for engines it
+# doesn't need.
+INTENT_HANDLERS = {
+    "ROLLDICEINTENT": ("DiceLogic", "roll_dice_handler"),
+    "DICEODDSINTENT": ("DiceLogic", "dice_odds_handler"),
+    "ROLLEXPRESSIONINTENT": ("DiceLogic", "roll_expression_handler"),
+    "EXPRESSIONODDSINTENT": ("DiceLogic", "expression_odds_handler"),
+    "BATCHROLLINTENT": ("DiceLogic", "batch_roll_handler"),
+    "SIMULATEBATTLEINTENT": ("RiskLogic", "battle_handler"),
+    "CALCULATEPROBABILITYINTENT": ("RiskLogic", "battle_probability_handler"),
+    "CAMPAIGNINTENT": ("RiskLogic", "campaign_handler"),
+    "STOPPOLICYINTENT": ("RiskLogic", "stop_policy_handler"),
+    "SETRULESINTENT": ("RiskLogic", "rules_handler"),
+    "CONTINUEBATTLEINTENT": ("RiskLogic", "continue_battle_handler"),
+    "REINFORCEINTENT": ("RiskLogic", "reinforce_handler"),
+    "ODDSNOWINTENT": ("RiskLogic", "odds_now_handler"),
+    "POOLODDSINTENT": ("PoolLogic", "pool_odds_handler"),
+    "OPPOSEDPOOLINTENT": ("PoolLogic", "opposed_pool_handler"),
+    "UNITBATTLEINTENT": ("PoolLogic", "unit_battle_handler")
+}
+
+# Maps each intent that can be repeated ("again") to the (module, function) that reruns it from
+# the parameters saved in the session, skipping slot parsing
+REPEAT_HANDLERS = {
+    "ROLLDICEINTENT": ("DiceLogic", "run_roll_dice"),
+    "DICEODDSINTENT": ("DiceLogic", "run_dice_odds"),
+    "ROLLEXPRESSIONINTENT": ("DiceLogic", "run_roll_expression"),
+    "EXPRESSIONODDSINTENT": ("DiceLogic", "run_expression_odds"),
+    "BATCHROLLINTENT": ("DiceLogic", "run_batch_roll"),
+    "SIMULATEBATTLEINTENT": ("RiskLogic", "run_battle"),
+    "CALCULATEPROBABILITYINTENT": ("RiskLogic", "run_battle_probability"),
+    "CAMPAIGNINTENT": ("RiskLogic", "run_campaign"),
+    "STOPPOLICYINTENT": ("RiskLogic", "run_stop_policy"),
+    "SETRULESINTENT": ("RiskLogic", "run_set_rules"),
+    "CONTINUEBATTLEINTENT": ("RiskLogic", "run_continue_battle"),
+    "REINFORCEINTENT": ("RiskLogic", "run_reinforce"),
+    "ODDSNOWINTENT": ("RiskLogic", "run_odds_now"),
+    "POOLODDSINTENT": ("PoolLogic", "run_pool_odds"),
+    "OPPOSEDPOOLINTENT": ("PoolLogic", "run_opposed_pool"),
+    "UNITBATTLEINTENT": ("PoolLogic", "run_unit_battle")
+}
+
+def repeat_handler(intent, session):
+    """
+    Called if the user asks to repeat their last request ("again")
+    """
+    intent_name, params = get_last_request(session)
+    if intent_name not in REPEAT_HANDLERS or params is None:
+        return NOTHING_TO_REPEAT_RESPONSE
+    return load_handler(REPEAT_HANDLERS, intent_name)(params, session)
+
+# Amazon's built in intent types (handled in this file, so they never need an import)
+BUILT_IN_HANDLERS = {
+    "AMAZON.HelpIntent": lambda intent, session: get_help_response(),
+    "AMAZON.CancelIntent": lambda intent, session: handle_session_end_request(),
+    "AMAZON.StopIntent": lambda intent, session: handle_session_end_request(),
+    "AMAZON.RepeatIntent": repeat_handler,
+    "AGAININTENT": repeat_handler
+}
 
-    # Setting this to true ends the session and exits the skill.
-    should_end_session = True
-    return build_response({}, build_speechlet_response(
-        card_title, speech_output, None, should_end_session))
+# handler functions that have already been looked up, keyed by (module, function)
+LOADED_HANDLERS = {}
+
+def get_intent_handler(intent_name):
+    """
+    Returns the handler function for an intent, importing its module on first use
+    """
+    if intent_name in BUILT_IN_HANDLERS:
+        return BUILT_IN_HANDLERS[intent_name]
+    if intent_name not in INTENT_HANDLERS:
+        raise ValueError("Invalid intent")
+    return load_handler(INTENT_HANDLERS, intent_name)
+
+def load_handler(registry, intent_name):
+    """
+    Returns the function registry lists for intent_name, importing its module on first use
+    """
+    module_name, function_name = registry[intent_name]
+    if (module_name, function_name) not in LOADED_HANDLERS:
+        LOADED_HANDLERS[(module_name, function_name)] = getattr(import_module(module_name), function_name)
+    return LOADED_HANDLERS[(module_name, function_name)]
+
+def record_seed(response, stream):
+    """
+    Adds the seed of the request's random stream to the response card, if anything was drawn
+    from it, so the result can be replayed later with replay_request
+    """
+    card = response.get("response", {}).get("card")
+    if not stream.used or card is None:
+        return response
+    # copying the parts that change rather than modifying them, since some responses are shared
+    card = dict(card, content=card["content"] + " (seed " + str(stream.seed) + ")")
+    return dict(response, response=dict(response["response"], card=card))
+
+def replay_request(intent_name, params, seed, session=None):
+    """
+    Reruns a request offline from its parsed parameters (as saved in the session) and the seed on
+    its card, giving back the exact same rolls as the original response
+    """
+    stream = start_stream(seed)
+    return record_seed(load_handler(REPEAT_HANDLERS, intent_name)(params, session), stream)
 
 # --------------- Events ------------------
 # Note to Self: These are the 4 different types of interactions that the user
@@ -88,8 +207,8 @@ def handle_session_end_request():
 def on_session_started(session_started_request, session):
     """ Called when the session starts (every time the skill is run)"""
 
-    print("on_session_started requestId=" + session_started_request['requestId']
-          + ", sessionId=" + session['sessionId'])
+    log_event("on_session_started", requestId=session_started_request['requestId'],
+              sessionId=session['sessionId'])
 
 
 def on_launch(launch_request, session):
@@ -97,8 +216,7 @@ def on_launch(launch_request, session):
     want
     """
 
-    print("on_launch requestId=" + launch_request['requestId'] +
-          ", sessionId=" + session['sessionId'])
+    log_event("on_launch", requestId=launch_request['requestId'], sessionId=session['sessionId'])
     # Dispatch to your skill's launch
     return get_welcome_response()
 
@@ -106,27 +224,19 @@ def on_launch(launch_request, session):
 def on_intent(intent_request, session):
     """ Called when the user specifies an intent for this skill """
 
-    print("on_intent requestId=" + intent_request['requestId'] +
-          ", sessionId=" + session['sessionId'])
+    log_event("on_intent", requestId=intent_request['requestId'], sessionId=session['sessionId'])
 
     # Pulling data from the JSON vector
     intent = intent_request['intent']
     intent_name = intent_request['intent']['name']
+    annotate(intent=intent_name)
 
     # Selecting different behavior for different intent types
-    if intent_name == "ROLLDICEINTENT":
-        return roll_dice_handler(intent)
-    elif intent_name == "SIMULATEBATTLEINTENT":
-        return battle_handler(intent)
-    elif intent_name == "CALCULATEPROBABILITYINTENT":
-        return battle_probability_handler(intent)
-    # Amazon's built in intent types below:
-    elif intent_name == "AMAZON.HelpIntent":
-        return get_help_response()
-    elif intent_name == "AMAZON.CancelIntent" or intent_name == "AMAZON.StopIntent":
-        return handle_session_end_request()
-    else:
-        raise ValueError("Invalid intent")
+    with stage("dispatch"):
+        handler = get_intent_handler(intent_name)
+    # every roll in this request comes from one freshly seeded stream
+    stream = start_stream()
+    return record_seed(handler(intent, session), stream)
 
 
 def on_session_ended(session_ended_request, session):
@@ -134,8 +244,8 @@ def on_session_ended(session_ended_request, session):
 
     Is not called when the skill returns should_end_session=true
     """
-    print("on_session_ended requestId=" + session_ended_request['requestId'] +
-          ", sessionId=" + session['sessionId'])
+    log_event("on_session_ended", requestId=session_ended_request['requestId'],
+              sessionId=session['sessionId'])
     # add cleanup logic here
 
 
@@ -145,21 +255,25 @@ def lambda_handler(event, context):
     """ Route the incoming request based on type (LaunchRequest, IntentRequest,
     etc.) The JSON body of the request is provided in the event parameter.
     """
-    print("event.session.application.applicationId=" +
-          event['session']['application']['applicationId'])
+    # starts a metrics record for this request (if it is sampled), printed once it is answered
+    start_request(event['request']['requestId'], event['request']['type'])
+    try:
+        with stage("parse"):
+            log_event("lambda_handler", applicationId=event['session']['application']['applicationId'])
 
-    # Application ID added to prevent calls 
-    if (event['session']['application']['applicationId'] !=
-             "amzn1.ask.skill.9776484c-e52b-472a-928d-e4c982ea7d78"):
-         raise ValueError("Invalid Application ID")
+            # Application ID added to prevent calls
+            if (event['session']['application']['applicationId'] != APPLICATION_ID):
+                raise ValueError("Invalid Application ID")
 
-    if event['session']['new']:
-        on_session_started({'requestId': event['request']['requestId']},
-                           event['session'])
+            if event['session']['new']:
+                on_session_started({'requestId': event['request']['requestId']},
+                                   event['session'])
 
-    if event['request']['type'] == "LaunchRequest":
-        return on_launch(event['request'], event['session'])
-    elif event['request']['type'] == "IntentRequest":
-        return on_intent(event['request'], event['session'])
-    elif event['request']['type'] == "SessionEndedRequest":
-        return on_session_ended(event['request'], event['session'])
+        if event['request']['type'] == "LaunchRequest":
+            return on_launch(event['request'], event['session'])
+        elif event['request']['type'] == "IntentRequest":
+            return on_intent(event['request'], event['session'])
+        elif event['request']['type'] == "SessionEndedRequest":
+            return on_session_ended(event['request'], event['session'])
+    finally:
+        finish_request()
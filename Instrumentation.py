@@ -0,0 +1,133 @@
+"""
+Lightweight request instrumentation for the Game Helper skill
+
+Records how long each stage of a request takes (parse, slots, compute, response) and prints one
+JSON metrics line per sampled request, which CloudWatch picks up from the Lambda's output.
+Requests that aren't sampled only pay for a single random draw, and log lines are only built when
+the configured level asks for them.
+
+Configured with environment variables on the Lambda function:
+    GAME_HELPER_METRICS_LEVEL - OFF, WARNING (only problems), INFO (also sampled metrics, the
+                                default) or DEBUG (also logs every event)
+    GAME_HELPER_METRICS_SAMPLE - fraction of requests that get a metrics record (default 0.1)
+"""
+from __future__ import print_function
+
+import json
+import os
+import threading
+import time
+from random import Random
+
+# instrumentation levels, from quietest to loudest
+OFF = 0
+WARNING = 1
+INFO = 2
+DEBUG = 3
+LEVEL_NAMES = {"OFF": OFF, "WARNING": WARNING, "INFO": INFO, "DEBUG": DEBUG}
+
+METRICS_LEVEL = LEVEL_NAMES.get(os.environ.get("GAME_HELPER_METRICS_LEVEL", "INFO").upper(), INFO)
+SAMPLE_RATE = float(os.environ.get("GAME_HELPER_METRICS_SAMPLE", "0.1"))
+
+# sampling has its own generator so it never disturbs the random numbers used for rolls
+SAMPLER = Random()
+
+# the metrics record of the request being handled on this thread (None when not sampled)
+CURRENT = threading.local()
+
+def configure(level=None, sample_rate=None):
+    """
+    Changes the instrumentation level and / or sample rate at runtime
+    """
+    global METRICS_LEVEL, SAMPLE_RATE
+    if level is not None:
+        METRICS_LEVEL = LEVEL_NAMES[level] if level in LEVEL_NAMES else level
+    if sample_rate is not None:
+        SAMPLE_RATE = sample_rate
+
+def start_request(request_id, request_type):
+    """
+    Decides whether this request is sampled, and if so starts its metrics record
+    """
+    if METRICS_LEVEL < INFO or SAMPLER.random() >= SAMPLE_RATE:
+        CURRENT.record = None
+        return
+    CURRENT.record = {
+        "requestId": request_id,
+        "type": request_type,
+        "start": time.perf_counter(),
+        "stages": {}
+    }
+
+def annotate(**fields):
+    """
+    Adds extra fields (intent name, battle size, ...) to the current request's record if it is sampled
+    """
+    record = getattr(CURRENT, "record", None)
+    if record is not None:
+        record.update(fields)
+
+def finish_request():
+    """
+    Prints the current request's metrics record as a single JSON line if it is sampled
+    """
+    record = getattr(CURRENT, "record", None)
+    if record is None:
+        return
+    CURRENT.record = None
+    start = record.pop("start")
+    record["total_ms"] = (time.perf_counter() - start) * 1000
+    record["stages"] = dict((name, elapsed * 1000) for name, elapsed in record["stages"].items())
+    record["metric"] = "request"
+    print(json.dumps(record, sort_keys=True))
+
+class StageTimer(object):
+    """
+    Context manager that adds the time spent inside it to one stage of a metrics record
+    """
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stages = self.record["stages"]
+        stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+class NullStage(object):
+    """
+    Context manager that does nothing, handed out for requests that aren't sampled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_STAGE = NullStage()
+
+def stage(name):
+    """
+    Returns a context manager timing the named stage of the current request
+    usage: with stage("compute"): ...
+    """
+    record = getattr(CURRENT, "record", None)
+    if record is None:
+        return NULL_STAGE
+    return StageTimer(record, name)
+
+def log_event(event, level=DEBUG, **fields):
+    """
+    Prints a structured log line for an event, only when the configured level is at least level
+    (DEBUG by default; problems are logged at WARNING so they show up unless logging is OFF)
+    the fields are only serialized if the line is actually printed
+    """
+    if METRICS_LEVEL >= level:
+        fields["event"] = event
+        if level == WARNING:
+            fields["level"] = "WARNING"
+        print(json.dumps(fields, sort_keys=True))
@@ -0,0 +1,151 @@
+"""
+Load generator for the local Alexa replay server (ReplayServer.py)
+
+Sends a realistic mix of requests: each one picks a line of _SampleUtterances.txt at random (so
+intents are as common as the ways of asking for them) and fills its slots with typical values.
+Every simulated user keeps its session going, passing the session attributes of each response
+back with the next request, so follow-ups like "again" behave as they would on a device.
+    python LoadGenerator.py [--url http://127.0.0.1:8080] [--users 8] [--requests 2000]
+Reports throughput, latency percentiles and errors, so the concurrency where tail latency starts
+to climb can be found before real traffic does.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import threading
+import time
+from random import Random
+from urllib.request import Request, urlopen
+
+from AlexaEvents import build_event, load_sample_utterances
+from BattleRules import RULE_VARIANTS
+from Benchmark import percentile
+
+DEFAULT_URL = "http://127.0.0.1:8080"
+
+# how many requests a simulated user makes before their session ends and a new one starts
+SESSION_LENGTH = 5
+
+# the values each slot is filled with, picked from at random
+SLOT_VALUE_CHOICES = {
+    "numDice": [str(num) for num in range(1, 11)],
+    "numSides": ["4", "6", "8", "10", "12", "20"],
+    "adding": ["plus", "minus"],
+    "modifier": [str(num) for num in range(0, 6)],
+    "target": [str(num) for num in range(3, 41)],
+    "expression": ["4 die 6 drop lowest", "2 die 20 keep highest", "3 die 6 plus 2", "1 die 8 minus 1"],
+    "numRolls": [str(num) for num in range(2, 9)],
+    "partyOneType": ["attackers"],
+    "numPartyOne": [str(num) for num in range(2, 61)],
+    "partyTwoType": ["defenders"],
+    "numPartyTwo": [str(num) for num in range(1, 41)],
+    "numAttackers": [str(num) for num in range(5, 61)],
+    "defendersOne": [str(num) for num in range(1, 11)],
+    "defendersTwo": [str(num) for num in range(1, 11)],
+    "defendersThree": [str(num) for num in range(1, 11)],
+    "defendersFour": [str(num) for num in range(1, 11)],
+    "ruleSet": sorted(RULE_VARIANTS),
+    "numRounds": [str(num) for num in range(1, 6)],
+    "numArmies": [str(num) for num in range(1, 11)],
+    "territoryWorth": [str(num) for num in range(2, 31)],
+    "armyType": ["attackers", "defenders"],
+    "numSuccesses": [str(num) for num in range(1, 6)],
+    "opposingDice": [str(num) for num in range(1, 11)],
+    "gameSystem": ["world of darkness", "shadowrun", "exalted"],
+    "numAttackUnits": [str(num) for num in range(1, 11)],
+    "attackUnitType": ["infantry", "artillery", "tanks", "fighters", "bombers"],
+    "numAttackUnitsTwo": [str(num) for num in range(1, 6)],
+    "attackUnitTypeTwo": ["infantry", "artillery", "tanks"],
+    "numDefendUnits": [str(num) for num in range(1, 11)],
+    "defendUnitType": ["infantry", "tanks", "fighters"],
+    "numDefendUnitsTwo": [str(num) for num in range(1, 6)],
+    "defendUnitTypeTwo": ["infantry", "fighters"]
+}
+
+def build_random_event(utterances, rng, session_id, new_session, session_attributes):
+    """
+    Returns an event for a random sample utterance with its slots filled in
+    """
+    intent_name, slot_names = rng.choice(utterances)
+    slots = dict((name, rng.choice(SLOT_VALUE_CHOICES.get(name, ["?"]))) for name in slot_names)
+    return build_event("IntentRequest", intent_name, slots, session_id, new_session, session_attributes)
+
+def send_event(url, event):
+    """
+    Posts an event to the replay server and returns the decoded response
+    """
+    request = Request(url, json.dumps(event).encode("utf-8"), {"Content-Type": "application/json"})
+    with urlopen(request) as reply:
+        return json.loads(reply.read().decode("utf-8"))
+
+def run_user(url, utterances, num_requests, seed, results):
+    """
+    Plays one simulated user making num_requests requests back to back, appending
+    (intent name, latency or None if it failed) to results
+    """
+    rng = Random(seed)
+    session_id, session_attributes = None, {}
+    for count in range(num_requests):
+        new_session = count % SESSION_LENGTH == 0
+        if new_session:
+            session_id, session_attributes = "amzn1.echo-api.session.load-" + str(seed) + "-" + str(count), {}
+        event = build_random_event(utterances, rng, session_id, new_session, session_attributes)
+        start = time.perf_counter()
+        try:
+            response = send_event(url, event)
+            latency = time.perf_counter() - start
+            session_attributes = response.get("sessionAttributes") or {}
+            if response.get("response", {}).get("shouldEndSession"):
+                session_attributes = {}
+        except Exception:
+            latency = None
+        results.append((event["request"]["intent"]["name"], latency))
+
+def run_load(url, num_users, num_requests, seed=0):
+    """
+    Splits num_requests between num_users concurrent simulated users and returns the list of
+    (intent name, latency) results and the wall clock time it took
+    """
+    utterances = load_sample_utterances()
+    results = []
+    users = [threading.Thread(target=run_user, args=(url, utterances, num_requests // num_users, seed + user, results))
+             for user in range(num_users)]
+    start = time.perf_counter()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    return results, time.perf_counter() - start
+
+def print_report(results, elapsed):
+    """
+    Prints throughput, overall latency percentiles and per intent p50 / p99
+    """
+    latencies = [latency for _, latency in results if latency is not None]
+    errors = len(results) - len(latencies)
+    print("requests: " + str(len(results)) + "   errors: " + str(errors) + "   throughput: " +
+          "{:.1f}".format(len(latencies) / elapsed) + " requests/s")
+    if not latencies:
+        return
+    print("latency ms   p50 {:.2f}   p90 {:.2f}   p99 {:.2f}   max {:.2f}".format(
+        *[percentile(latencies, pct) * 1000 for pct in (50, 90, 99, 100)]))
+    print("{:<28}{:>8}{:>12}{:>12}".format("intent", "count", "p50_ms", "p99_ms"))
+    for intent_name in sorted(set(name for name, _ in results)):
+        intent_latencies = [latency for name, latency in results if name == intent_name and latency is not None]
+        if intent_latencies:
+            print("{:<28}{:>8}{:>12.2f}{:>12.2f}".format(intent_name, len(intent_latencies),
+                  percentile(intent_latencies, 50) * 1000, percentile(intent_latencies, 99) * 1000))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send a realistic mix of requests to ReplayServer.py")
+    parser.add_argument("--url", default=DEFAULT_URL, help="address of the replay server")
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--requests", type=int, default=2000, help="total requests to send")
+    parser.add_argument("--seed", type=int, default=0, help="seed for picking requests (not rolls)")
+    args = parser.parse_args(argv)
+    results, elapsed = run_load(args.url, args.users, args.requests, args.seed)
+    print_report(results, elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Logic for the dice pool and unit combat games of the Game Helper Alexa Skill (World of Darkness,
+Shadowrun, Exalted, Axis and Allies, ...)
+
+Every game here is a configuration in PoolOdds, so supporting a new one only means adding it
+there (and to the GAME_SYSTEM or UNIT_TYPE slot values); these handlers work for all of them.
+"""
+# caching the error responses, which never change
+from functools import lru_cache
+
+# importing methods for creating final, Alexa readable responses
+from SpeechHelpers import ResponseTemplate, build_static_response
+
+# importing the dice pool engine and the games it is configured for
+from PoolOdds import pool_distribution, probability_at_least, expected_hits, contest_odds, \
+    calculate_unit_battle, find_pool_system, find_unit_system, POOL_SYSTEMS, \
+    MAX_POOL_DICE, MAX_BATTLE_UNITS
+
+# importing the per-stage request timers
+from Instrumentation import stage
+
+# importing helpers that keep the last request and recent answers in the session
+from SessionCache import remember_request, find_session_result, make_result_key, \
+    get_session_attributes, FOLLOW_UP_REPROMPT
+
+# importing the shared slot normalization index (and the error types it reports)
+from SlotValues import resolve_slot, NO_INPUT
+
+# the responses this file gives, with everything but the output text built once
+POOL_ODDS_CALCULATED = ResponseTemplate("Dice Pool Odds Calculated", FOLLOW_UP_REPROMPT, False)
+OPPOSED_ODDS_CALCULATED = ResponseTemplate("Opposed Roll Odds Calculated", FOLLOW_UP_REPROMPT, False)
+UNIT_BATTLE_CALCULATED = ResponseTemplate("Unit Battle Odds Calculated", FOLLOW_UP_REPROMPT, False)
+UNKNOWN_GAME = ResponseTemplate("Unknown Game", FOLLOW_UP_REPROMPT, False)
+
+# slots holding the (count, unit type) pairs of each side of a unit battle
+ATTACK_UNIT_SLOTS = [("numAttackUnits", "attackUnitType"), ("numAttackUnitsTwo", "attackUnitTypeTwo")]
+DEFEND_UNIT_SLOTS = [("numDefendUnits", "defendUnitType"), ("numDefendUnitsTwo", "defendUnitTypeTwo")]
+
+def pool_odds_handler(intent, session=None):
+    intent = intent["slots"]
+    # read the size of the pool, the successes wanted (if any) and the game
+    with stage("slots"):
+        num_dice = resolve_slot(intent, "numDice")
+        num_successes = resolve_slot(intent, "numSuccesses")
+        game_system = resolve_slot(intent, "gameSystem")
+    return run_pool_odds({"numDice": num_dice, "numSuccesses": num_successes,
+                          "gameSystem": get_game_name(session, game_system)}, session)
+
+def run_pool_odds(params, session=None):
+    """
+    Calculates the chance of the successes in params from a pool of dice, and the average number
+    of successes, and returns the completed response
+    """
+    system = find_pool_system(params["gameSystem"])
+    if system is None:
+        return build_unknown_game_response(session)
+    num_dice, num_successes = params["numDice"], params["numSuccesses"]
+    if not isinstance(num_dice, int) or not 0 < num_dice <= MAX_POOL_DICE or \
+        not (isinstance(num_successes, int) or num_successes == NO_INPUT):
+        return build_error_response("Couldn't calculate dice pool odds")
+
+    result_key = make_result_key("POOLODDSINTENT", params)
+    res_str = find_session_result(session, result_key)
+    if res_str is None:
+        with stage("compute"):
+            distribution = pool_distribution(system, num_dice)
+            res_str = create_pool_res_str(num_dice, system, num_successes, distribution)
+
+    session_attributes = remember_request(session, "POOLODDSINTENT", params, result_key, res_str)
+    session_attributes["gameSystem"] = system.name
+    with stage("response"):
+        return POOL_ODDS_CALCULATED.render(session_attributes, res_str)
+
+def opposed_pool_handler(intent, session=None):
+    intent = intent["slots"]
+    # read the size of both pools and the game
+    with stage("slots"):
+        num_dice = resolve_slot(intent, "numDice")
+        opposing_dice = resolve_slot(intent, "opposingDice")
+        game_system = resolve_slot(intent, "gameSystem")
+    return run_opposed_pool({"numDice": num_dice, "opposingDice": opposing_dice,
+                             "gameSystem": get_game_name(session, game_system)}, session)
+
+def run_opposed_pool(params, session=None):
+    """
+    Calculates the chance of each pool in params getting more successes than the other, and
+    returns the completed response
+    """
+    system = find_pool_system(params["gameSystem"])
+    if system is None:
+        return build_unknown_game_response(session)
+    num_dice, opposing_dice = params["numDice"], params["opposingDice"]
+    if not all(isinstance(num, int) and 0 < num <= MAX_POOL_DICE for num in (num_dice, opposing_dice)):
+        return build_error_response("Couldn't calculate opposed roll odds")
+
+    result_key = make_result_key("OPPOSEDPOOLINTENT", params)
+    res_str = find_session_result(session, result_key)
+    if res_str is None:
+        with stage("compute"):
+            win, lose, tie = contest_odds([pool_distribution(system, num_dice),
+                                           pool_distribution(system, opposing_dice)])
+            res_str = "Rolling " + str(num_dice) + " dice against " + str(opposing_dice) + " in " + \
+                system.name + ", you have a " + format_percent(win) + " chance of more successes, " + \
+                "a " + format_percent(tie) + " chance of a tie, and a " + format_percent(lose) + \
+                " chance of fewer."
+
+    session_attributes = remember_request(session, "OPPOSEDPOOLINTENT", params, result_key, res_str)
+    session_attributes["gameSystem"] = system.name
+    with stage("response"):
+        return OPPOSED_ODDS_CALCULATED.render(session_attributes, res_str)
+
+def unit_battle_handler(intent, session=None):
+    intent = intent["slots"]
+    # read up to two kinds of units on each side, as [unit type, count] pairs
+    with stage("slots"):
+        attackers = get_units_from_intent(intent, ATTACK_UNIT_SLOTS)
+        defenders = get_units_from_intent(intent, DEFEND_UNIT_SLOTS)
+    return run_unit_battle({"attackers": attackers, "defenders": defenders}, session)
+
+def run_unit_battle(params, session=None):
+    """
+    Calculates how the unit battle in params is likely to end, and returns the completed response
+    """
+    attackers, defenders = params["attackers"], params["defenders"]
+    if not attackers or not defenders:
+        return build_error_response("Couldn't calculate battle odds")
+
+    # every unit has to belong to the same game
+    systems, units = set(), []
+    for unit_type, count in attackers + defenders:
+        system, unit = find_unit_system(unit_type)
+        if system is None or not isinstance(count, int) or count < 1:
+            return build_error_response("Couldn't calculate battle odds")
+        systems.add(system.name)
+        units.append((system, unit, count))
+    if len(systems) != 1 or sum(count for _, count in attackers) > MAX_BATTLE_UNITS or \
+        sum(count for _, count in defenders) > MAX_BATTLE_UNITS:
+        return build_error_response("Couldn't calculate battle odds")
+    system = units[0][0]
+
+    result_key = make_result_key("UNITBATTLEINTENT", params)
+    res_str = find_session_result(session, result_key)
+    if res_str is None:
+        with stage("compute"):
+            attacking_units = count_units(units[:len(attackers)])
+            defending_units = count_units(units[len(attackers):])
+            outcome = calculate_unit_battle(system, attacking_units, defending_units)
+            res_str = create_unit_battle_res_str(system, units[:len(attackers)], units[len(attackers):], outcome)
+
+    session_attributes = remember_request(session, "UNITBATTLEINTENT", params, result_key, res_str)
+    with stage("response"):
+        return UNIT_BATTLE_CALCULATED.render(session_attributes, res_str)
+
+def build_unknown_game_response(session):
+    """
+    Returns a response listing the games dice pools can be rolled for (the session is left open
+    so the user can ask again)
+    """
+    games = sorted(POOL_SYSTEMS)
+    res_str = "Tell me which game you're playing. I can count successes for " + ", ".join(games[:-1]) + \
+        " and " + games[-1] + "."
+    with stage("response"):
+        return UNKNOWN_GAME.render(get_session_attributes(session), res_str)
+
+def build_error_response(card_title):
+    """
+    Returns a response telling the user their request couldn't be understood (this ends the
+    session, since there is nothing worth repeating)
+    """
+    with stage("response"):
+        return get_error_response(card_title)
+
+@lru_cache(maxsize=32)
+def get_error_response(card_title):
+    """
+    Builds each distinct error response once (they are never modified, so they can be shared)
+    """
+    return build_static_response(card_title, "I'm sorry, I could not understand your request.", "", True)
+
+def format_percent(prob):
+    """
+    Returns a probability read out as a percentage
+    """
+    return str(round(prob * 100, 1)) + " percent"
+
+def create_pool_res_str(num_dice, system, num_successes, distribution):
+    """
+    Returns a string describing the chance of num_successes (or of any success, if the user didn't
+    ask for a number) and the average number of successes of a pool
+    """
+    average = str(round(expected_hits(distribution), 1))
+    res_str = "Rolling " + str(num_dice) + " dice in " + system.name + ", "
+    if num_successes == NO_INPUT:
+        return res_str + "you get " + average + " successes on average, and have a " + \
+            format_percent(probability_at_least(distribution, 1)) + " chance of at least one."
+    return res_str + "you have a " + format_percent(probability_at_least(distribution, num_successes)) + \
+        " chance of at least " + str(num_successes) + " successes, and get " + average + " on average."
+
+def create_unit_battle_res_str(system, attackers, defenders, outcome):
+    """
+    Returns a string describing how a unit battle is likely to end (each side is a list of
+    (system, unit, count), with the units named as the game lists them)
+    """
+    res_str = "Attacking " + describe_units(system, defenders) + " with " + describe_units(system, attackers) + \
+        ", you have a " + format_percent(outcome["attacker_win"]) + " chance of winning"
+    if outcome["draw"] >= .001:
+        res_str = res_str + ", and a " + format_percent(outcome["draw"]) + " chance both sides are wiped out"
+    return res_str + ". The battle lasts about " + str(round(outcome["expected_rounds"], 1)) + " rounds."
+
+# ---------------Helper functions that should not be used outside of this file---------------
+
+def get_game_name(session, game_system):
+    """
+    Returns the game named in the slot, or the one used earlier in this session if it wasn't said
+    """
+    if game_system == NO_INPUT:
+        return get_session_attributes(session).get("gameSystem", NO_INPUT)
+    return game_system
+
+def get_units_from_intent(intent, unit_slots):
+    """
+    Reads the (count, unit type) slot pairs that were filled in, and returns them as a list of
+    [unit type, count] pairs (a unit type without a count is taken to be a single unit)
+    """
+    units = []
+    for count_slot, type_slot in unit_slots:
+        unit_type = resolve_slot(intent, type_slot)
+        if unit_type == NO_INPUT:
+            continue
+        count = resolve_slot(intent, count_slot)
+        units.append([" ".join(unit_type.lower().split()), 1 if count == NO_INPUT else count])
+    return units
+
+def count_units(units):
+    """
+    Takes a list of (system, unit, count) and returns a dictionary of unit -> total count
+    """
+    counts = {}
+    for _, unit, count in units:
+        counts[unit] = counts.get(unit, 0) + count
+    return counts
+
+def describe_units(system, units):
+    """
+    Returns a spoken list of (system, unit, count) ("6 tanks and 2 artillery")
+    """
+    return " and ".join(str(count) + " " + (unit if count == 1 else system.plural(unit))
+                        for _, unit, count in units)
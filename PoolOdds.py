@@ -0,0 +1,331 @@
+"""
+Dice pool contest engine for the games Game Helper covers beyond Risk
+
+Many games don't add their dice up, they count how many of them "hit": World of Darkness and
+Shadowrun count successes in a pool of dice, and Axis & Allies style combat gives every unit a
+die that hits on a number depending on its type. All of these come down to the distribution of
+the number of hits, so each game is only a configuration (a PoolSystem or CombatSystem) and every
+question is answered with the same few exact tools:
+    - a distribution is a tuple where index n holds the chance of exactly n hits
+    - a pool of identical dice is one die's distribution convolved with itself (by squaring, and
+      cached), and a mixed pool is the convolution of its parts
+    - opposed rolls compare the distributions of each party, and unit combat is an absorbing
+      Markov chain over the casualties each side has taken, like BattleOdds
+"""
+from functools import lru_cache
+
+# importing the distribution convolution shared with the other dice engines
+from DiceOdds import convolve, convolve_power
+
+# a die that earns another die (World of Darkness "10 again") is followed until the chance of
+# still rolling is below this
+AGAIN_CUTOFF = 1e-12
+
+# the most dice in a pool, or units on a side of a unit battle, that are calculated
+# (keeps a single request inside the Lambda's time budget)
+MAX_POOL_DICE = 500
+MAX_BATTLE_UNITS = 50
+
+# --------------- Distributions ---------------
+
+def hit_chance_distribution(hit_chance):
+    """
+    Returns the distribution of a single die that hits with the given chance
+    """
+    return (1.0 - hit_chance, hit_chance)
+
+def probability_at_least(distribution, target):
+    """
+    Returns the chance of at least target hits
+    """
+    return sum(distribution[max(target, 0):])
+
+def expected_hits(distribution):
+    """
+    Returns the average number of hits
+    """
+    return sum(hits * prob for hits, prob in enumerate(distribution))
+
+def contest_odds(distributions):
+    """
+    Given the distributions of several parties rolling against each other, returns a list of the
+    chance each party ends up with strictly more hits than everyone else, followed by the chance
+    of a tie for the most hits
+    """
+    # cumulative[p][n] is the chance party p gets n hits or fewer
+    cumulative = []
+    for distribution in distributions:
+        running, total = [], 0.0
+        for prob in distribution:
+            total += prob
+            running.append(total)
+        cumulative.append(running)
+
+    def at_most(party, hits):
+        if hits < 0:
+            return 0.0
+        return cumulative[party][min(hits, len(cumulative[party]) - 1)]
+
+    wins = []
+    for party, distribution in enumerate(distributions):
+        win = 0.0
+        for hits, prob in enumerate(distribution):
+            if prob == 0.0:
+                continue
+            others = 1.0
+            for other in range(len(distributions)):
+                if other != party:
+                    others *= at_most(other, hits - 1)
+            win += prob * others
+        wins.append(win)
+    return wins + [max(0.0, 1.0 - sum(wins))]
+
+# --------------- Success counting pools ---------------
+
+class PoolSystem(object):
+    """
+    How a game counts successes in a pool of identical dice
+        sides - number of sides on each die
+        success_on - lowest face that counts as a success
+        double_on - lowest face that counts as two successes (None if no face does)
+        again_on - lowest face that earns another die to roll (None if no face does)
+    """
+    def __init__(self, name, sides, success_on, double_on=None, again_on=None):
+        self.name = name
+        self.sides = sides
+        self.success_on = success_on
+        self.double_on = double_on
+        self.again_on = again_on
+        # everything that changes the odds (the name doesn't), used to key cached distributions
+        self.key = (sides, success_on, double_on, again_on)
+
+    def __eq__(self, other):
+        return isinstance(other, PoolSystem) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "PoolSystem(" + repr(self.name) + ")"
+
+    def face_successes(self, face):
+        """
+        Returns the number of successes a single face counts for
+        """
+        if self.double_on is not None and face >= self.double_on:
+            return 2
+        return 1 if face >= self.success_on else 0
+
+    def die_distribution(self):
+        """
+        Returns the distribution of successes of one die, including any dice it earns
+        """
+        return find_die_distribution(self)
+
+@lru_cache(maxsize=32)
+def find_die_distribution(system):
+    """
+    Builds the distribution of successes of one die of a PoolSystem (cached per system)
+    A die that earns another adds that die's whole distribution to its own successes, so the
+    distribution is the fixed point of die = final faces + again faces * die, which is reached by
+    substituting until the chance of still rolling is negligible
+    """
+    final_faces, again_faces = [0.0] * 3, [0.0] * 3
+    for face in range(1, system.sides + 1):
+        target = again_faces if system.again_on is not None and face >= system.again_on else final_faces
+        target[system.face_successes(face)] += 1.0 / system.sides
+
+    distribution, still_rolling = tuple(final_faces), sum(again_faces)
+    reach = still_rolling
+    while reach > AGAIN_CUTOFF:
+        distribution = pad_sum(final_faces, convolve(again_faces, distribution))
+        reach *= still_rolling
+    return trim_distribution(distribution)
+
+def pad_sum(first, second):
+    """
+    Returns the element-wise sum of two distributions of different lengths
+    """
+    size = max(len(first), len(second))
+    return tuple((first[i] if i < len(first) else 0.0) + (second[i] if i < len(second) else 0.0)
+                 for i in range(size))
+
+def trim_distribution(distribution):
+    """
+    Drops the trailing outcomes too unlikely to matter (at most AGAIN_CUTOFF in total)
+    """
+    end, tail = len(distribution), 0.0
+    while end > 1 and tail + distribution[end - 1] <= AGAIN_CUTOFF:
+        tail += distribution[end - 1]
+        end -= 1
+    return tuple(distribution[:end])
+
+def pool_distribution(system, num_dice):
+    """
+    Returns the distribution of successes of a pool of num_dice dice
+    """
+    return convolve_power(system.die_distribution(), num_dice)
+
+# --------------- Hit-on-N unit combat ---------------
+
+class CombatSystem(object):
+    """
+    How a game fights battles of mixed units, where every unit rolls one die a round and hits on
+    its attack value (when attacking) or defense value (when defending) or lower; each hit removes
+    one unit from the other side, and both sides fire at once
+        sides - number of sides on each die
+        units - list of (unit name, attack, defense), which is also the order units are lost in
+                (cheapest first)
+        same_plural - units whose name is the same for one or many of them (infantry, artillery);
+                      every other unit name takes an "s" for more than one
+    """
+    def __init__(self, name, sides, units, same_plural=()):
+        self.name = name
+        self.sides = sides
+        self.units = units
+        self.same_plural = frozenset(same_plural)
+        self.unit_values = dict((unit, (attack, defense)) for unit, attack, defense in units)
+        self.unit_order = dict((unit, position) for position, (unit, _, _) in enumerate(units))
+
+    def __repr__(self):
+        return "CombatSystem(" + repr(self.name) + ")"
+
+    def find_unit(self, name):
+        """
+        Returns the unit called name (ignoring case, spacing and plurals), or None if there isn't one
+        """
+        if name is None:
+            return None
+        name = " ".join(name.lower().split())
+        for candidate in (name, name[:-1], name[:-2]):
+            if candidate in self.unit_values:
+                return candidate
+        return None
+
+    def plural(self, unit):
+        """
+        Returns the name of more than one of unit
+        """
+        return unit if unit in self.same_plural else unit + "s"
+
+    def line_up(self, units):
+        """
+        Takes a dictionary of unit name -> count and returns a list of the hit value of every unit
+        on an attacking side in the order they are lost, and the same for a defending side
+        """
+        ordered = sorted(units.items(), key=lambda item: self.unit_order[item[0]])
+        attacking = [self.unit_values[unit][0] for unit, count in ordered for _ in range(count)]
+        defending = [self.unit_values[unit][1] for unit, count in ordered for _ in range(count)]
+        return attacking, defending
+
+def side_hits_distribution(hit_values, sides):
+    """
+    Returns the distribution of hits of a side whose units hit on the values in hit_values
+    (units with the same value are grouped, so each group is one cached convolution power)
+    """
+    distribution = (1.0,)
+    counts = {}
+    for value in hit_values:
+        counts[value] = counts.get(value, 0) + 1
+    for value in sorted(counts):
+        hit_chance = min(max(value, 0), sides) / float(sides)
+        distribution = convolve(distribution, convolve_power(hit_chance_distribution(hit_chance), counts[value]))
+    return distribution
+
+def calculate_unit_battle(system, attacking_units, defending_units):
+    """
+    Fights a CombatSystem battle until one side (or both) is wiped out; each side is a dictionary
+    of unit name -> count. Returns a dictionary describing how it ends:
+        attacker_win - chance the attackers are left standing with no defenders
+        defender_win - chance the defenders are left standing with no attackers
+        draw - chance both sides are wiped out in the same round (or neither can ever hit)
+        expected_rounds - average number of rounds fought
+    """
+    attack_values = system.line_up(attacking_units)[0]
+    defend_values = system.line_up(defending_units)[1]
+    num_attackers, num_defenders = len(attack_values), len(defend_values)
+
+    # the hits each side deals once it has lost its first n units, for every n
+    attacker_hits = [side_hits_distribution(attack_values[lost:], system.sides) for lost in range(num_attackers)]
+    defender_hits = [side_hits_distribution(defend_values[lost:], system.sides) for lost in range(num_defenders)]
+
+    # mass[a][d] is the chance the battle ever reaches a attackers and d defenders lost
+    mass = [[0.0] * (num_defenders + 1) for _ in range(num_attackers + 1)]
+    mass[0][0] = 1.0
+    result = {"attacker_win": 0.0, "defender_win": 0.0, "draw": 0.0, "expected_rounds": 0.0}
+
+    # losses only ever grow, so walking both upwards visits each state after everything leading to it
+    for attackers_lost in range(num_attackers + 1):
+        for defenders_lost in range(num_defenders + 1):
+            state_prob = mass[attackers_lost][defenders_lost]
+            if state_prob == 0.0:
+                continue
+            if attackers_lost == num_attackers or defenders_lost == num_defenders:
+                if attackers_lost == num_attackers and defenders_lost == num_defenders:
+                    result["draw"] += state_prob
+                elif defenders_lost == num_defenders:
+                    result["attacker_win"] += state_prob
+                else:
+                    result["defender_win"] += state_prob
+                continue
+
+            dealt, taken = attacker_hits[attackers_lost], defender_hits[defenders_lost]
+            # rounds where nobody hits leave the battle where it is, so they are folded into the
+            # rounds that move it on
+            miss_prob = dealt[0] * taken[0]
+            if miss_prob >= 1.0:
+                result["draw"] += state_prob
+                continue
+            result["expected_rounds"] += state_prob / (1.0 - miss_prob)
+            for hits_dealt, dealt_prob in enumerate(dealt):
+                new_defenders_lost = min(defenders_lost + hits_dealt, num_defenders)
+                for hits_taken, taken_prob in enumerate(taken):
+                    if hits_dealt == 0 and hits_taken == 0:
+                        continue
+                    new_attackers_lost = min(attackers_lost + hits_taken, num_attackers)
+                    mass[new_attackers_lost][new_defenders_lost] += \
+                        state_prob * dealt_prob * taken_prob / (1.0 - miss_prob)
+    return result
+
+# --------------- Game configurations ---------------
+
+# success counting games, by the name the user asks for them with
+POOL_SYSTEMS = {
+    # ten sided dice, 8 or more is a success, and a 10 earns another die
+    "world of darkness": PoolSystem("world of darkness", 10, 8, again_on=10),
+    # six sided dice, 5 or 6 is a hit
+    "shadowrun": PoolSystem("shadowrun", 6, 5),
+    # ten sided dice, 7 or more is a success, and a 10 counts twice
+    "exalted": PoolSystem("exalted", 10, 7, double_on=10)
+}
+
+# unit combat games, by the name the user asks for them with
+COMBAT_SYSTEMS = {
+    # the units of the classic board game, cheapest first
+    "axis and allies": CombatSystem("axis and allies", 6, [
+        ("infantry", 1, 2), ("artillery", 2, 2), ("tank", 3, 3), ("fighter", 3, 4), ("bomber", 4, 1)],
+        same_plural=["infantry", "artillery"])
+}
+
+def find_pool_system(name):
+    """
+    Returns the success counting game called name (ignoring case and surrounding whitespace)
+    returns None if there is no game by that name
+    """
+    if name is None:
+        return None
+    return POOL_SYSTEMS.get(" ".join(name.lower().split()))
+
+def find_unit_system(unit_name):
+    """
+    Returns the unit combat game that has a unit called unit_name, and that unit's name as the
+    game lists it; returns None, None if no game has that unit
+    """
+    for system in COMBAT_SYSTEMS.values():
+        unit = system.find_unit(unit_name)
+        if unit is not None:
+            return system, unit
+    return None, None
@@ -0,0 +1,111 @@
+"""
+Seedable random number streams shared by the dice and battle logic of the Game Helper skill
+
+Every request gets its own stream, seeded from the operating system unless a seed is given, and
+every die, battle round and sampled sum in that request is drawn from it. Uniform numbers are
+drawn in bulk into a buffer that dice are then read from, which is much cheaper than a call to
+random.randint per die. Because a stream only depends on its seed, the seed is printed on the
+response card, and replaying the same request with that seed (see GameHelperMain.replay_request)
+gives back exactly the same rolls.
+"""
+import threading
+from random import Random, SystemRandom
+
+# how many uniform numbers are drawn each time a stream's buffer runs dry
+BUFFER_SIZE = 256
+
+# seeds are kept to 32 bits so they are short enough to read off a card
+SEED_BITS = 32
+
+# source of fresh seeds, separate from every stream so picking a seed never disturbs a roll
+SEED_SOURCE = SystemRandom()
+
+# the stream of the request being handled on this thread
+CURRENT = threading.local()
+
+class RollStream(object):
+    """
+    A seeded generator plus a buffer of uniform numbers in [0, 1) drawn from it in bulk
+    used is set once anything is drawn, so responses only mention the seed if it mattered
+    """
+    def __init__(self, seed):
+        self.seed = seed
+        self.generator = Random(seed)
+        self.buffer = []
+        self.used = False
+
+    def fill_buffer(self):
+        draw = self.generator.random
+        self.buffer = [draw() for _ in range(BUFFER_SIZE)]
+
+    def random(self):
+        """
+        Returns the next uniform number in [0, 1) from the stream
+        """
+        if not self.buffer:
+            self.fill_buffer()
+        self.used = True
+        return self.buffer.pop()
+
+    def roll(self, sides):
+        """
+        Returns a single roll of a die with the given number of sides
+        """
+        return int(self.random() * sides) + 1
+
+    def roll_many(self, count, sides):
+        """
+        Returns a list of count rolls of a die with the given number of sides
+        """
+        if len(self.buffer) < count:
+            # topping the buffer up first keeps the rolls in the order they were drawn
+            draw = self.generator.random
+            self.buffer[:0] = [draw() for _ in range(count - len(self.buffer) + BUFFER_SIZE)]
+        self.used = True
+        rolls = [int(value * sides) + 1 for value in self.buffer[-count:]] if count else []
+        del self.buffer[len(self.buffer) - count:]
+        return rolls
+
+    def gauss(self, mean, sigma):
+        """
+        Returns a normally distributed number from the stream
+        """
+        self.used = True
+        return self.generator.gauss(mean, sigma)
+
+    def choice(self, options):
+        """
+        Returns one of options at random
+        """
+        return options[int(self.random() * len(options))]
+
+    def numpy_generator(self):
+        """
+        Returns a NumPy generator seeded from the stream, for vectorized draws (requires NumPy)
+        """
+        from numpy.random import default_rng
+        self.used = True
+        return default_rng(self.generator.getrandbits(64))
+
+def new_seed():
+    """
+    Returns a fresh seed for a stream
+    """
+    return SEED_SOURCE.getrandbits(SEED_BITS)
+
+def start_stream(seed=None):
+    """
+    Starts the stream for the request being handled on this thread (with a fresh seed if none is
+    given) and returns it
+    """
+    CURRENT.stream = RollStream(new_seed() if seed is None else seed)
+    return CURRENT.stream
+
+def get_stream():
+    """
+    Returns the current request's stream, starting one if the request didn't (local scripts, etc.)
+    """
+    stream = getattr(CURRENT, "stream", None)
+    if stream is None:
+        stream = start_stream()
+    return stream
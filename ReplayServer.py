@@ -0,0 +1,83 @@
+"""
+Local stand-in for the Alexa service, for load testing the Game Helper skill
+
+Accepts Alexa format request JSON over HTTP (POST to any path) and answers it with
+GameHelperMain.lambda_handler, run on a pool of threads or processes:
+    python ReplayServer.py [--port 8080] [--workers 4] [--processes]
+Processes behave like separate Lambda containers, each answering one request at a time, and are
+the faithful model of production. Threads share one warm copy of the skill and its caches, which a
+real container never does, so use them to stress the shared code rather than to judge results.
+LoadGenerator.py sends traffic to it.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import GameHelperMain
+
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = 4
+
+def handle_event(event):
+    """
+    Answers a single event with lambda_handler (module level, so process pools can pickle it)
+    """
+    return GameHelperMain.lambda_handler(event, None)
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """
+    Reads an event from the request body and replies with the skill's response as JSON
+    (the pool that runs lambda_handler is set on the server by serve)
+    """
+    def do_POST(self):
+        try:
+            event = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+            response = self.server.pool.submit(handle_event, event).result()
+        except Exception as error:
+            self.send_reply(500, {"error": type(error).__name__ + ": " + str(error)})
+            return
+        self.send_reply(200, response)
+
+    def send_reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # one line per request would swamp the output (and the timings) under load
+        pass
+
+def serve(port=DEFAULT_PORT, workers=DEFAULT_WORKERS, processes=False):
+    """
+    Runs the replay server until it is interrupted
+    """
+    pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    server = ThreadingHTTPServer(("127.0.0.1", port), ReplayRequestHandler)
+    server.daemon_threads = True
+    with pool_class(max_workers=workers) as pool:
+        server.pool = pool
+        print("replaying Alexa events on http://127.0.0.1:" + str(port) + " with " + str(workers) +
+              (" processes" if processes else " threads"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer Alexa format requests locally with lambda_handler")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="size of the worker pool")
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    args = parser.parse_args(argv)
+    serve(args.port, args.workers, args.processes)
+
+if __name__ == "__main__":
+    main()
@@ -3,64 +3,388 @@ Logic for the Risk Simulating Aspect of Game Helper
 Developed by Zac Patel on 1/11/17
 Code editing help provided by Anil Patel (patela)
 """
-# importing a function to handle random number generation
-from random import randint
+# importing the per-request random stream that every roll is drawn from
+from RandomStreams import get_stream
+
+# importing a cache for full outcome distributions, which stay valid for the life of the container
+from functools import lru_cache
+
+# importing a clock to keep long simulations inside their time budget
+import time
 
 # importing methods for creating final, Alexa readable responses
-from SpeechHelpers import build_speechlet_response, build_response
+from SpeechHelpers import ResponseTemplate, build_static_response
+
+# importing the exact probability engine used to answer probability requests
+from BattleOdds import calculate_outcome_distribution, find_survivor_percentile, get_round_outcomes, \
+    sample_round_losses, MAX_EXACT_ARMIES
+
+# importing the rule variants battles can be fought under
+from BattleRules import CLASSIC_RULES, RULE_VARIANTS, find_rules
+
+# importing the precomputed table lookup (battles past its bounds use the exact outcome distribution)
+from BattleTable import find_battle_stats
+
+# importing the narrator that picks the highlights out of a simulated battle
+from BattleNarration import BattleNarrator, count_rounds
+
+# importing the optimal stop-attacking policy, whose grid is kept for the life of the container
+from StopPolicy import find_stop_policy, find_army_value, find_default_territory_worth, MAX_POLICY_ARMIES
+
+# importing the per-stage request timers
+from Instrumentation import stage
+
+# importing helpers that keep the last request and recent answers in the session
+from SessionCache import remember_request, find_session_result, make_result_key, \
+    get_session_attributes, FOLLOW_UP_REPROMPT
+
+# importing the shared slot normalization index (and the error types it reports)
+from SlotValues import resolve_slot, DEFENDERS, INPUT_NOT_NUMBER, NO_INPUT
+
+# ways simulate_battle can play out a battle:
+# DICE_MODE rolls and compares every die, SAMPLED_MODE draws each round's losses directly, and
+# JUMP_MODE additionally skips ahead many full strength rounds at once
+DICE_MODE = "DICE_MODE"
+SAMPLED_MODE = "SAMPLED_MODE"
+JUMP_MODE = "JUMP_MODE"
+
+# battles with more total armies than this are simulated with JUMP_MODE by battle_handler
+FAST_SIMULATION_ARMIES = 100
+
+# most seconds spent simulating a battle for one response; a battle that isn't over by then is
+# described as it stands, and the user can say "keep attacking" to carry on from there
+BATTLE_TIME_BUDGET = 1.0
+
+# reprompt given when a battle is cut short by the time budget
+CONTINUE_REPROMPT = "Say keep attacking to carry on with the battle, or stop to finish."
 
-# defining a set of variables that we can use to internally specify our error types
-INPUT_NOT_NUMBER = "INPUT_NOT_NUMBER"
-NO_INPUT = "NO_INPUT"
+# the responses this file gives, with everything but the output text built once
+BATTLE_SIMULATED = ResponseTemplate("Battle Simulated", FOLLOW_UP_REPROMPT, False)
+PROBABILITY_CALCULATED = ResponseTemplate("Battle Probability Calculated", FOLLOW_UP_REPROMPT, False)
+CAMPAIGN_PLANNED = ResponseTemplate("Campaign Planned", FOLLOW_UP_REPROMPT, False)
+STOPPING_POINT_FOUND = ResponseTemplate("Stopping Point Found", FOLLOW_UP_REPROMPT, False)
+RULES_CHANGED = ResponseTemplate("Rules Changed", FOLLOW_UP_REPROMPT, False)
+RULES_NOT_CHANGED = ResponseTemplate("Rules Not Changed", FOLLOW_UP_REPROMPT, False)
+BATTLE_CONTINUED = ResponseTemplate("Battle Continued", FOLLOW_UP_REPROMPT, False)
+ARMIES_ADDED = ResponseTemplate("Armies Added", FOLLOW_UP_REPROMPT, False)
+NO_BATTLE = ResponseTemplate("No Battle", FOLLOW_UP_REPROMPT, False)
+BATTLE_PAUSED = ResponseTemplate("Battle In Progress", CONTINUE_REPROMPT, False)
 
 # --------------- Complete behavior functions that can be called by other files ---------------
-def battle_handler(intent):
+def battle_handler(intent, session=None):
     intent = intent["slots"]
     # Taking advantage of python's ability to return multiple items
     # Reads the number of attackers and defenders from the intent
-    num_attackers, num_defenders = get_num_att_def(intent)
+    with stage("slots"):
+        num_attackers, num_defenders = get_num_att_def(intent)
+    return run_battle({"numAttackers": num_attackers, "numDefenders": num_defenders,
+                       "rules": get_session_rules(session).name}, session)
 
+def run_battle(params, session=None):
+    """
+    Simulates the battle described by params (parsed from the slots, or saved from the last
+    request so the user can say "again") and returns the completed response
+    """
+    num_attackers, num_defenders = params["numAttackers"], params["numDefenders"]
     if num_attackers == NO_INPUT or num_defenders == NO_INPUT or \
         num_attackers == INPUT_NOT_NUMBER or num_defenders == INPUT_NOT_NUMBER:
-        card_title = "Couldn't simulate battle"
-        battle_res_string = "I'm sorry, I could not understand your request."
+        return build_error_response("Couldn't simulate battle")
+    rules = find_rules(params.get("rules")) or CLASSIC_RULES
+
+    # simulates a battle to get the final number of attackers and defenders, along with its
+    # highlights (stopping early if it runs past the time budget)
+    with stage("compute"):
+        final_attackers, final_defenders, num_rounds, narration, paused = \
+            fight_battle(num_attackers, num_defenders, rules)
+
+    # generates a battle summary string from the results
+    if paused:
+        battle_res_string = create_paused_res_string(num_rounds, final_attackers, final_defenders)
     else:
-        # simulates a battle to get the final number of attackers and defenders
-        final_attackers, final_defenders, num_rounds = simulate_battle(num_attackers, num_defenders)
-
-        # generates a battle summary string from the results
         battle_res_string = create_battle_res_string(num_attackers, num_defenders, final_attackers, final_defenders)
+    battle_res_string = create_rules_prefix(rules) + " ".join(filter(None, [narration, battle_res_string]))
 
-        # setting the title of the card that should appear on the phone app
-        card_title = "Battle Simulated"
-
-    session_attributes = {}
+    # the session is left open (with the parsed armies saved) so the user can simulate it again
+    session_attributes = remember_request(session, "SIMULATEBATTLEINTENT", params)
+    # the result becomes the battle the user can reinforce or keep fighting
+    save_battle_state(session_attributes, final_attackers, final_defenders, rules)
     # constructs and returns a completed Alexa response
-    # note: no reprompt text is given because in the course of a game, a battle only runs once
-    return build_response(session_attributes, build_speechlet_response(card_title, battle_res_string, "", True))
+    with stage("response"):
+        if paused:
+            return BATTLE_PAUSED.render(session_attributes, battle_res_string)
+        return BATTLE_SIMULATED.render(session_attributes, battle_res_string)
 
-def battle_probability_handler(intent):
+def battle_probability_handler(intent, session=None):
     intent = intent["slots"]
     # read the number of attackers and defenders from the intent
-    num_attackers, num_defenders = get_num_att_def(intent)
+    with stage("slots"):
+        num_attackers, num_defenders = get_num_att_def(intent)
+    return run_battle_probability({"numAttackers": num_attackers, "numDefenders": num_defenders,
+                                   "rules": get_session_rules(session).name}, session)
 
+def run_battle_probability(params, session=None):
+    """
+    Calculates the odds of the battle described by params and returns the completed response
+    (answers already given in this session are reused rather than recomputed)
+    """
+    num_attackers, num_defenders = params["numAttackers"], params["numDefenders"]
     if num_attackers == NO_INPUT or num_defenders == NO_INPUT or \
         num_attackers == INPUT_NOT_NUMBER or num_defenders == INPUT_NOT_NUMBER:
-        card_title = "Couldn't calculate battle probabilities"
-        prob_res_str = "I'm sorry, I could not understand your request."
+        return build_error_response("Couldn't calculate battle probabilities")
+    rules = find_rules(params.get("rules")) or CLASSIC_RULES
+
+    result_key = make_result_key("CALCULATEPROBABILITYINTENT", params)
+    prob_res_str = find_session_result(session, result_key)
+    if prob_res_str is None:
+        with stage("compute"):
+            # search the probability table for the corresponding probability and expected survivors
+            prob, expected_attackers, expected_defenders = \
+                find_battle_expectations(num_attackers, num_defenders, rules)
+
+            # construct a statement about the probability
+            prob_res_str = create_rules_prefix(rules) + create_prob_res_str(prob)
+            if prob != -1:
+                prob_res_str = prob_res_str + " " + create_average_res_str(expected_attackers, expected_defenders)
+
+            # describe how many armies the attackers are likely to keep (only for battles they can win)
+            if 0 < prob:
+                outcomes = find_battle_outcomes(num_attackers, num_defenders, rules)
+                prob_res_str = prob_res_str + " " + create_survivor_res_str(outcomes)
+
+    session_attributes = remember_request(session, "CALCULATEPROBABILITYINTENT", params, result_key, prob_res_str)
+    save_battle_state(session_attributes, num_attackers, num_defenders, rules)
+    # construct a reply to the user
+    with stage("response"):
+        return PROBABILITY_CALCULATED.render(session_attributes, prob_res_str)
+
+# slots holding the defenders of each territory in a campaign, in the order they are attacked
+CAMPAIGN_DEFENDER_SLOTS = ["defendersOne", "defendersTwo", "defendersThree", "defendersFour"]
+
+def campaign_handler(intent, session=None):
+    intent = intent["slots"]
+    # read the attacking armies and the defenders of each territory (in order) from the intent
+    with stage("slots"):
+        num_attackers = resolve_slot(intent, "numAttackers")
+        defenders = [resolve_slot(intent, slot) for slot in CAMPAIGN_DEFENDER_SLOTS]
+        defenders = [num for num in defenders if num != NO_INPUT]
+    return run_campaign({"numAttackers": num_attackers, "defenders": defenders,
+                         "rules": get_session_rules(session).name}, session)
+
+def run_campaign(params, session=None):
+    """
+    Calculates the odds of conquering every territory in params (in the order given) and the best
+    order to attack them in, and returns the completed response
+    """
+    # the planner uses NumPy, so it is only imported once someone actually plans a campaign
+    from CampaignPlanner import calculate_campaign, find_best_campaign_order, \
+        MAX_CAMPAIGN_ARMIES, MAX_CAMPAIGN_TERRITORIES
+
+    num_attackers, defenders = params["numAttackers"], params["defenders"]
+    if not isinstance(num_attackers, int) or not defenders or \
+        not all(isinstance(num, int) and 0 < num <= MAX_CAMPAIGN_ARMIES for num in defenders):
+        return build_error_response("Couldn't plan campaign")
+    # one army is always left behind, so it takes at least two to attack at all
+    if not 2 <= num_attackers <= MAX_CAMPAIGN_ARMIES or len(defenders) > MAX_CAMPAIGN_TERRITORIES:
+        return build_error_response("Couldn't plan campaign")
+    rules = find_rules(params.get("rules")) or CLASSIC_RULES
+
+    result_key = make_result_key("CAMPAIGNINTENT", params)
+    campaign_res_str = find_session_result(session, result_key)
+    if campaign_res_str is None:
+        with stage("compute"):
+            campaign = calculate_campaign(num_attackers, defenders, rules)
+            best_order, best_campaign = find_best_campaign_order(num_attackers, defenders, rules)
+            campaign_res_str = create_rules_prefix(rules) + \
+                create_campaign_res_str(num_attackers, defenders, campaign, best_order, best_campaign)
+
+    session_attributes = remember_request(session, "CAMPAIGNINTENT", params, result_key, campaign_res_str)
+    with stage("response"):
+        return CAMPAIGN_PLANNED.render(session_attributes, campaign_res_str)
+
+def stop_policy_handler(intent, session=None):
+    intent = intent["slots"]
+    # read the number of attackers and defenders from the intent
+    with stage("slots"):
+        num_attackers, num_defenders = get_num_att_def(intent)
+        # how many armies taking the territory is worth to the player (scaled to the battle if not said)
+        territory_worth = resolve_slot(intent, "territoryWorth")
+    return run_stop_policy({"numAttackers": num_attackers, "numDefenders": num_defenders,
+                            "territoryWorth": territory_worth, "rules": get_session_rules(session).name}, session)
+
+def run_stop_policy(params, session=None):
+    """
+    Works out when the attackers in params should call off their attack (valuing the territory
+    at params["territoryWorth"] armies) and returns the completed response
+    """
+    num_attackers, num_defenders = params["numAttackers"], params["numDefenders"]
+    if not isinstance(num_attackers, int) or not isinstance(num_defenders, int) or \
+        num_attackers < 1 or num_defenders < 1 or \
+        max(num_attackers, num_defenders) > MAX_POLICY_ARMIES:
+        return build_error_response("Couldn't find stopping point")
+    territory_worth = params.get("territoryWorth", NO_INPUT)
+    if territory_worth == NO_INPUT:
+        territory_worth = find_default_territory_worth(num_attackers, num_defenders)
+    elif not isinstance(territory_worth, int) or territory_worth < 1:
+        return build_error_response("Couldn't find stopping point")
+    rules = find_rules(params.get("rules")) or CLASSIC_RULES
+
+    with stage("compute"):
+        policy = find_stop_policy(num_attackers, num_defenders, find_army_value(territory_worth), rules)
+        policy_res_str = create_rules_prefix(rules) + \
+            create_policy_res_str(num_attackers, num_defenders, territory_worth, policy)
+
+    session_attributes = remember_request(session, "STOPPOLICYINTENT", params)
+    with stage("response"):
+        return STOPPING_POINT_FOUND.render(session_attributes, policy_res_str)
+
+def rules_handler(intent, session=None):
+    intent = intent["slots"]
+    # read the name of the rule variant the user wants battles fought under
+    with stage("slots"):
+        rules_name = resolve_slot(intent, "ruleSet")
+    return run_set_rules({"ruleSet": rules_name}, session)
+
+def run_set_rules(params, session=None):
+    """
+    Switches the battles and probabilities in the rest of this session to the rule variant named
+    in params, and returns the completed response
+    """
+    rules = find_rules(params["ruleSet"]) if params["ruleSet"] != NO_INPUT else None
+    if rules is None:
+        res_str = "I don't know those rules. I can use " + ", ".join(sorted(RULE_VARIANTS)) + " rules."
+        with stage("response"):
+            return RULES_NOT_CHANGED.render(get_session_attributes(session), res_str)
+
+    session_attributes = remember_request(session, "SETRULESINTENT", {"ruleSet": rules.name})
+    session_attributes["ruleSet"] = rules.name
+    with stage("response"):
+        return RULES_CHANGED.render(session_attributes, "Battles will now use the " + rules.name + " rules.")
+
+def continue_battle_handler(intent, session=None):
+    intent = intent["slots"]
+    # read how many more rounds to roll (to the end of the battle if not given)
+    with stage("slots"):
+        num_rounds = resolve_slot(intent, "numRounds")
+    return run_continue_battle({"numRounds": num_rounds}, session)
+
+def run_continue_battle(params, session=None):
+    """
+    Carries on the battle saved in this session, for params["numRounds"] more rounds or until one
+    side is defeated, and returns the completed response
+    """
+    battle = get_battle_state(session)
+    if battle is None:
+        return build_no_battle_response(session)
+    num_attackers, num_defenders, rules = battle
+    num_rounds = params["numRounds"]
+    if num_rounds == NO_INPUT:
+        num_rounds = None
+    elif not isinstance(num_rounds, int) or num_rounds < 1:
+        return build_error_response("Couldn't continue battle")
+    if num_attackers <= 1 or num_defenders <= 0:
+        res_str = "That battle is over. You can add attackers or defenders to keep it going."
+        with stage("response"):
+            return BATTLE_CONTINUED.render(get_session_attributes(session), res_str)
+
+    with stage("compute"):
+        final_attackers, final_defenders, rounds_rolled, narration, paused = \
+            fight_battle(num_attackers, num_defenders, rules, num_rounds)
+
+    if paused:
+        res_str = create_paused_res_string(rounds_rolled, final_attackers, final_defenders)
+    elif final_attackers > 1 and final_defenders > 0:
+        res_str = "After " + count_rounds(rounds_rolled, "more") + ", you have " + str(final_attackers) + \
+            " attackers left against " + str(final_defenders) + " defenders."
     else:
-        # search the probability table for the corresponding probability
-        prob = find_battle_probability(num_attackers, num_defenders)
+        res_str = create_battle_res_string(num_attackers, num_defenders, final_attackers, final_defenders)
+    res_str = create_rules_prefix(rules) + " ".join(filter(None, [narration, res_str]))
 
-        # construct a statement about the probability
-        prob_res_str = create_prob_res_str(prob)
+    session_attributes = remember_request(session, "CONTINUEBATTLEINTENT", params)
+    save_battle_state(session_attributes, final_attackers, final_defenders, rules)
+    with stage("response"):
+        if paused:
+            return BATTLE_PAUSED.render(session_attributes, res_str)
+        return BATTLE_CONTINUED.render(session_attributes, res_str)
 
-        # setting the title of the card that should appear on the phone app
-        card_title = "Battle Probability Calculated"
+def reinforce_handler(intent, session=None):
+    intent = intent["slots"]
+    # read how many armies to add, and to which side (the attackers if not said)
+    with stage("slots"):
+        num_armies = resolve_slot(intent, "numArmies")
+        army_type = resolve_slot(intent, "armyType")
+    return run_reinforce({"numArmies": num_armies, "armyType": army_type}, session)
 
-    session_attributes = {}
-    # construct a reply to the user
-    return build_response(session_attributes, build_speechlet_response(card_title, prob_res_str, "", True))
+def run_reinforce(params, session=None):
+    """
+    Adds armies to one side of the battle saved in this session and returns the completed
+    response, describing the new odds
+    """
+    battle = get_battle_state(session)
+    if battle is None:
+        return build_no_battle_response(session)
+    num_attackers, num_defenders, rules = battle
+    num_armies = params["numArmies"]
+    if not isinstance(num_armies, int) or num_armies < 1:
+        return build_error_response("Couldn't add armies")
+
+    if params["armyType"] == DEFENDERS:
+        num_defenders += num_armies
+    else:
+        num_attackers += num_armies
+
+    res_str = "You now have " + str(num_attackers) + " attackers against " + str(num_defenders) + " defenders."
+    if num_defenders > 0 and num_attackers > 1:
+        with stage("compute"):
+            prob = find_battle_probability(num_attackers, num_defenders, rules)
+        if prob != -1:
+            res_str = res_str + " " + create_prob_res_str(prob)
+
+    session_attributes = remember_request(session, "REINFORCEINTENT", params)
+    save_battle_state(session_attributes, num_attackers, num_defenders, rules)
+    with stage("response"):
+        return ARMIES_ADDED.render(session_attributes, create_rules_prefix(rules) + res_str)
+
+def odds_now_handler(intent, session=None):
+    return run_odds_now({}, session)
+
+def run_odds_now(params, session=None):
+    """
+    Answers the odds of the battle saved in this session (reusing any distribution already
+    computed for it), and returns the completed response
+    """
+    battle = get_battle_state(session)
+    if battle is None:
+        return build_no_battle_response(session)
+    num_attackers, num_defenders, rules = battle
+    if num_attackers <= 1 or num_defenders <= 0:
+        res_str = "That battle is over. You can add attackers or defenders to keep it going."
+        with stage("response"):
+            return PROBABILITY_CALCULATED.render(get_session_attributes(session), res_str)
+    return run_battle_probability({"numAttackers": num_attackers, "numDefenders": num_defenders,
+                                   "rules": rules.name}, session)
+
+def build_no_battle_response(session):
+    """
+    Returns a response telling the user there is no battle in this session to follow up on
+    """
+    with stage("response"):
+        return NO_BATTLE.render(get_session_attributes(session),
+                                "There's no battle going on yet. Simulate a battle or ask for its odds first.")
+
+def build_error_response(card_title):
+    """
+    Returns a response telling the user their request couldn't be understood (this ends the
+    session, since there is nothing worth repeating)
+    """
+    with stage("response"):
+        return get_error_response(card_title)
+
+@lru_cache(maxsize=32)
+def get_error_response(card_title):
+    """
+    Builds each distinct error response once (they are never modified, so they can be shared)
+    """
+    return build_static_response(card_title, "I'm sorry, I could not understand your request.", "", True)
 
 # giving several possible phrases for variety (note, these are only given if the user asks for them)
 POS_REC_PHRASES = ["I suggest you attack.", "The odds are in favor of attacking.", "You are likely to win."]
@@ -73,102 +397,263 @@ def create_prob_res_str(prob, recommendation=False):
     """
     prob_string = ""
     if prob == -1:
-        prob_string = "This function can only predict battles between 10 or fewer units on each side. In general, attackers have advantage at higher army numbers."
+        prob_string = "This function can only predict battles of " + str(MAX_EXACT_ARMIES) + " or fewer units on each side. In general, attackers have advantage at higher army numbers."
     else:
-        prob_string = "Attackers have a " + str(prob * 100) + " percent chance of winning the battle."
+        prob_string = "Attackers have a " + str(round(prob * 100, 1)) + " percent chance of winning the battle."
 
     # add a recommendation if the user wants one
     if recommendation:
         if prob > .6:
-            prob_string = prob_string + POS_REC_PHRASES[randint(0, len(POS_REC_PHRASES)-1)]
+            prob_string = prob_string + get_stream().choice(POS_REC_PHRASES)
         elif .4 <= prob <= .6:
-            prob_string = prob_string + MID_REC_PHRASES[randint(0, len(MID_REC_PHRASES)-1)]
+            prob_string = prob_string + get_stream().choice(MID_REC_PHRASES)
         else:
-            prob_string = prob_string + NEG_REC_PHRASES[randint(0, len(NEG_REC_PHRASES)-1)]
+            prob_string = prob_string + get_stream().choice(NEG_REC_PHRASES)
 
     return prob_string
+def create_survivor_res_str(outcomes):
+    """
+    returns a string describing the range of armies the attackers will most likely keep if they win
+    """
+    # the middle half of the winning outcomes (attackers need at least 2 armies to have won)
+    low = find_survivor_percentile(outcomes["attacker_survivors"], .25, 2)
+    high = find_survivor_percentile(outcomes["attacker_survivors"], .75, 2)
+    if low == high:
+        return "If you win, you'll most likely keep " + str(low) + " armies."
+    return "If you win, you'll most likely keep " + str(low) + " to " + str(high) + " armies."
+def create_average_res_str(expected_attackers, expected_defenders):
+    """
+    returns a string describing how many armies each side has left on average once the battle is over
+    """
+    return "On average, the battle ends with about " + count_armies(int(round(expected_attackers)), ATTACKER_NAMES) + \
+        " and " + count_armies(int(round(expected_defenders)), DEFENDER_NAMES) + " left."
+def create_campaign_res_str(num_attackers, defenders, campaign, best_order, best_campaign):
+    """
+    returns a string describing the odds of a campaign, and a better order to attack in if there is one
+    """
+    res_str = "Attacking with " + str(num_attackers) + " armies, you have a " + \
+        str(round(campaign["success_probability"] * 100, 1)) + " percent chance of taking all " + \
+        str(len(defenders)) + " territories"
+    if campaign["success_probability"] > 0:
+        res_str = res_str + ", ending with about " + str(int(round(campaign["expected_armies"]))) + " armies"
+    res_str = res_str + "."
+
+    # only suggest a different order if it makes a noticeable difference
+    if best_campaign["success_probability"] - campaign["success_probability"] >= .001:
+        res_str = res_str + " Your best order is " + ", ".join(str(num) for num in best_order) + \
+            " defenders, which gives you a " + str(round(best_campaign["success_probability"] * 100, 1)) + \
+            " percent chance."
+    return res_str
+
+def create_rules_prefix(rules):
+    """
+    returns a phrase naming the rule variant a result was found with (nothing for the classic rules)
+    """
+    if rules == CLASSIC_RULES:
+        return ""
+    return "Using the " + rules.name + " rules. "
+
+def create_policy_res_str(num_attackers, num_defenders, territory_worth, policy):
+    """
+    returns a string describing when to stop attacking, and how the battle goes if the user does
+    """
+    res_str = "Counting the territory as worth " + count_armies(territory_worth) + ", "
+    if not policy["attack"]:
+        return res_str + "with " + count_armies(num_attackers, ATTACKER_NAMES) + " against " + \
+            count_armies(num_defenders, DEFENDER_NAMES) + ", you are better off not attacking and keeping your armies."
+
+    res_str = res_str + "keep attacking " + count_armies(num_defenders, DEFENDER_NAMES)
+    if policy["stop_at"] > 1:
+        res_str = res_str + " until you are down to " + count_armies(policy["stop_at"])
+    res_str = res_str + ", and stop sooner if the defenders get lucky. Playing this way, you have a " + \
+        str(round(policy["win_probability"] * 100, 1)) + " percent chance of winning, and keep about " + \
+        count_armies(int(round(policy["expected_attackers"]))) + " on average."
+    return res_str
+
 # ---------------Helper functions that should not be used outside of this file---------------
 # (generally listed in the order in which they would be called)
 
 
+# the (one, many) names count_armies reads armies out with
+ARMY_NAMES = ("army", "armies")
+ATTACKER_NAMES = ("attacker", "attackers")
+DEFENDER_NAMES = ("defender", "defenders")
+
+def count_armies(num_armies, names=ARMY_NAMES):
+    """
+    Returns a number of armies as it is read out ("1 army", "5 armies", "1 defender")
+    """
+    return str(num_armies) + " " + (names[0] if num_armies == 1 else names[1])
+
 def get_num_att_def(intent):
     """
     Reads the number of attackers and defenders from an intent, and returns them in an ordered pair"
     """
-    # Determines in which order the user listed attackers and defenders
-    # Establish defaults
-    num_party_one, num_party_two = NO_INPUT, NO_INPUT
-    party1Type, party2Type = "attackers", "defenders"
-    # Look into slots and pull only ones that are polulated
-    if "numPartyOne" in intent and "value" in intent["numPartyOne"]:
-        num_party_one = process_num(intent["numPartyOne"]["value"])
-    if "numPartyTwo" in intent and "value" in intent["numPartyTwo"]:
-        num_party_two = process_num(intent["numPartyTwo"]["value"])
-    if "partyOneType" in intent and "value" in intent["partyOneType"]:
-        party1Type = process_type(intent["partyOneType"]["value"])
-    if "partyTwoType" in intent and "value" in intent["partyTwoType"]:
-        party2Type = process_type(intent["partyTwoType"]["value"])
-
-    # Attacker / Defender Keywords (to match custom type)
-    attacker_keywords = {"attacker", "attacking", "attackers"}
-    defender_keywords = {"defender", "defending", "defenders"}
+    # Look into slots (missing ones come back as NO_INPUT, and types are normalized to
+    # ATTACKERS / DEFENDERS by the slot index)
+    num_party_one = resolve_slot(intent, "numPartyOne")
+    num_party_two = resolve_slot(intent, "numPartyTwo")
 
+    # Determines in which order the user listed attackers and defenders
     # default behavior for this statement is attackers first, then defenders second
-    if party1Type in defender_keywords:
+    if resolve_slot(intent, "partyOneType") == DEFENDERS:
         return num_party_two, num_party_one
     else:
         return num_party_one, num_party_two
 
-def simulate_battle(num_attackers, num_defenders):
+def get_session_rules(session):
+    """
+    Returns the rule variant picked earlier in this session (the classic rules if there isn't one)
+    """
+    return find_rules(get_session_attributes(session).get("ruleSet")) or CLASSIC_RULES
+
+def get_battle_state(session):
+    """
+    Returns the (attackers, defenders, rules) of the battle this session is following, or None
+    if it hasn't simulated or asked about one yet
+    """
+    battle = get_session_attributes(session).get("battle")
+    if not battle:
+        return None
+    return battle[0], battle[1], find_rules(battle[2]) or CLASSIC_RULES
+
+def save_battle_state(session_attributes, num_attackers, num_defenders, rules):
+    """
+    Saves the battle this session is following in the response's session attributes
+    """
+    session_attributes["battle"] = [num_attackers, num_defenders, rules.name]
+
+def fight_battle(num_attackers, num_defenders, rules=CLASSIC_RULES, max_rounds=None,
+                 time_budget=None):
     """
-    simulates the entirety of a battle until the one side is defeated
+    simulates a battle for a response, narrating it as it goes (large battles skip the individual
+    dice, which gives the same odds much faster), for at most max_rounds rounds if given
+    stops early once time_budget seconds (BATTLE_TIME_BUDGET by default) have passed, so a response
+    never waits on a long battle
+    returns the remaining attackers, defenders, rounds rolled, the narration, and whether the
+    battle was cut short by the time budget
+    """
+    mode = DICE_MODE
+    if num_attackers + num_defenders > FAST_SIMULATION_ARMIES:
+        mode = JUMP_MODE
+    narrator = BattleNarrator(num_attackers, num_defenders)
+    if time_budget is None:
+        time_budget = BATTLE_TIME_BUDGET
+    deadline = time.perf_counter() + time_budget
+    num_rounds = 0
+    for num_rounds, num_attackers, num_defenders in \
+            battle_events(num_attackers, num_defenders, mode, rules, max_rounds):
+        narrator.add(num_rounds, num_attackers, num_defenders)
+        if time.perf_counter() > deadline:
+            break
+    paused = num_attackers > 1 and num_defenders > 0 and num_rounds != max_rounds
+    return num_attackers, num_defenders, num_rounds, narrator.describe(), paused
+
+def simulate_battle(num_attackers, num_defenders, mode=DICE_MODE, rules=CLASSIC_RULES, max_rounds=None):
+    """
+    simulates the entirety of a battle until the one side is defeated (or max_rounds rounds have
+    been rolled, if given)
     returns the number of remaining attackers, defenders and turns taken
+    mode picks how rounds are played out (DICE_MODE, SAMPLED_MODE or JUMP_MODE), every mode
+    gives statistically identical results
+    rules is the BattleRules variant the battle is fought under
+    """
+    num_rounds = 0
+    for num_rounds, num_attackers, num_defenders in \
+            battle_events(num_attackers, num_defenders, mode, rules, max_rounds):
+        pass
+    return num_attackers, num_defenders, num_rounds
+
+def battle_events(num_attackers, num_defenders, mode=DICE_MODE, rules=CLASSIC_RULES, max_rounds=None):
+    """
+    plays out a battle the same way as simulate_battle, one step at a time
+    yields (rounds rolled so far, remaining attackers, remaining defenders) after every round, so
+    callers can narrate the battle or stop partway; in JUMP_MODE the full strength rounds at the
+    start are skipped through in bulk, and come out as a single step
     """
     # Tracker for the number of rounds needed to do the battle (just for funsies)
     num_rounds = 0
+    if mode == JUMP_MODE:
+        num_attackers, num_defenders, num_rounds = jump_full_strength_rounds(num_attackers, num_defenders,
+                                                                             rules, max_rounds)
+        if num_rounds > 0:
+            yield num_rounds, num_attackers, num_defenders
 
     # note, we include the attacker that is "left behind" in our calculations to better represent
     # how calculations would be done by hand
     # Each iteration of the while loop represents an individual "battle" / "dice roll"
-    while num_attackers > 1 and num_defenders > 0:
+    while num_attackers > 1 and num_defenders > 0 and num_rounds != max_rounds:
         num_rounds += 1
-
-        attacker_rolls, defender_rolls = [], []
-
-        # including checks for the special cases where attackers / defenders have less than full
-        # strength
-        if num_attackers > 3:
-            attacker_rolls = generate_battle_rolls(3)
+        if mode == DICE_MODE:
+            attacker_losses, defender_losses = roll_round_losses(num_attackers, num_defenders, rules)
         else:
-            attacker_rolls = generate_battle_rolls(num_attackers - 1)
-
-        if num_defenders > 2:
-            defender_rolls = generate_battle_rolls(2)
-        else:
-            defender_rolls = generate_battle_rolls(num_defenders)
-
-
-        # sorting the rolls so we can compare the two highest rolls
-        attacker_rolls.sort()
-        defender_rolls.sort()
-
-        # number of wins is measures from the attackers perspective
-        # a "fight" in this instance is the comparison between two dice rolls
-        wins, num_fights = 0, min(min(num_attackers -1, 3), min(num_defenders, 2))
-        for i in range(num_fights):
-            if attacker_rolls[i] > defender_rolls[i]:
-                wins += 1
+            attacker_losses, defender_losses = sample_round_losses(num_attackers, num_defenders, rules)
 
         # recalculating the number of attackers and defenders after the fight
-        num_attackers, num_defenders = num_attackers - (num_fights - wins), num_defenders - wins
-
-    return num_attackers, num_defenders, num_rounds
+        num_attackers, num_defenders = num_attackers - attacker_losses, num_defenders - defender_losses
+        yield num_rounds, num_attackers, num_defenders
 
-def generate_battle_rolls(num_rolls):
+def roll_round_losses(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    rolls and compares every die of a single round
+    returns the number of attackers and defenders lost
     """
-    Returns an array representing all the dice rolls by one side in a battle
+    # including checks for the special cases where attackers / defenders have less than full
+    # strength
+    num_attack_dice, num_defend_dice = rules.get_dice_counts(num_attackers, num_defenders)
+
+    # the rolls come back sorted highest first so we can compare the highest rolls
+    attacker_rolls = rules.roll_attack(num_attack_dice)
+    defender_rolls = rules.roll_defense(num_defend_dice)
+
+    # number of wins is measures from the attackers perspective
+    # a "fight" in this instance is the comparison between two dice rolls
+    wins, num_fights = 0, min(num_attack_dice, num_defend_dice)
+    for i in range(num_fights):
+        if not rules.attacker_loses(attacker_rolls[i], defender_rolls[i]):
+            wins += 1
+    return num_fights - wins, wins
+
+# jumping ahead is only worth a multinomial draw if it skips at least this many rounds
+MIN_JUMP_ROUNDS = 4
+
+def jump_full_strength_rounds(num_attackers, num_defenders, rules=CLASSIC_RULES, max_rounds=None):
+    """
+    While both sides are guaranteed to roll every die, each round is an independent draw from the
+    same outcome distribution, so the losses over k rounds follow a multinomial distribution.
+    Repeatedly samples as many of these rounds as are safe at once, never more than max_rounds in
+    total if given (requires NumPy, and just returns the battle as-is if it isn't available)
+    returns the number of remaining attackers, defenders and rounds skipped
+    """
+    try:
+        rng = get_stream().numpy_generator()
+    except ImportError:
+        return num_attackers, num_defenders, 0
+
+    outcomes = get_round_outcomes(rules.attack_dice, rules.defend_dice, rules)
+    probs = [prob for _, _, prob in outcomes]
+    num_fights = min(rules.attack_dice, rules.defend_dice)
+    num_rounds = 0
+    while True:
+        # each round takes num_fights armies, so this many rounds keep both sides at full strength
+        safe_rounds = min((num_attackers - 1 - rules.attack_dice) // num_fights,
+                          (num_defenders - rules.defend_dice) // num_fights) + 1
+        if max_rounds is not None:
+            safe_rounds = min(safe_rounds, max_rounds - num_rounds)
+        if safe_rounds < MIN_JUMP_ROUNDS:
+            return num_attackers, num_defenders, num_rounds
+        counts = rng.multinomial(safe_rounds, probs)
+        for (attacker_losses, defender_losses, _), count in zip(outcomes, counts):
+            num_attackers -= attacker_losses * int(count)
+            num_defenders -= defender_losses * int(count)
+        num_rounds += safe_rounds
+
+def create_paused_res_string(num_rounds, num_attackers, num_defenders):
     """
-    return [randint(1, 6) for _ in range(num_rolls)]
+    creates a string describing a battle that was cut short by the time budget
+    """
+    return "The battle is still going after " + count_rounds(num_rounds) + ", with " + str(num_attackers) + \
+        " attackers against " + str(num_defenders) + " defenders. Say keep attacking to see how it ends."
 
 def create_battle_res_string(init_attackers, init_defenders, final_attackers, final_defenders):
     """
@@ -180,57 +665,46 @@ def create_battle_res_string(init_attackers, init_defenders, final_attackers, fi
         return "The defenders survived a battle of " + str(init_attackers) + " vs " + str(init_defenders) + " with " + str(final_defenders)+ " remaining."
 
 
-def find_battle_probability(num_attackers, num_defenders):
+def find_battle_probability(num_attackers, num_defenders, rules=CLASSIC_RULES):
     """
-    Takes in a number of attackers and defenders (from 1-10)
+    Takes in a number of attackers and defenders (and optionally the rule variant)
     Returns the probability that the defenders will be defeated before attackers are forced to stop
-    returns -1 if the number of armies is outside the bounds of the chart
-    (may be adapted later to include full probability calculations)
+    returns -1 if the number of armies is negative or too large for the exact engine
     note this method adjusts for the attacker that must be left behind
     """
-    if num_attackers > 12 or num_attackers <= 1 or  num_defenders > 11 or num_defenders < 1:
+    return find_battle_expectations(num_attackers, num_defenders, rules)[0]
+
+def find_battle_expectations(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Takes in a number of attackers and defenders (and optionally the rule variant)
+    Returns the probability that the attackers win, and the expected number of attackers and
+    defenders left when the battle is over (from a single lookup when the saved table covers it)
+    returns (-1, 0, 0) if the number of armies is negative or too large for the exact engine
+    """
+    if num_attackers < 0 or num_defenders < 0 or \
+        num_attackers > MAX_EXACT_ARMIES or num_defenders > MAX_EXACT_ARMIES:
+        return -1, 0.0, 0.0
+    # the saved table only covers the classic rules
+    if rules == CLASSIC_RULES:
+        stats = find_battle_stats(num_attackers, num_defenders)
+        if stats is not None:
+            return stats
+    # otherwise the outcome distribution (which the survivor range needs anyway, and which is
+    # cached) has all three, and is much faster than growing the engine's tables
+    outcomes = find_battle_outcomes(num_attackers, num_defenders, rules)
+    return outcomes["win_probability"], outcomes["expected_attackers"], outcomes["expected_defenders"]
+
+@lru_cache(maxsize=32)
+def find_battle_outcomes(num_attackers, num_defenders, rules=CLASSIC_RULES):
+    """
+    Takes in a number of attackers and defenders (and optionally the rule variant)
+    Returns the full outcome distribution of the battle (see BattleOdds.calculate_outcome_distribution)
+    including the chance of each number of survivors, expected survivors and expected rounds
+    (results are cached for warm invocations, so callers must not modify them)
+    returns -1 if the number of armies is negative or too large for the exact engine
+    """
+    if num_attackers < 0 or num_defenders < 0 or \
+        num_attackers > MAX_EXACT_ARMIES or num_defenders > MAX_EXACT_ARMIES:
         return -1
     else:
-        return PROB_CHART[num_attackers - 2][num_defenders - 1]
-
-# Taken from Jason A. Osborne's paper: http://www4.stat.ncsu.edu/~jaosborn/research/RISK.pdf
-# x -> attackers, y -> defenders
-PROB_CHART = [
-    [0.417, 0.106, 0.027, 0.007, 0.002, 0.000, 0.000, 0.000, 0.000, 0.000],
-    [0.754, 0.363, 0.206, 0.091, 0.049, 0.021, 0.011, 0.005, 0.003, 0.001],
-    [0.916, 0.656, 0.470, 0.315, 0.206, 0.134, 0.084, 0.054, 0.033, 0.021],
-    [0.972, 0.785, 0.642, 0.477, 0.359, 0.253, 0.181, 0.123, 0.086, 0.057],
-    [0.990, 0.890, 0.769, 0.638, 0.506, 0.397, 0.297, 0.224, 0.162, 0.118],
-    [0.997, 0.934, 0.857, 0.745, 0.638, 0.521, 0.423, 0.329, 0.258, 0.193],
-    [0.999, 0.967, 0.910, 0.834, 0.736, 0.640, 0.536, 0.446, 0.357, 0.287],
-    [1.000, 0.980, 0.947, 0.888, 0.818, 0.730, 0.643, 0.547, 0.464, 0.380],
-    [1.000, 0.990, 0.967, 0.930, 0.873, 0.808, 0.726, 0.646, 0.558, 0.480],
-    [1.000, 0.994, 0.981, 0.954, 0.916, 0.861, 0.800, 0.724, 0.650, 0.568]
-]
-
-# method to convert an intent value into an integer, and trap errors
-def process_num(num):
-    """
-    Attempts to convert the provided num (as a string) into an integer
-    if the input is "?" (what Alexa passes if there is no input), return NO_INPUT
-    if the input errors when attempting to convert to an intger, return INPUT_NOT_NUMBER
-    otherwise, return the number converted to an int
-    """
-    if num != "?" and num != None:
-        try:
-            num = int(num)
-        except ValueError:
-            return INPUT_NOT_NUMBER
-        return num
-    return NO_INPUT
-
-# method to convert an intent value into a type, and trap errors
-def process_type(type):
-    """
-    Attempts to validate the provided type (as a string)
-    if the input is "?" (what Alexa passes if there is no input), return NO_INPUT
-    otherwise, return the type as-is
-    """
-    if type != "?" and type != None:
-        return type
-    return NO_INPUT
+        return calculate_outcome_distribution(num_attackers, num_defenders, rules)
@@ -0,0 +1,60 @@
+"""
+Session level memory for the Game Helper skill
+
+Alexa hands back whatever sessionAttributes a response sets on the next request of the same
+session, so the parsed parameters of the last request (and a few computed answers) are kept there.
+That lets "again" / "repeat" follow-ups skip slot parsing, and lets repeated questions skip
+recomputing their answer entirely.
+"""
+# most computed answers kept in a single session (oldest are dropped first)
+MAX_SESSION_RESULTS = 8
+
+# reprompt given when the session is left open for a follow-up
+FOLLOW_UP_REPROMPT = "You can say again to repeat that, or stop to finish."
+
+def get_session_attributes(session):
+    """
+    Returns the attributes saved by the previous response in this session (empty if there are none)
+    """
+    if not session:
+        return {}
+    return session.get("attributes") or {}
+
+def get_last_request(session):
+    """
+    Returns the intent name and parsed parameters of the last request answered in this session
+    returns None, None if nothing has been answered yet
+    """
+    attributes = get_session_attributes(session)
+    return attributes.get("lastIntent"), attributes.get("lastParams")
+
+def find_session_result(session, key):
+    """
+    Returns the answer saved in this session under key, or None if it isn't there
+    """
+    for saved_key, result in get_session_attributes(session).get("results", []):
+        if saved_key == key:
+            return result
+    return None
+
+def remember_request(session, intent_name, params, result_key=None, result=None):
+    """
+    Returns the session attributes for a response: the previous attributes, updated with the
+    request that was just answered and (optionally) its answer saved under result_key
+    """
+    attributes = dict(get_session_attributes(session))
+    attributes["lastIntent"] = intent_name
+    attributes["lastParams"] = params
+
+    # results are stored as [key, answer] pairs, oldest first, so they survive the trip through JSON
+    results = [pair for pair in attributes.get("results", []) if pair[0] != result_key]
+    if result_key is not None:
+        results.append([result_key, result])
+    attributes["results"] = results[-MAX_SESSION_RESULTS:]
+    return attributes
+
+def make_result_key(intent_name, params):
+    """
+    Returns a key that identifies an intent asked with a particular set of parameters
+    """
+    return intent_name + ":" + ":".join(str(params[name]) for name in sorted(params))
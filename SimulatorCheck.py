@@ -0,0 +1,322 @@
+"""
+Statistical regression check for the battle and dice simulators of Game Helper
+
+Runs every simulator at scale across a process pool and compares the frequencies it produces with
+the exact distributions from BattleOdds and DiceOdds, using a chi-square test (over the possible
+outcomes, pooled so every bin expects at least MIN_EXPECTED_COUNT) and a Kolmogorov-Smirnov test
+(over the outcomes in order, which is conservative for discrete outcomes). It also reports how
+many battles or dice each simulator gets through per second, so a change that speeds a simulator
+up can be shown not to have changed its odds:
+    python SimulatorCheck.py --save-baseline
+    python SimulatorCheck.py
+Exits with an error if any simulator disagrees with the exact odds at the --alpha level.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+
+from BattleOdds import calculate_outcome_distribution
+from BattleRules import find_rules
+from Benchmark import format_change
+from DiceLogic import roll_dice
+from DiceOdds import dice_pmf
+from RandomStreams import new_seed, start_stream
+from RiskLogic import simulate_battle, DICE_MODE, SAMPLED_MODE, JUMP_MODE
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator_baseline.json")
+
+# battles simulated with BatchSimulator rather than simulate_battle
+BATCH_MODE = "BATCH_MODE"
+
+# (label, mode, attackers, defenders, rules name) of every battle simulator checked, covering each
+# simulation mode and each kind of rule change
+BATTLE_CASES = [
+    ("dice classic 4v3", DICE_MODE, 4, 3, "classic"),
+    ("dice classic 12v10", DICE_MODE, 12, 10, "classic"),
+    ("sampled classic 12v10", SAMPLED_MODE, 12, 10, "classic"),
+    ("jump classic 40v30", JUMP_MODE, 40, 30, "classic"),
+    ("batch classic 40v30", BATCH_MODE, 40, 30, "classic"),
+    ("dice capital 12v8", DICE_MODE, 12, 8, "capital"),
+    ("jump attacker ties 30v30", JUMP_MODE, 30, 30, "attacker ties"),
+    ("dice three defenders 12v10", DICE_MODE, 12, 10, "three defenders"),
+    ("batch eight sided defense 20v15", BATCH_MODE, 20, 15, "eight sided defense")
+]
+
+# (label, number of dice, sides, modifier) of every dice roll checked, including one large enough
+# for roll_dice to draw the sum from its normal approximation
+DICE_CASES = [
+    ("1d20+2", 1, 20, 2),
+    ("3d6", 3, 6, 0),
+    ("10d10-3", 10, 10, -3),
+    ("150d6", 150, 6, 0)
+]
+
+# chi-square bins are pooled until they expect at least this many results
+MIN_EXPECTED_COUNT = 5
+
+# number of pieces each case's samples are split into for the workers
+CHUNKS_PER_CASE = 16
+
+# --------------- Running the simulators ---------------
+
+def run_battle_chunk(mode, num_attackers, num_defenders, rules_name, count, seed):
+    """
+    Simulates count battles (in a pool worker) and returns a dictionary of
+    (remaining attackers, remaining defenders) -> number of battles that ended that way
+    """
+    rules = find_rules(rules_name)
+    if mode == BATCH_MODE:
+        # NumPy is only needed for the batched simulator
+        import numpy
+        from BatchSimulator import simulate_battles
+        attackers, defenders, _ = simulate_battles(num_attackers, num_defenders, count,
+                                                   numpy.random.default_rng(seed), rules)
+        return dict(Counter(zip(attackers.tolist(), defenders.tolist())))
+
+    start_stream(seed)
+    outcomes = Counter()
+    for _ in range(count):
+        attackers, defenders, _ = simulate_battle(num_attackers, num_defenders, mode, rules)
+        outcomes[(attackers, defenders)] += 1
+    return dict(outcomes)
+
+def run_dice_chunk(num_dice, num_sides, modifier, count, seed):
+    """
+    Rolls the dice count times (in a pool worker) and returns a dictionary of total -> number of rolls
+    """
+    start_stream(seed)
+    return dict(Counter(roll_dice(num_dice, num_sides, modifier) for _ in range(count)))
+
+def run_case(pool, chunk_function, case_args, num_samples, rng):
+    """
+    Splits num_samples between the workers, each with its own seed drawn from rng
+    returns the combined outcome counts and the seconds taken
+    """
+    chunk_size = -(-num_samples // CHUNKS_PER_CASE)
+    start = time.perf_counter()
+    futures = []
+    for first in range(0, num_samples, chunk_size):
+        count = min(chunk_size, num_samples - first)
+        futures.append(pool.submit(chunk_function, *(case_args + (count, rng.getrandbits(32)))))
+    outcomes = Counter()
+    for future in futures:
+        outcomes.update(future.result())
+    return outcomes, time.perf_counter() - start
+
+# --------------- Exact distributions ---------------
+
+def exact_battle_outcomes(num_attackers, num_defenders, rules):
+    """
+    Returns a dictionary of (remaining attackers, remaining defenders) -> exact probability
+    """
+    distribution = calculate_outcome_distribution(num_attackers, num_defenders, rules)
+    outcomes = {}
+    for attackers, prob in enumerate(distribution["attacker_survivors"]):
+        if attackers > 1 and prob > 0:
+            outcomes[(attackers, 0)] = prob
+    for defenders, prob in enumerate(distribution["defender_survivors"]):
+        if defenders > 0 and prob > 0:
+            outcomes[(1, defenders)] = prob
+    return outcomes
+
+def exact_dice_outcomes(num_dice, num_sides, modifier):
+    """
+    Returns a dictionary of total -> exact probability
+    """
+    return dict((total, dice_pmf(num_dice, num_sides, total, modifier))
+                for total in range(num_dice + modifier, num_dice * num_sides + modifier + 1))
+
+def battle_order(outcome):
+    """
+    Orders battle outcomes from the worst for the attackers (every defender left) to the best
+    """
+    attackers, defenders = outcome
+    return attackers - defenders
+
+# --------------- Statistical tests ---------------
+
+def chi_square_test(observed, expected_probs):
+    """
+    Returns the chi-square statistic, degrees of freedom and p-value of the observed counts against
+    the expected probabilities (outcomes taken in order, with neighbouring outcomes pooled so each
+    bin expects at least MIN_EXPECTED_COUNT); an outcome that should be impossible fails outright
+    """
+    total = sum(observed.values())
+    if any(outcome not in expected_probs for outcome in observed):
+        return float("inf"), 0, 0.0
+
+    bins, observed_bin, expected_bin = [], 0, 0.0
+    for outcome, prob in expected_probs.items():
+        observed_bin += observed.get(outcome, 0)
+        expected_bin += prob * total
+        if expected_bin >= MIN_EXPECTED_COUNT:
+            bins.append((observed_bin, expected_bin))
+            observed_bin, expected_bin = 0, 0.0
+    # whatever is left over joins the last bin
+    if bins and expected_bin > 0:
+        last_observed, last_expected = bins.pop()
+        bins.append((last_observed + observed_bin, last_expected + expected_bin))
+    if len(bins) < 2:
+        return 0.0, 0, 1.0
+
+    statistic = sum((obs - exp) ** 2 / exp for obs, exp in bins)
+    degrees = len(bins) - 1
+    return statistic, degrees, chi_square_sf(statistic, degrees)
+
+def ks_test(observed, expected_probs):
+    """
+    Returns the Kolmogorov-Smirnov statistic (largest gap between the observed and expected
+    cumulative distributions, outcomes taken in order) and its asymptotic p-value
+    """
+    total = float(sum(observed.values()))
+    gap, observed_cdf, expected_cdf = 0.0, 0.0, 0.0
+    for outcome, prob in expected_probs.items():
+        observed_cdf += observed.get(outcome, 0) / total
+        expected_cdf += prob
+        gap = max(gap, abs(observed_cdf - expected_cdf))
+    root = math.sqrt(total)
+    return gap, kolmogorov_sf((root + 0.12 + 0.11 / root) * gap)
+
+def chi_square_sf(statistic, degrees):
+    """
+    Returns the chance of a chi-square statistic at least this large, which is the regularized
+    upper incomplete gamma function Q(degrees / 2, statistic / 2)
+    """
+    a, x = degrees / 2.0, statistic / 2.0
+    if x <= 0:
+        return 1.0
+    scale = math.exp(-x + a * math.log(x) - math.lgamma(a))
+    if x < a + 1:
+        # the series for the lower part converges quickly here
+        term = total = 1.0 / a
+        n = a
+        while term > total * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * scale)
+
+    # otherwise the continued fraction for the upper part does (modified Lentz's method)
+    tiny = 1e-300
+    b = x + 1 - a
+    c, d = 1.0 / tiny, 1.0 / b
+    fraction = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = b + an / c
+        c = c if abs(c) > tiny else tiny
+        fraction *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return fraction * scale
+
+def kolmogorov_sf(value):
+    """
+    Returns the chance the Kolmogorov distribution is at least value
+    """
+    if value < 0.2:
+        return 1.0
+    total = sum((-1) ** (k - 1) * math.exp(-2 * k * k * value * value) for k in range(1, 101))
+    return min(1.0, max(0.0, 2 * total))
+
+# --------------- Running the check ---------------
+
+def check_case(label, outcomes, exact, seconds, units, alpha):
+    """
+    Returns the result row of one case
+    """
+    statistic, degrees, chi_p = chi_square_test(outcomes, exact)
+    gap, ks_p = ks_test(outcomes, exact)
+    return {
+        "label": label,
+        "samples": sum(outcomes.values()),
+        "chi_square": statistic,
+        "degrees": degrees,
+        "chi_p": chi_p,
+        "ks": gap,
+        "ks_p": ks_p,
+        "per_sec": units / seconds,
+        "passed": chi_p >= alpha and ks_p >= alpha
+    }
+
+def run_check(num_samples, seed, alpha, workers=None):
+    """
+    Checks every battle and dice case and returns a list of result rows
+    """
+    rng = Random(seed)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for label, mode, num_attackers, num_defenders, rules_name in BATTLE_CASES:
+            outcomes, seconds = run_case(pool, run_battle_chunk,
+                                         (mode, num_attackers, num_defenders, rules_name), num_samples, rng)
+            exact = exact_battle_outcomes(num_attackers, num_defenders, find_rules(rules_name))
+            exact = dict((outcome, exact[outcome]) for outcome in sorted(exact, key=battle_order))
+            results.append(check_case(label, outcomes, exact, seconds, num_samples, alpha))
+            results[-1]["unit"] = "battles"
+
+        for label, num_dice, num_sides, modifier in DICE_CASES:
+            outcomes, seconds = run_case(pool, run_dice_chunk, (num_dice, num_sides, modifier), num_samples, rng)
+            exact = exact_dice_outcomes(num_dice, num_sides, modifier)
+            results.append(check_case(label, outcomes, exact, seconds, num_samples * num_dice, alpha))
+            results[-1]["unit"] = "dice"
+    return results
+
+def print_report(results, baseline):
+    """
+    Prints one line per case, with the change in throughput from the baseline if given
+    """
+    print("{:<34}{:>10}{:>16}{:>10}{:>10}{:>10}{:>24}  {}".format(
+        "case", "samples", "chi_square/df", "chi_p", "ks", "ks_p", "per_sec", "result"))
+    for result in results:
+        previous = baseline.get(result["label"], {}).get("per_sec")
+        print("{:<34}{:>10}{:>16}{:>10.4f}{:>10.5f}{:>10.4f}{:>24}  {}".format(
+            result["label"], result["samples"],
+            "{:.1f}/{}".format(result["chi_square"], result["degrees"]), result["chi_p"],
+            result["ks"], result["ks_p"],
+            "{:.0f} {}".format(result["per_sec"], result["unit"]) + format_change(result["per_sec"], previous),
+            "ok" if result["passed"] else "FAILED"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the simulators against the exact odds, and time them")
+    parser.add_argument("--samples", type=int, default=50000, help="battles or rolls per case")
+    parser.add_argument("--alpha", type=float, default=0.001, help="p-value below which a case fails")
+    parser.add_argument("--seed", type=int, help="seed for the simulations (random if not given)")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to one per CPU)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="save these throughputs as the new baseline")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    seed = new_seed() if args.seed is None else args.seed
+    results = run_check(args.samples, seed, args.alpha, args.workers)
+    print_report(results, baseline)
+    print("seed " + str(seed))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(dict((result["label"], {"per_sec": result["per_sec"]}) for result in results),
+                      baseline_file, indent=2, sort_keys=True)
+        print("saved baseline to " + args.baseline)
+
+    failures = [result["label"] for result in results if not result["passed"]]
+    if failures:
+        print("simulators disagreeing with the exact odds: " + ", ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
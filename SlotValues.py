@@ -0,0 +1,186 @@
+"""
+Slot normalization for the Game Helper skill, shared by DiceLogic and RiskLogic
+
+Every value a slot is likely to hold (digits, spoken numbers like "twenty one" or "a dozen", die
+names like "d twenty", and synonyms such as "defending with") is mapped to its normalized form in
+lookup tables built once at import, so reading a slot is a single dictionary hit. Values that
+aren't in the tables (very large numbers, odd spacing or capitals) fall back to a slower parse.
+"""
+from types import MappingProxyType
+
+# defining a set of variables that we can use to internally specify our error types
+INPUT_NOT_NUMBER = "INPUT_NOT_NUMBER"
+NO_INPUT = "NO_INPUT"
+
+# normalized values of the ATTACKER_OR_DEFENDER and MODIFIER_TYPE slots
+ATTACKERS = "attackers"
+DEFENDERS = "defenders"
+ADD = 1
+SUBTRACT = -1
+
+# numbers up to this are indexed directly, larger ones are parsed when they come up
+MAX_INDEXED_NUMBER = 1000
+# dice with up to this many sides are also indexed by name ("d twenty")
+MAX_INDEXED_SIDES = 100
+
+UNIT_WORDS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+              "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen",
+              "eighteen", "nineteen"]
+TENS_WORDS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+
+# spoken amounts that aren't plain numbers
+NUMBER_SYNONYMS = {
+    "a": 1, "an": 1, "a single": 1, "single": 1,
+    "a couple": 2, "couple": 2, "a pair": 2, "pair": 2,
+    "half a dozen": 6, "a half dozen": 6,
+    "a dozen": 12, "dozen": 12,
+    "a score": 20, "score": 20,
+    "a hundred": 100, "one hundred": 100, "hundred": 100,
+    "a thousand": 1000, "one thousand": 1000, "thousand": 1000
+}
+
+PARTY_SYNONYMS = {
+    ATTACKERS: ["attacker", "attackers", "attacking", "attack", "attacking with", "attacker armies",
+                "attacking armies", "invaders", "invading"],
+    DEFENDERS: ["defender", "defenders", "defending", "defend", "defending with", "defender armies",
+                "defending armies", "defense", "defence"]
+}
+
+MODIFIER_SYNONYMS = {
+    ADD: ["plus", "add", "adding", "and", "with", "plus a"],
+    SUBTRACT: ["minus", "subtract", "sub", "subtracting", "less", "take away", "minus a"]
+}
+
+def spell_number(num):
+    """
+    Returns the spoken form of a number below 100 ("forty two")
+    """
+    if num < 20:
+        return UNIT_WORDS[num]
+    if num % 10 == 0:
+        return TENS_WORDS[num // 10]
+    return TENS_WORDS[num // 10] + " " + UNIT_WORDS[num % 10]
+
+def build_number_index():
+    """
+    Returns a dictionary of every indexed way of saying a number -> the number
+    """
+    index = {}
+    for num in range(MAX_INDEXED_NUMBER + 1):
+        index[str(num)] = num
+    for num in range(100):
+        spoken = spell_number(num)
+        index[spoken] = num
+        index[spoken.replace(" ", "-")] = num
+    index.update(NUMBER_SYNONYMS)
+    return index
+
+def build_die_sides_index(number_index):
+    """
+    Returns the number index plus die names ("d20", "d 20", "d twenty", "twenty sided")
+    """
+    index = dict(number_index)
+    for spoken, num in number_index.items():
+        if num > MAX_INDEXED_SIDES:
+            continue
+        index["d" + spoken] = num
+        index["d " + spoken] = num
+        index[spoken + " sided"] = num
+    return index
+
+def build_synonym_index(synonyms):
+    """
+    Turns a dictionary of normalized value -> [ways of saying it] around into a lookup table
+    """
+    return dict((spoken, value) for value, spoken_list in synonyms.items() for spoken in spoken_list)
+
+NUMBER_INDEX = MappingProxyType(build_number_index())
+DIE_SIDES_INDEX = MappingProxyType(build_die_sides_index(NUMBER_INDEX))
+PARTY_INDEX = MappingProxyType(build_synonym_index(PARTY_SYNONYMS))
+MODIFIER_INDEX = MappingProxyType(build_synonym_index(MODIFIER_SYNONYMS))
+
+# the index each slot type in _IntentSchema.txt is read with (AMAZON.LITERAL, RULE_SET,
+# GAME_SYSTEM and UNIT_TYPE slots are passed through as spoken, since their own parsers handle them)
+TYPE_INDEXES = {
+    "AMAZON.NUMBER": NUMBER_INDEX,
+    "ATTACKER_OR_DEFENDER": PARTY_INDEX,
+    "MODIFIER_TYPE": MODIFIER_INDEX
+}
+
+# the type of every slot in _IntentSchema.txt
+SLOT_TYPES = {
+    "numDice": "AMAZON.NUMBER",
+    "numSides": "AMAZON.NUMBER",
+    "adding": "MODIFIER_TYPE",
+    "modifier": "AMAZON.NUMBER",
+    "target": "AMAZON.NUMBER",
+    "numRolls": "AMAZON.NUMBER",
+    "expression": "AMAZON.LITERAL",
+    "partyOneType": "ATTACKER_OR_DEFENDER",
+    "numPartyOne": "AMAZON.NUMBER",
+    "partyTwoType": "ATTACKER_OR_DEFENDER",
+    "numPartyTwo": "AMAZON.NUMBER",
+    "numAttackers": "AMAZON.NUMBER",
+    "defendersOne": "AMAZON.NUMBER",
+    "defendersTwo": "AMAZON.NUMBER",
+    "defendersThree": "AMAZON.NUMBER",
+    "defendersFour": "AMAZON.NUMBER",
+    "ruleSet": "RULE_SET",
+    "numRounds": "AMAZON.NUMBER",
+    "numArmies": "AMAZON.NUMBER",
+    "territoryWorth": "AMAZON.NUMBER",
+    "armyType": "ATTACKER_OR_DEFENDER",
+    "numSuccesses": "AMAZON.NUMBER",
+    "opposingDice": "AMAZON.NUMBER",
+    "gameSystem": "GAME_SYSTEM",
+    "numAttackUnits": "AMAZON.NUMBER",
+    "attackUnitType": "UNIT_TYPE",
+    "numAttackUnitsTwo": "AMAZON.NUMBER",
+    "attackUnitTypeTwo": "UNIT_TYPE",
+    "numDefendUnits": "AMAZON.NUMBER",
+    "defendUnitType": "UNIT_TYPE",
+    "numDefendUnitsTwo": "AMAZON.NUMBER",
+    "defendUnitTypeTwo": "UNIT_TYPE"
+}
+
+# the index each slot is read with (the number of sides also accepts die names)
+SLOT_INDEXES = MappingProxyType(dict(
+    [(name, TYPE_INDEXES[slot_type]) for name, slot_type in SLOT_TYPES.items() if slot_type in TYPE_INDEXES] +
+    [("numSides", DIE_SIDES_INDEX)]))
+
+def resolve_slot(slots, name):
+    """
+    Returns the normalized value of the named slot from an intent's slots:
+        numbers as ints (INPUT_NOT_NUMBER if the value isn't one), ATTACKERS / DEFENDERS for
+        attacker or defender slots, ADD / SUBTRACT for modifier types, and other slots as spoken
+    returns NO_INPUT if the slot is missing or empty ("?" is what Alexa passes if there is no input)
+    """
+    slot = slots.get(name)
+    if slot is None:
+        return NO_INPUT
+    value = slot.get("value")
+    if value is None or value == "?":
+        return NO_INPUT
+    index = SLOT_INDEXES.get(name)
+    if index is None:
+        return value
+    if value in index:
+        return index[value]
+    return resolve_unindexed(index, value)
+
+def resolve_unindexed(index, value):
+    """
+    Slow path for values that aren't in the index as spoken: tidies the case and spacing and
+    tries again, then parses numbers too large to be indexed
+    """
+    cleaned = " ".join(value.lower().split())
+    if cleaned in index:
+        return index[cleaned]
+    if index is DIE_SIDES_INDEX and cleaned.startswith("d"):
+        cleaned = cleaned[1:].strip()
+    if index is NUMBER_INDEX or index is DIE_SIDES_INDEX:
+        try:
+            return int(cleaned)
+        except ValueError:
+            return INPUT_NOT_NUMBER
+    return cleaned
@@ -4,6 +4,10 @@ AWS Alexa speech helper functions
 Developed by Zac Patel on 1/10/17
 
 Created using template: Alexa Skills Blueprint for Python 2.7
+
+Responses that never change (welcome, help, goodbye, errors) are built once with
+build_static_response and handed out as-is, and responses that are filled in per request come from
+a ResponseTemplate, which keeps everything but the output text prebuilt.
 """
 # reading the version from the main file so it is easier to update
 #from GameHelperMain import VERSION
@@ -45,4 +49,61 @@ def build_response(session_attributes, speechlet_response):
         'response': speechlet_response
     }
 
+def build_static_response(title, output, reprompt_text, should_end_session):
+    """
+    Builds a response whose content never changes, meant to be built once (at import, or cached)
+    and returned for every request that needs it
+    note: the same dictionary is handed out every time, so it must never be modified
+    """
+    # collapsing the indentation and line breaks of triple quoted text, so it isn't sent every time
+    output = " ".join(output.split())
+    return build_response({}, build_speechlet_response(title, output, reprompt_text, should_end_session))
+
+class ResponseTemplate(object):
+    """
+    A response with a fixed card title, reprompt and end of session flag, where only the output
+    (and session attributes) change from request to request. The fixed parts are built once and
+    shared by every response rendered from the template.
+    if ssml is True the output is read out as SSML (so it may use pauses, emphasis, ...) while the
+    card shows the plain text
+    """
+    def __init__(self, title, reprompt_text, should_end_session, ssml=False):
+        self.title = title
+        self.ssml = ssml
+        self.should_end_session = should_end_session
+        self.reprompt = {
+            'outputSpeech': {
+                'type': 'PlainText',
+                'text': reprompt_text
+            }
+        }
+
+    def render(self, session_attributes, output, card_output=None):
+        """
+        Returns the finished response for output (card_output replaces it on the card if given)
+        """
+        if self.ssml:
+            speech = {'type': 'SSML', 'ssml': "<speak>" + output + "</speak>"}
+        else:
+            speech = {'type': 'PlainText', 'text': output}
+        return {
+            'version': '1.0',
+            'sessionAttributes': session_attributes,
+            'response': {
+                'outputSpeech': speech,
+                'card': {
+                    'type': 'Simple',
+                    'title': self.title,
+                    'content': output if card_output is None else card_output
+                },
+                'reprompt': self.reprompt,
+                'shouldEndSession': self.should_end_session
+            }
+        }
 
+def to_ssml(text):
+    """
+    Escapes plain text so it can be placed inside an SSML response
+    (done by hand, since xml.sax.saxutils pulls in urllib and slows down a cold start)
+    """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
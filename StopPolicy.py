@@ -0,0 +1,144 @@
+"""
+Optimal stop-attacking policy for the Risk Simulating Aspect of Game Helper
+
+At any point in a battle the attacker can keep rolling or call the attack off and keep the armies
+they have left. Given how much a surviving army is worth compared to taking the territory, value
+iteration over the (attackers, defenders) grid finds the choice with the best expected value in
+every state. Each round leads to a state with fewer armies, so one sweep up the grid in the same
+order as BattleOdds.extend_table is already the converged solution.
+"""
+from functools import lru_cache
+
+from BattleOdds import get_state_outcomes
+
+# importing the rule variants a battle can be fought under
+from BattleRules import CLASSIC_RULES
+
+# largest army (on either side) the solver will answer for, since each army value needs its own grid
+MAX_POLICY_ARMIES = 300
+
+# most solved grids (one per army value and rule variant) kept at once, least recently used first out
+MAX_POLICY_GRIDS = 4
+
+def find_default_territory_worth(num_attackers, num_defenders):
+    """
+    Returns how many armies taking a territory is taken to be worth when the player doesn't say:
+    as many as are fighting over it, rounded up to a power of two so that battles of a similar
+    size share a grid (a fixed worth would call every large battle not worth fighting)
+    """
+    territory_worth = 1
+    while territory_worth < num_attackers + num_defenders:
+        territory_worth *= 2
+    return territory_worth
+
+def find_army_value(territory_worth):
+    """
+    Returns the worth of one surviving attacker, as a fraction of the worth of taking the
+    territory, when taking it is worth territory_worth armies to the player
+    """
+    return 1.0 / territory_worth
+
+def stop_value(num_attackers, num_defenders, army_value):
+    """
+    Returns the utility of the battle ending at (num_attackers, num_defenders): every surviving
+    army is worth army_value, and taking the territory (no defenders left) is worth 1
+    """
+    return (1.0 if num_defenders == 0 else 0.0) + army_value * num_attackers
+
+@lru_cache(maxsize=MAX_POLICY_GRIDS)
+def get_cached_grid(army_value, rules=CLASSIC_RULES):
+    """
+    Returns the grid kept for army_value under rules (started with only the empty battle, and
+    grown in place as larger battles are requested)
+    each grid holds tables indexed [a][d] (attackers including the one left behind, defenders):
+        value - expected utility of playing the best policy from (a, d)
+        attack - whether the best policy rolls again at (a, d)
+        stop_at - most attackers, a or fewer, at which the policy calls the attack off against d
+                  defenders (0 if it never does)
+        win - chance of taking the territory when following the policy from (a, d)
+        armies - expected attackers left when the policy finishes (by winning, losing or stopping)
+    """
+    return {
+        "value": [[stop_value(0, 0, army_value)]],
+        "attack": [[False]],
+        "stop_at": [[0]],
+        "win": [[1.0]],
+        "armies": [[0.0]]
+    }
+
+def get_policy_grid(max_attackers, max_defenders, army_value, rules=CLASSIC_RULES):
+    """
+    Returns the solved grid for army_value under rules, grown so that it covers every state up to
+    (max_attackers, max_defenders)
+    """
+    grid = get_cached_grid(army_value, rules)
+    extend_policy_grid(grid, max_attackers, max_defenders, army_value, rules)
+    return grid
+
+def extend_policy_grid(grid, max_attackers, max_defenders, army_value, rules=CLASSIC_RULES):
+    """
+    Grows every table of grid to cover the states up to (max_attackers, max_defenders)
+    A state is attacked from only if the expected value of rolling beats stopping where it is
+    (ties keep attacking, so with army_value 0 the policy is to always fight on)
+    """
+    value_table, attack_table, stop_table = grid["value"], grid["attack"], grid["stop_at"]
+    win_table, armies_table = grid["win"], grid["armies"]
+    old_attackers = len(value_table) - 1
+    old_defenders = len(value_table[0]) - 1
+    max_attackers = max(max_attackers, old_attackers)
+    max_defenders = max(max_defenders, old_defenders)
+    if max_attackers == old_attackers and max_defenders == old_defenders:
+        return
+
+    for num_attackers in range(max_attackers + 1):
+        if num_attackers > old_attackers:
+            # a battle with no defenders left is already won
+            value_table.append([stop_value(num_attackers, 0, army_value)])
+            attack_table.append([False])
+            stop_table.append([num_attackers])
+            win_table.append([1.0])
+            armies_table.append([float(num_attackers)])
+        for num_defenders in range(len(value_table[num_attackers]), max_defenders + 1):
+            stop = stop_value(num_attackers, num_defenders, army_value)
+            attack_value, win, armies = stop, 0.0, float(num_attackers)
+            if num_attackers > 1:
+                attack_value, win, armies = 0.0, 0.0, 0.0
+                for attacker_losses, defender_losses, round_prob in \
+                        get_state_outcomes(num_attackers, num_defenders, rules):
+                    next_attackers = num_attackers - attacker_losses
+                    next_defenders = num_defenders - defender_losses
+                    attack_value += round_prob * value_table[next_attackers][next_defenders]
+                    win += round_prob * win_table[next_attackers][next_defenders]
+                    armies += round_prob * armies_table[next_attackers][next_defenders]
+
+            attack = num_attackers > 1 and attack_value >= stop
+            value_table[num_attackers].append(attack_value if attack else stop)
+            attack_table[num_attackers].append(attack)
+            # rows are filled in increasing order of attackers, so the row below already knows
+            # where the policy stops among the smaller armies
+            if attack:
+                stop_table[num_attackers].append(stop_table[num_attackers - 1][num_defenders])
+            else:
+                stop_table[num_attackers].append(num_attackers)
+            win_table[num_attackers].append(win if attack else 0.0)
+            armies_table[num_attackers].append(armies if attack else float(num_attackers))
+
+def find_stop_policy(num_attackers, num_defenders, army_value, rules=CLASSIC_RULES):
+    """
+    Returns a dictionary describing the best policy from (num_attackers, num_defenders):
+        attack - whether to roll (again) right now
+        stop_at - most attackers at which the policy calls the attack off while num_defenders
+                  remain (0 if it never does)
+        win_probability - chance of taking the territory following the policy
+        expected_attackers - average attackers left when the policy finishes
+        expected_value - expected utility of following the policy
+    Once the grid covers the battle, this is only a handful of table lookups
+    """
+    grid = get_policy_grid(num_attackers, num_defenders, army_value, rules)
+    return {
+        "attack": grid["attack"][num_attackers][num_defenders],
+        "stop_at": grid["stop_at"][num_attackers][num_defenders],
+        "win_probability": grid["win"][num_attackers][num_defenders],
+        "expected_attackers": grid["armies"][num_attackers][num_defenders],
+        "expected_value": grid["value"][num_attackers][num_defenders]
+    }